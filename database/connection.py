@@ -0,0 +1,356 @@
+"""
+Gestione delle connessioni SQLite.
+Applica i PRAGMA di tuning da un profilo di configurazione e fornisce
+una connessione dedicata per ogni thread.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterable, List, Optional, Iterator
+from database.events import DataChange, DataChangeBus
+
+
+# Profili PRAGMA selezionabili (variabile d'ambiente GESTIONALE_DB_PROFILE)
+PRAGMA_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Uso normale: WAL permette letture concorrenti durante le scritture
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,       # Valori negativi = KiB (circa 16 MB)
+        'mmap_size': 134217728,     # 128 MB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,       # Millisecondi di attesa su lock
+    },
+    # Massima durabilità (fsync ad ogni commit)
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 10000,
+    },
+    # PC con poca memoria
+    'low_memory': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'FILE',
+        'busy_timeout': 5000,
+    },
+}
+
+DEFAULT_PROFILE = 'default'
+
+
+def get_profile(name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Restituisce i PRAGMA del profilo richiesto.
+    
+    Args:
+        name: Nome del profilo (default: variabile d'ambiente o 'default')
+    
+    Returns:
+        Dizionario PRAGMA -> valore
+    """
+    if name is None:
+        name = os.getenv('GESTIONALE_DB_PROFILE', DEFAULT_PROFILE)
+    
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Profilo database sconosciuto: {name}")
+    
+    return dict(PRAGMA_PROFILES[name])
+
+
+class ManagedConnection(sqlite3.Connection):
+    """
+    Connessione SQLite con supporto unit-of-work.
+    
+    Dentro un blocco transaction() i repository non eseguono commit: tutte
+    le scritture vengono confermate (o annullate) insieme all'uscita del
+    blocco più esterno. I blocchi annidati usano i SAVEPOINT.
+    
+    Le modifiche segnalate con notify_change vengono pubblicate sul bus
+    solo dopo il commit (e scartate in caso di rollback).
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transaction_depth = 0
+        self.change_bus: Optional[DataChangeBus] = None
+        self.commit_hook: Optional[Callable[[Callable[[], None]], None]] = None  # Esegue il commit
+        self._pending_changes: Dict[str, Optional[set]] = {}
+    
+    @property
+    def in_unit_of_work(self) -> bool:
+        """True se è attivo almeno un blocco transaction()"""
+        return self.transaction_depth > 0
+    
+    def commit(self):
+        """Conferma la transazione (tramite il gestore delle connessioni, se presente)"""
+        if self.commit_hook is None or not self.in_transaction:
+            super().commit()
+        else:
+            self.commit_hook(super().commit)
+    
+    @contextmanager
+    def transaction(self) -> Iterator['ManagedConnection']:
+        """
+        Apre una transazione (o un savepoint se già in una transazione).
+        
+        Esempio:
+            with db.transaction():
+                sales_repo.create(...)
+                purchases_repo.create(...)
+        
+        In caso di eccezione le modifiche del blocco vengono annullate e
+        l'eccezione viene propagata.
+        """
+        savepoint = None
+        
+        if self.transaction_depth == 0:
+            # Conferma eventuali scritture implicite rimaste in sospeso
+            if self.in_transaction:
+                self.commit()
+            self.execute("BEGIN IMMEDIATE")
+        else:
+            savepoint = f"uow_{self.transaction_depth}"
+            self.execute(f"SAVEPOINT {savepoint}")
+        
+        self.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.transaction_depth -= 1
+            if savepoint is None:
+                self.rollback()
+                self._pending_changes.clear()
+            else:
+                # Le modifiche segnalate restano in attesa: al più un aggiornamento in più
+                self.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                self.execute(f"RELEASE SAVEPOINT {savepoint}")
+            raise
+        else:
+            self.transaction_depth -= 1
+            if savepoint is None:
+                self.commit()
+                self._publish_changes()
+            else:
+                self.execute(f"RELEASE SAVEPOINT {savepoint}")
+    
+    def notify_change(self, table: str, dates: Optional[Iterable[str]] = None):
+        """
+        Segnala una modifica a una tabella.
+        
+        Args:
+            table: Tabella modificata
+            dates: Date (YYYY-MM-DD) toccate; None se non note
+        """
+        if self.change_bus is None:
+            return
+        
+        if dates is not None:
+            dates = {date for date in dates if date}
+        
+        if table not in self._pending_changes:
+            self._pending_changes[table] = dates
+        elif self._pending_changes[table] is not None:
+            if dates is None:
+                self._pending_changes[table] = None
+            else:
+                self._pending_changes[table] |= dates
+        
+        if not self.in_unit_of_work:
+            self._publish_changes()
+    
+    def _publish_changes(self):
+        """Pubblica sul bus le modifiche confermate"""
+        if not self._pending_changes or self.change_bus is None:
+            return
+        
+        changes = []
+        for table, dates in self._pending_changes.items():
+            if dates is None:
+                changes.append(DataChange(table))
+            elif dates:
+                changes.append(DataChange(table, min(dates), max(dates)))
+        self._pending_changes = {}
+        
+        self.change_bus.publish(changes)
+
+
+class ConnectionManager:
+    """Crea e tiene traccia delle connessioni SQLite, una per thread"""
+    
+    def __init__(self, db_path: str, profile: Optional[str] = None):
+        """
+        Inizializza il gestore delle connessioni.
+        
+        Args:
+            db_path: Percorso del file database SQLite
+            profile: Nome del profilo PRAGMA da applicare
+        """
+        self.db_path = db_path
+        self.pragmas = get_profile(profile)
+        
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._shared: Optional[sqlite3.Connection] = None
+    
+        # Connessione usata solo per PRAGMA data_version (vedi poll_data_version)
+        self._version_lock = threading.Lock()
+        self._version_connection: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._external_pending = False
+        
+        # Modifiche ai dati fatte da qualunque connessione di questo gestore
+        self.change_bus = DataChangeBus()
+    
+    @property
+    def is_memory(self) -> bool:
+        """True se il database è in memoria (non condivisibile tra connessioni)"""
+        return self.db_path == ':memory:' or self.db_path == ''
+    
+    def open_connection(self) -> sqlite3.Connection:
+        """
+        Apre una nuova connessione configurata.
+        
+        La connessione non è legata al thread chiamante: è responsabilità
+        del chiamante usarla da un solo thread alla volta e chiuderla.
+        """
+        connection = sqlite3.connect(
+            self.db_path,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000.0,
+            check_same_thread=False,
+            factory=ManagedConnection
+        )
+        connection.row_factory = sqlite3.Row  # Permette accesso per nome colonna
+        connection.change_bus = self.change_bus
+        connection.commit_hook = self._commit_local
+        self._apply_pragmas(connection)
+        
+        with self._lock:
+            self._connections.append(connection)
+        
+        return connection
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        Restituisce la connessione del thread corrente, creandola se necessario.
+        
+        Per i database in memoria tutti i thread condividono la stessa connessione.
+        """
+        if self.is_memory:
+            with self._lock:
+                shared = self._shared
+            if shared is None:
+                shared = self.open_connection()
+                with self._lock:
+                    self._shared = shared
+            return shared
+        
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.open_connection()
+            self._local.connection = connection
+        return connection
+    
+    def close_thread_connection(self):
+        """Chiude la connessione del thread corrente (se presente)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            self._forget(connection)
+            connection.close()
+    
+    def poll_data_version(self) -> bool:
+        """
+        Verifica se altri processi hanno scritto nel database.
+        
+        PRAGMA data_version cambia solo per i commit di connessioni diverse
+        da quella che lo legge: viene letto sempre sulla stessa connessione
+        dedicata, qui e attorno a ogni commit delle connessioni di questo
+        gestore (vedi _commit_local). Le scritture esterne vengono quindi
+        riconosciute anche se nel frattempo questo processo ha scritto.
+        
+        Returns:
+            True se dall'ultima chiamata ci sono stati commit esterni
+        """
+        if self.is_memory:
+            return False  # Il database in memoria non è visibile ad altri processi
+        
+        with self._version_lock:
+            previous = self._data_version
+            self._data_version = self._read_data_version()
+            external = self._external_pending or (previous is not None and self._data_version != previous)
+            self._external_pending = False
+            return external
+    
+    def _commit_local(self, commit: Callable[[], None]):
+        """
+        Esegue il commit di una connessione di questo gestore.
+        
+        Prima del commit la connessione ha ancora il lock di scrittura:
+        una differenza di data_version a quel punto può venire solo da
+        un commit esterno. Dopo il commit la versione viene riletta, così
+        il commit locale non viene scambiato per una scrittura esterna
+        (resta scoperto solo l'istante tra il commit e la rilettura).
+        """
+        if self.is_memory:
+            commit()
+            return
+        
+        with self._version_lock:
+            if self._data_version is None:
+                commit()  # Nessun controllo attivo
+                return
+            
+            if self._read_data_version() != self._data_version:
+                self._external_pending = True
+            commit()
+            self._data_version = self._read_data_version()
+    
+    def _read_data_version(self) -> int:
+        """Legge PRAGMA data_version sulla connessione dedicata (con _version_lock)"""
+        if self._version_connection is None:
+            self._version_connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._version_connection.execute("PRAGMA data_version").fetchone()[0]
+    
+    def close_all(self):
+        """Chiude tutte le connessioni aperte da questo gestore"""
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+            self._shared = None
+        
+        with self._version_lock:
+            if self._version_connection is not None:
+                connections.append(self._version_connection)
+            self._version_connection = None
+            self._data_version = None
+            self._external_pending = False
+        
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        
+        self._local = threading.local()
+    
+    def _forget(self, connection: sqlite3.Connection):
+        """Rimuove una connessione dall'elenco di quelle tracciate"""
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+    
+    def _apply_pragmas(self, connection: sqlite3.Connection):
+        """Applica i PRAGMA del profilo a una connessione"""
+        cursor = connection.cursor()
+        for pragma, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
@@ -0,0 +1,80 @@
+"""
+Notifica delle modifiche ai dati.
+I repository segnalano quali tabelle e date hanno modificato; le modifiche
+vengono pubblicate sul bus dopo il commit, così le viste possono
+aggiornare solo ciò che è cambiato invece di interrogare periodicamente.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+
+@dataclass(frozen=True)
+class DataChange:
+    """Modifica a una tabella in un intervallo di date (None = intervallo non noto)"""
+    
+    table: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    
+    def affects(self, tables: Iterable[str], start_date: Optional[str] = None,
+                end_date: Optional[str] = None) -> bool:
+        """
+        Verifica se la modifica riguarda una delle tabelle in un periodo.
+        
+        Args:
+            tables: Tabelle di interesse
+            start_date: Inizio del periodo (YYYY-MM-DD, None = senza limite)
+            end_date: Fine del periodo (YYYY-MM-DD, None = senza limite)
+        """
+        if self.table not in tables:
+            return False
+        if self.start_date is None:
+            return True
+        if end_date is not None and self.start_date > end_date:
+            return False
+        if start_date is not None and self.end_date < start_date:
+            return False
+        return True
+
+
+Subscriber = Callable[[List[DataChange]], None]
+
+
+class DataChangeBus:
+    """
+    Distribuisce le modifiche ai sottoscrittori.
+    
+    I sottoscrittori vengono chiamati nel thread che ha eseguito il commit:
+    le viste Qt devono inoltrare la notifica al thread GUI (es. con un segnale).
+    """
+    
+    def __init__(self):
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+    
+    def subscribe(self, callback: Subscriber):
+        """Registra una funzione chiamata con la lista delle modifiche di ogni commit"""
+        with self._lock:
+            self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback: Subscriber):
+        """Rimuove un sottoscrittore"""
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+    
+    def publish(self, changes: List[DataChange]):
+        """Notifica le modifiche a tutti i sottoscrittori"""
+        if not changes:
+            return
+        
+        with self._lock:
+            subscribers = list(self._subscribers)
+        
+        for callback in subscribers:
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"Errore notifica modifiche dati: {e}")
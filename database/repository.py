@@ -3,27 +3,280 @@ Repository pattern per accesso ai dati.
 Fornisce metodi CRUD per tutte le entità del database.
 """
 
+from collections import namedtuple
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from functools import lru_cache
+from itertools import groupby
+from typing import List, Optional, Dict, Any, FrozenSet, Iterable, Iterator, Tuple
+import re
 import sqlite3
+from database.schema import (
+    MONEY_COLUMNS, ROLLUP_MONEY_COLUMNS,
+    rebuild_invoices_fts, refresh_rollups, rebuild_rollups
+)
+from models.money import to_cents
+
+
+@lru_cache(maxsize=64)
+def row_type(columns: Tuple[str, ...]):
+    """
+    Restituisce (dalla cache) una namedtuple per le colonne di una query.
+    
+    Le righe sono tuple leggere (accesso per nome o per indice) e il tipo
+    viene creato una sola volta per ogni insieme di colonne.
+    """
+    return namedtuple('Row', columns, rename=True)
 
 
 class BaseRepository:
     """Classe base per i repository"""
     
+    # Tabella gestita e chiave di default per gli upsert (definite dalle sottoclassi)
+    table: str = ''
+    upsert_key: str = 'id'
+    has_updated_at: bool = True
+    
+    # Colonne che identificano i totali precalcolati (date, fornitore) toccati da una riga
+    rollup_columns: Tuple[str, ...] = ()
+    
+    # Colonne salvate in centesimi: i dizionari in ingresso e in uscita usano euro
+    money_columns: FrozenSet[str] = frozenset()
+    
+    # Cache delle istruzioni INSERT per (tabella, colonne, chiave conflitto)
+    _statement_cache: Dict[Tuple, str] = {}
+    
+    # Righe lette dal database per ogni fetchmany dei metodi iter_*
+    FETCH_BATCH_SIZE: int = 500
+    
     def __init__(self, connection: sqlite3.Connection):
         self.connection = connection
     
+    def transaction(self):
+        """Apre una unit-of-work sulla connessione del repository"""
+        return self.connection.transaction()
+    
+    def _commit(self):
+        """Esegue il commit, a meno che non sia attiva una unit-of-work"""
+        if not getattr(self.connection, 'in_unit_of_work', False):
+            self.connection.commit()
+    
+    def _notify_change(self, dates: Optional[Iterable[str]] = None):
+        """
+        Segnala la modifica della tabella (pubblicata dopo il commit).
+        
+        Args:
+            dates: Date toccate; None se non note o se la tabella non ha date
+        """
+        notify_change = getattr(self.connection, 'notify_change', None)
+        if notify_change is not None:
+            notify_change(self.table, dates)
+    
+    def _dates_for_id(self, row_id: int) -> List[str]:
+        """Date della riga con l'id indicato (prima di modificarla o eliminarla)"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"SELECT date FROM {self.table} WHERE id = ?", (row_id,))
+        return [row[0] for row in cursor.fetchall()]
+    
+    def _insert_statement(self, columns: Tuple[str, ...],
+                          conflict_key: Optional[str] = None) -> str:
+        """
+        Restituisce (dalla cache) l'INSERT per un insieme di colonne.
+        
+        Args:
+            columns: Colonne da inserire, nell'ordine dei valori
+            conflict_key: Se indicata, genera un upsert ON CONFLICT(conflict_key)
+        """
+        cache_key = (self.table, columns, conflict_key)
+        query = self._statement_cache.get(cache_key)
+        if query is not None:
+            return query
+        
+        fields = ', '.join(columns)
+        placeholders = ', '.join(['?'] * len(columns))
+        query = f"INSERT INTO {self.table} ({fields}) VALUES ({placeholders})"
+        
+        if conflict_key is not None:
+            updates = [f"{col} = excluded.{col}" for col in columns if col != conflict_key]
+            if self.has_updated_at and 'updated_at' not in columns:
+                updates.append("updated_at = CURRENT_TIMESTAMP")
+            if updates:
+                query += f" ON CONFLICT({conflict_key}) DO UPDATE SET {', '.join(updates)}"
+            else:
+                query += f" ON CONFLICT({conflict_key}) DO NOTHING"
+        
+        self._statement_cache[cache_key] = query
+        return query
+    
+    def _execute_bulk(self, rows: Iterable[Dict[str, Any]],
+                      conflict_key: Optional[str] = None) -> int:
+        """
+        Scrive le righe con executemany, un'istruzione per ogni gruppo
+        consecutivo di righe con le stesse colonne (l'ordine è preservato).
+        """
+        rows = [self._to_storage(row) for row in rows]
+        cursor = self.connection.cursor()
+        count = 0
+        
+        with self.transaction():
+            if self.rollup_columns:
+                # Trigger dei totali sospesi: ricalcolo unico alla fine
+                affected = self._rollup_keys(rows, conflict_key, include_rows=False)
+                cursor.execute("UPDATE rollup_state SET suspended = 1")
+            
+            for columns, group in groupby(rows, key=lambda row: tuple(row.keys())):
+                values = [tuple(row.values()) for row in group]
+                cursor.executemany(self._insert_statement(columns, conflict_key), values)
+                count += len(values)
+        
+            if self.rollup_columns:
+                cursor.execute("UPDATE rollup_state SET suspended = 0")
+                affected |= self._rollup_keys(rows, conflict_key)
+                self._refresh_rollups(affected)
+                dates = {key[0] for key in affected}
+            else:
+                dates = {row.get('date') for row in rows} - {None}
+            
+            if count:
+                self._notify_change(dates or None)
+        
+        return count
+    
+    def _rollup_keys(self, rows: List[Dict[str, Any]], conflict_key: Optional[str],
+                     include_rows: bool = True) -> set:
+        """
+        Raccoglie le chiavi dei totali (rollup_columns) toccate dalle righe:
+        quelle presenti nelle righe e, per gli upsert, quelle delle righe
+        già esistenti nel database con la stessa chiave di conflitto.
+        """
+        keys = set()
+        
+        if include_rows:
+            keys.update(tuple(row.get(col) for col in self.rollup_columns) for row in rows)
+        
+        if conflict_key is not None:
+            cursor = self.connection.cursor()
+            fields = ', '.join(self.rollup_columns)
+            values = [row[conflict_key] for row in rows if row.get(conflict_key) is not None]
+            
+            for start in range(0, len(values), 500):
+                chunk = values[start:start + 500]
+                placeholders = ', '.join(['?'] * len(chunk))
+                cursor.execute(
+                    f"SELECT {fields} FROM {self.table} WHERE {conflict_key} IN ({placeholders})",
+                    chunk
+                )
+                keys.update(tuple(row) for row in cursor.fetchall())
+        
+        return keys
+    
+    def _refresh_rollups(self, keys: set):
+        """Ricalcola i totali precalcolati per le chiavi (data[, fornitore]) indicate"""
+        dates = [key[0] for key in keys]
+        supplier_months = []
+        if len(self.rollup_columns) > 1:
+            supplier_months = [(key[0][:7], key[1]) for key in keys if key[0]]
+        refresh_rollups(self.connection, dates, supplier_months)
+    
+    def bulk_create(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Inserisce molte righe in un'unica transazione.
+        
+        Args:
+            rows: Dizionari colonna -> valore (come per create)
+        
+        Returns:
+            Numero di righe inserite
+        """
+        return self._execute_bulk(rows)
+    
+    def bulk_upsert(self, rows: Iterable[Dict[str, Any]],
+                    conflict_key: Optional[str] = None) -> int:
+        """
+        Inserisce o aggiorna molte righe in un'unica transazione.
+        
+        Args:
+            rows: Dizionari colonna -> valore
+            conflict_key: Colonna con vincolo UNIQUE (default: upsert_key del repository)
+        
+        Returns:
+            Numero di righe elaborate
+        """
+        return self._execute_bulk(rows, conflict_key or self.upsert_key)
+    
+    @staticmethod
+    def _encode_page_token(row: Dict[str, Any]) -> str:
+        """Crea il token di continuazione dall'ultima riga di una pagina (data, id)"""
+        return f"{row['date']}|{row['id']}"
+    
+    @staticmethod
+    def _decode_page_token(token: str) -> Tuple[str, int]:
+        """Estrae (data, id) da un token di continuazione"""
+        date, _, row_id = token.rpartition('|')
+        if not date or not row_id.isdigit():
+            raise ValueError(f"Token di paginazione non valido: {token!r}")
+        return date, int(row_id)
+    
+    def _page_result(self, rows: List[sqlite3.Row], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Converte le righe di una pagina e calcola il token successivo.
+        
+        La query deve chiedere limit + 1 righe: la riga in più indica
+        soltanto che esiste una pagina successiva.
+        """
+        items = [self._dict_from_row(row) for row in rows[:limit]]
+        next_token = self._encode_page_token(items[-1]) if len(rows) > limit else None
+        return items, next_token
+    
     def _dict_from_row(self, row: sqlite3.Row) -> Dict[str, Any]:
-        """Converte una Row in dizionario"""
+        """Converte una Row in dizionario (importi da centesimi a euro)"""
         if row is None:
             return None
-        return {key: row[key] for key in row.keys()}
+        data = {key: row[key] for key in row.keys()}
+        for key in self.money_columns.intersection(data):
+            if data[key] is not None:
+                data[key] = data[key] / 100
+        return data
+    
+    def _to_storage(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Prepara un dizionario per la scrittura (importi da euro a centesimi)"""
+        if not self.money_columns.intersection(data):
+            return data
+        return {
+            key: to_cents(value) if key in self.money_columns and value is not None else value
+            for key, value in data.items()
+        }
+
+    def _iter_query(self, query: str, params: Iterable[Any] = ()) -> Iterator[tuple]:
+        """
+        Esegue una query e restituisce le righe una alla volta.
+        
+        Le righe sono lette a blocchi di FETCH_BATCH_SIZE con fetchmany e
+        restituite come namedtuple (vedi row_type): la memoria usata non
+        dipende dal numero di righe del risultato. I valori sono quelli del
+        database, quindi gli importi restano in centesimi (interi esatti).
+        """
+        cursor = self.connection.cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(query, tuple(params))
+            make_row = row_type(tuple(column[0] for column in cursor.description))._make
+            while True:
+                batch = cursor.fetchmany(self.FETCH_BATCH_SIZE)
+                if not batch:
+                    break
+                yield from map(make_row, batch)
+        finally:
+            cursor.close()
 
 
 class SalesRepository(BaseRepository):
     """Repository per la gestione delle vendite"""
     
+    table = 'sales'
+    upsert_key = 'date'
+    rollup_columns = ('date',)
+    money_columns = frozenset(MONEY_COLUMNS['sales'])
+    
     def create(self, sale_data: Dict[str, Any]) -> int:
         """
         Crea una nuova vendita.
@@ -35,13 +288,12 @@ class SalesRepository(BaseRepository):
             ID della vendita creata
         """
         cursor = self.connection.cursor()
+        sale_data = self._to_storage(sale_data)
         
-        fields = ', '.join(sale_data.keys())
-        placeholders = ', '.join(['?' for _ in sale_data])
-        
-        query = f"INSERT INTO sales ({fields}) VALUES ({placeholders})"
+        query = self._insert_statement(tuple(sale_data.keys()))
         cursor.execute(query, list(sale_data.values()))
-        self.connection.commit()
+        self._commit()
+        self._notify_change([sale_data.get('date')])
         
         return cursor.lastrowid
     
@@ -81,6 +333,7 @@ class SalesRepository(BaseRepository):
         cursor = self.connection.cursor()
         
         # Aggiungi timestamp di aggiornamento
+        sale_data = self._to_storage(sale_data)
         sale_data['updated_at'] = datetime.now().isoformat()
         
         set_clause = ', '.join([f"{key} = ?" for key in sale_data.keys()])
@@ -88,7 +341,8 @@ class SalesRepository(BaseRepository):
         
         values = list(sale_data.values()) + [date]
         cursor.execute(query, values)
-        self.connection.commit()
+        self._commit()
+        self._notify_change([date, sale_data.get('date')])
         
         return cursor.rowcount > 0
     
@@ -96,7 +350,8 @@ class SalesRepository(BaseRepository):
         """Elimina una vendita per data"""
         cursor = self.connection.cursor()
         cursor.execute("DELETE FROM sales WHERE date = ?", (date,))
-        self.connection.commit()
+        self._commit()
+        self._notify_change([date])
         return cursor.rowcount > 0
     
     def get_all(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
@@ -108,6 +363,36 @@ class SalesRepository(BaseRepository):
         )
         return [self._dict_from_row(row) for row in cursor.fetchall()]
     
+    def get_page(self, limit: int = 100,
+                 page_token: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Recupera una pagina di vendite (dalla più recente) con paginazione a chiave.
+        
+        A differenza di get_all con OFFSET, il costo è costante anche
+        molto in profondità nello storico.
+        
+        Args:
+            limit: Numero di vendite per pagina
+            page_token: Token restituito dalla pagina precedente (None = prima pagina)
+        
+        Returns:
+            (vendite, token della pagina successiva o None se finite)
+        """
+        cursor = self.connection.cursor()
+        if page_token is None:
+            cursor.execute(
+                "SELECT * FROM sales ORDER BY date DESC, id DESC LIMIT ?",
+                (limit + 1,)
+            )
+        else:
+            date, row_id = self._decode_page_token(page_token)
+            cursor.execute(
+                "SELECT * FROM sales WHERE (date, id) < (?, ?) "
+                "ORDER BY date DESC, id DESC LIMIT ?",
+                (date, row_id, limit + 1)
+            )
+        return self._page_result(cursor.fetchall(), limit)
+    
     def get_by_date_range(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """
         Recupera vendite in un intervallo di date.
@@ -126,6 +411,13 @@ class SalesRepository(BaseRepository):
         )
         return [self._dict_from_row(row) for row in cursor.fetchall()]
     
+    def iter_by_date_range(self, start_date: str, end_date: str) -> Iterator[tuple]:
+        """Come get_by_date_range, ma restituisce le righe (namedtuple) a blocchi"""
+        return self._iter_query(
+            "SELECT * FROM sales WHERE date BETWEEN ? AND ? ORDER BY date DESC",
+            (start_date, end_date)
+        )
+    
     def search(self, query: str) -> List[Dict[str, Any]]:
         """Cerca vendite per data o note"""
         cursor = self.connection.cursor()
@@ -135,11 +427,23 @@ class SalesRepository(BaseRepository):
             (search_pattern, search_pattern)
         )
         return [self._dict_from_row(row) for row in cursor.fetchall()]
+    
+    def iter_search(self, query: str) -> Iterator[tuple]:
+        """Come search, ma restituisce le righe (namedtuple) a blocchi"""
+        search_pattern = f"%{query}%"
+        return self._iter_query(
+            "SELECT * FROM sales WHERE date LIKE ? OR notes LIKE ? ORDER BY date DESC",
+            (search_pattern, search_pattern)
+        )
 
 
 class SuppliersRepository(BaseRepository):
     """Repository per la gestione dei fornitori"""
     
+    table = 'suppliers'
+    upsert_key = 'name'
+    has_updated_at = False
+    
     def create(self, name: str, notes: str = '') -> int:
         """Crea un nuovo fornitore"""
         cursor = self.connection.cursor()
@@ -147,7 +451,8 @@ class SuppliersRepository(BaseRepository):
             "INSERT INTO suppliers (name, notes) VALUES (?, ?)",
             (name, notes)
         )
-        self.connection.commit()
+        self._commit()
+        self._notify_change()
         return cursor.lastrowid
     
     def get_by_id(self, supplier_id: int) -> Optional[Dict[str, Any]]:
@@ -164,6 +469,40 @@ class SuppliersRepository(BaseRepository):
         row = cursor.fetchone()
         return self._dict_from_row(row)
     
+    def get_ids_by_names(self, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Recupera gli id di molti fornitori per nome (query a blocchi di 500).
+        
+        Returns:
+            Nome -> id dei fornitori esistenti
+        """
+        names = list(dict.fromkeys(names))
+        cursor = self.connection.cursor()
+        ids = {}
+        
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ', '.join(['?'] * len(chunk))
+            cursor.execute(f"SELECT name, id FROM suppliers WHERE name IN ({placeholders})", chunk)
+            ids.update((row[0], row[1]) for row in cursor.fetchall())
+        
+        return ids
+    
+    def get_aliases(self) -> Dict[str, int]:
+        """Nome alternativo -> id del fornitore"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT alias, supplier_id FROM supplier_aliases")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    
+    def add_alias(self, alias: str, supplier_id: int):
+        """Associa un nome alternativo a un fornitore (sostituisce quello esistente)"""
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            INSERT INTO supplier_aliases (alias, supplier_id) VALUES (?, ?)
+            ON CONFLICT(alias) DO UPDATE SET supplier_id = excluded.supplier_id
+        """, (alias, supplier_id))
+        self._commit()
+    
     def get_all_active(self) -> List[Dict[str, Any]]:
         """Recupera tutti i fornitori attivi"""
         cursor = self.connection.cursor()
@@ -185,7 +524,8 @@ class SuppliersRepository(BaseRepository):
             "UPDATE suppliers SET name = ?, active = ?, notes = ? WHERE id = ?",
             (name, active, notes, supplier_id)
         )
-        self.connection.commit()
+        self._commit()
+        self._notify_change()
         return cursor.rowcount > 0
     
     def delete(self, supplier_id: int) -> bool:
@@ -195,7 +535,8 @@ class SuppliersRepository(BaseRepository):
             "UPDATE suppliers SET active = 0 WHERE id = ?",
             (supplier_id,)
         )
-        self.connection.commit()
+        self._commit()
+        self._notify_change()
         return cursor.rowcount > 0
     
     def search(self, query: str) -> List[Dict[str, Any]]:
@@ -212,16 +553,20 @@ class SuppliersRepository(BaseRepository):
 class PurchasesRepository(BaseRepository):
     """Repository per la gestione degli acquisti"""
     
+    table = 'purchases'
+    upsert_key = 'id'
+    rollup_columns = ('date', 'supplier_id')
+    money_columns = frozenset(MONEY_COLUMNS['purchases'] + ('total_cash', 'total_bank', 'total'))
+    
     def create(self, purchase_data: Dict[str, Any]) -> int:
         """Crea un nuovo acquisto"""
         cursor = self.connection.cursor()
+        purchase_data = self._to_storage(purchase_data)
         
-        fields = ', '.join(purchase_data.keys())
-        placeholders = ', '.join(['?' for _ in purchase_data])
-        
-        query = f"INSERT INTO purchases ({fields}) VALUES ({placeholders})"
+        query = self._insert_statement(tuple(purchase_data.keys()))
         cursor.execute(query, list(purchase_data.values()))
-        self.connection.commit()
+        self._commit()
+        self._notify_change([purchase_data.get('date')])
         
         return cursor.lastrowid
     
@@ -261,6 +606,16 @@ class PurchasesRepository(BaseRepository):
         """, (start_date, end_date))
         return [self._dict_from_row(row) for row in cursor.fetchall()]
     
+    def iter_by_date_range(self, start_date: str, end_date: str) -> Iterator[tuple]:
+        """Come get_by_date_range, ma restituisce le righe (namedtuple) a blocchi"""
+        return self._iter_query("""
+            SELECT p.*, s.name as supplier_name 
+            FROM purchases p
+            LEFT JOIN suppliers s ON p.supplier_id = s.id
+            WHERE p.date BETWEEN ? AND ?
+            ORDER BY p.date DESC, p.created_at DESC
+        """, (start_date, end_date))
+    
     def get_by_supplier(self, supplier_id: int, limit: int = 100) -> List[Dict[str, Any]]:
         """Recupera acquisti per fornitore"""
         cursor = self.connection.cursor()
@@ -277,7 +632,9 @@ class PurchasesRepository(BaseRepository):
     def update(self, purchase_id: int, purchase_data: Dict[str, Any]) -> bool:
         """Aggiorna un acquisto"""
         cursor = self.connection.cursor()
+        old_dates = self._dates_for_id(purchase_id)
         
+        purchase_data = self._to_storage(purchase_data)
         purchase_data['updated_at'] = datetime.now().isoformat()
         
         set_clause = ', '.join([f"{key} = ?" for key in purchase_data.keys()])
@@ -285,15 +642,18 @@ class PurchasesRepository(BaseRepository):
         
         values = list(purchase_data.values()) + [purchase_id]
         cursor.execute(query, values)
-        self.connection.commit()
+        self._commit()
+        self._notify_change(old_dates + [purchase_data.get('date')])
         
         return cursor.rowcount > 0
     
     def delete(self, purchase_id: int) -> bool:
         """Elimina un acquisto"""
         cursor = self.connection.cursor()
+        old_dates = self._dates_for_id(purchase_id)
         cursor.execute("DELETE FROM purchases WHERE id = ?", (purchase_id,))
-        self.connection.commit()
+        self._commit()
+        self._notify_change(old_dates)
         return cursor.rowcount > 0
     
     def get_totals_by_date_range(self, start_date: str, end_date: str) -> Dict[str, float]:
@@ -322,21 +682,41 @@ class PurchasesRepository(BaseRepository):
             ORDER BY p.date DESC
         """, (search_pattern, search_pattern, search_pattern))
         return [self._dict_from_row(row) for row in cursor.fetchall()]
+    
+    def iter_search(self, query: str) -> Iterator[tuple]:
+        """Come search, ma restituisce le righe (namedtuple) a blocchi"""
+        search_pattern = f"%{query}%"
+        return self._iter_query("""
+            SELECT p.*, s.name as supplier_name 
+            FROM purchases p
+            LEFT JOIN suppliers s ON p.supplier_id = s.id
+            WHERE p.description LIKE ? OR s.name LIKE ? OR p.notes LIKE ?
+            ORDER BY p.date DESC
+        """, (search_pattern, search_pattern, search_pattern))
 
 
 class InvoicesRepository(BaseRepository):
     """Repository per la gestione delle fatture"""
     
+    table = 'invoices'
+    upsert_key = 'id'
+    money_columns = frozenset(MONEY_COLUMNS['invoices'])
+    
+    # Disponibilità dell'indice FTS5 (verificata al primo utilizzo)
+    _search_index_available: Optional[bool] = None
+    
+    # Presenza della colonna ocr_status (verificata al primo utilizzo)
+    _has_ocr_status: Optional[bool] = None
+    
     def create(self, invoice_data: Dict[str, Any]) -> int:
         """Crea una nuova fattura"""
         cursor = self.connection.cursor()
+        invoice_data = self._to_storage(invoice_data)
         
-        fields = ', '.join(invoice_data.keys())
-        placeholders = ', '.join(['?' for _ in invoice_data])
-        
-        query = f"INSERT INTO invoices ({fields}) VALUES ({placeholders})"
+        query = self._insert_statement(tuple(invoice_data.keys()))
         cursor.execute(query, list(invoice_data.values()))
-        self.connection.commit()
+        self._commit()
+        self._notify_change([invoice_data.get('date')])
         
         return cursor.lastrowid
     
@@ -364,6 +744,39 @@ class InvoicesRepository(BaseRepository):
         """, (limit, offset))
         return [self._dict_from_row(row) for row in cursor.fetchall()]
     
+    def get_page(self, limit: int = 100,
+                 page_token: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Recupera una pagina di fatture (dalla più recente) con paginazione a chiave.
+        
+        Args:
+            limit: Numero di fatture per pagina
+            page_token: Token restituito dalla pagina precedente (None = prima pagina)
+        
+        Returns:
+            (fatture, token della pagina successiva o None se finite)
+        """
+        cursor = self.connection.cursor()
+        if page_token is None:
+            cursor.execute("""
+                SELECT i.*, s.name as supplier_name 
+                FROM invoices i
+                LEFT JOIN suppliers s ON i.supplier_id = s.id
+                ORDER BY i.date DESC, i.id DESC
+                LIMIT ?
+            """, (limit + 1,))
+        else:
+            date, row_id = self._decode_page_token(page_token)
+            cursor.execute("""
+                SELECT i.*, s.name as supplier_name 
+                FROM invoices i
+                LEFT JOIN suppliers s ON i.supplier_id = s.id
+                WHERE (i.date, i.id) < (?, ?)
+                ORDER BY i.date DESC, i.id DESC
+                LIMIT ?
+            """, (date, row_id, limit + 1))
+        return self._page_result(cursor.fetchall(), limit)
+    
     def get_by_date_range(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """Recupera fatture in un intervallo di date"""
         cursor = self.connection.cursor()
@@ -376,10 +789,22 @@ class InvoicesRepository(BaseRepository):
         """, (start_date, end_date))
         return [self._dict_from_row(row) for row in cursor.fetchall()]
     
+    def iter_by_date_range(self, start_date: str, end_date: str) -> Iterator[tuple]:
+        """Come get_by_date_range, ma restituisce le righe (namedtuple) a blocchi"""
+        return self._iter_query("""
+            SELECT i.*, s.name as supplier_name 
+            FROM invoices i
+            LEFT JOIN suppliers s ON i.supplier_id = s.id
+            WHERE i.date BETWEEN ? AND ?
+            ORDER BY i.date DESC
+        """, (start_date, end_date))
+    
     def update(self, invoice_id: int, invoice_data: Dict[str, Any]) -> bool:
         """Aggiorna una fattura"""
         cursor = self.connection.cursor()
+        old_dates = self._dates_for_id(invoice_id)
         
+        invoice_data = self._to_storage(invoice_data)
         invoice_data['updated_at'] = datetime.now().isoformat()
         
         set_clause = ', '.join([f"{key} = ?" for key in invoice_data.keys()])
@@ -387,27 +812,459 @@ class InvoicesRepository(BaseRepository):
         
         values = list(invoice_data.values()) + [invoice_id]
         cursor.execute(query, values)
-        self.connection.commit()
+        self._commit()
+        self._notify_change(old_dates + [invoice_data.get('date')])
         
         return cursor.rowcount > 0
     
     def delete(self, invoice_id: int) -> bool:
         """Elimina una fattura"""
         cursor = self.connection.cursor()
+        old_dates = self._dates_for_id(invoice_id)
         cursor.execute("DELETE FROM invoices WHERE id = ?", (invoice_id,))
-        self.connection.commit()
+        self._commit()
+        self._notify_change(old_dates)
         return cursor.rowcount > 0
     
-    def search(self, query: str) -> List[Dict[str, Any]]:
-        """Cerca fatture per numero, fornitore o testo OCR"""
+    def search(self, query: str, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Cerca fatture per numero, fornitore, testo OCR o note.
+        
+        Usa l'indice FTS5: ogni parola è cercata come prefisso e i risultati
+        sono ordinati per rilevanza. Ogni fattura trovata contiene anche
+        'snippet', un estratto del testo con i termini evidenziati tra [ ].
+        
+        Args:
+            query: Testo da cercare
+            limit: Numero massimo di risultati
+        """
         cursor = self.connection.cursor()
-        search_pattern = f"%{query}%"
-        cursor.execute("""
-            SELECT i.*, s.name as supplier_name 
-            FROM invoices i
+        cursor.execute(*self._search_query(query, limit))
+        return [self._dict_from_row(row) for row in cursor.fetchall()]
+    
+    def iter_search(self, query: str, limit: int = -1) -> Iterator[tuple]:
+        """
+        Come search, ma restituisce le righe (namedtuple) a blocchi.
+        
+        Senza limit restituisce tutti i risultati (es. per le esportazioni).
+        """
+        return self._iter_query(*self._search_query(query, limit))
+    
+    def _search_query(self, query: str, limit: int) -> Tuple[str, Tuple[Any, ...]]:
+        """
+        Costruisce la query di ricerca: FTS5 se disponibile, altrimenti LIKE.
+        
+        Returns:
+            Tupla (sql, parametri)
+        """
+        match_query = self._fts_match_query(query)
+        if not match_query or not self._has_search_index():
+            search_pattern = f"%{query}%"
+            return """
+                SELECT i.*, s.name as supplier_name 
+                FROM invoices i
+                LEFT JOIN suppliers s ON i.supplier_id = s.id
+                WHERE i.invoice_number LIKE ? OR s.name LIKE ? 
+                   OR i.ocr_text LIKE ? OR i.notes LIKE ?
+                ORDER BY i.date DESC
+                LIMIT ?
+            """, (search_pattern, search_pattern, search_pattern, search_pattern, limit)
+        
+        return """
+            SELECT i.*, s.name as supplier_name,
+                   snippet(invoices_fts, -1, '[', ']', '…', 12) as snippet
+            FROM invoices_fts
+            JOIN invoices i ON i.id = invoices_fts.rowid
             LEFT JOIN suppliers s ON i.supplier_id = s.id
-            WHERE i.invoice_number LIKE ? OR s.name LIKE ? 
-               OR i.ocr_text LIKE ? OR i.notes LIKE ?
-            ORDER BY i.date DESC
-        """, (search_pattern, search_pattern, search_pattern, search_pattern))
+            WHERE invoices_fts MATCH ?
+            ORDER BY bm25(invoices_fts, 10.0, 5.0, 1.0, 2.0), i.date DESC
+            LIMIT ?
+        """, (match_query, limit)
+    
+    def count_pending_ocr(self) -> int:
+        """Conta le fatture con OCR in attesa (0 se lo schema non traccia lo stato OCR)"""
+        cursor = self.connection.cursor()
+        if self._has_ocr_status is None:
+            cursor.execute("PRAGMA table_info(invoices)")
+            self._has_ocr_status = any(row[1] == 'ocr_status' for row in cursor.fetchall())
+        if not self._has_ocr_status:
+            return 0
+        
+        cursor.execute(
+            "SELECT COUNT(*) FROM invoices WHERE ocr_status = 'pending' OR ocr_status IS NULL"
+        )
+        return cursor.fetchone()[0]
+    
+    def rebuild_search_index(self):
+        """Ricostruisce l'indice full-text (es. dopo modifiche manuali al database)"""
+        if not self._has_search_index():
+            return
+        
+        with self.transaction():
+            rebuild_invoices_fts(self.connection)
+    
+    def _has_search_index(self) -> bool:
+        """Verifica (una volta sola) se l'indice FTS5 esiste"""
+        if self._search_index_available is None:
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invoices_fts'"
+            )
+            self._search_index_available = cursor.fetchone() is not None
+        return self._search_index_available
+    
+    @staticmethod
+    def _fts_match_query(query: str) -> str:
+        """
+        Converte il testo digitato in una query FTS5 (parole in AND, come prefissi).
+        
+        La punteggiatura separa le parole come nell'indice: '2024/001'
+        diventa "2024"* "001"* e trova anche '001/2024'.
+        """
+        terms = re.findall(r'\w+', query)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+
+class InvoiceJobsRepository(BaseRepository):
+    """
+    Repository per la coda di importazione fatture da cartella.
+    
+    Stati: pending (da elaborare), processing (in elaborazione), done,
+    failed. I file sono identificati dall'hash del contenuto, quindi lo
+    stesso documento non viene accodato due volte anche se copiato o
+    rinominato.
+    """
+    
+    table = 'invoice_jobs'
+    upsert_key = 'file_hash'
+    
+    # Tentativi dopo i quali un file rimasto in elaborazione (crash) viene scartato
+    MAX_ATTEMPTS = 3
+    
+    def enqueue(self, files: Iterable[Tuple[str, str, int, int]]) -> int:
+        """
+        Accoda i file non ancora presenti (per hash).
+        
+        Per i file già in coda aggiorna solo percorso, dimensione e data
+        di modifica (lo stato resta invariato): un file toccato o spostato
+        non viene riletto alla scansione successiva.
+        
+        Args:
+            files: Tuple (percorso, hash, dimensione, data modifica in ns)
+        
+        Returns:
+            Numero di file accodati
+        """
+        cursor = self.connection.cursor()
+        with self.transaction():
+            cursor.execute("SELECT COUNT(*) FROM invoice_jobs")
+            before = cursor.fetchone()[0]
+            cursor.executemany("""
+                INSERT INTO invoice_jobs (file_path, file_hash, file_size, file_mtime)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(file_hash) DO UPDATE SET
+                    file_path = excluded.file_path,
+                    file_size = excluded.file_size,
+                    file_mtime = excluded.file_mtime
+            """, list(files))
+            cursor.execute("SELECT COUNT(*) FROM invoice_jobs")
+            return cursor.fetchone()[0] - before
+    
+    def known_files(self) -> Dict[str, Tuple[int, int]]:
+        """Percorso -> (dimensione, data modifica) dei file già accodati"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT file_path, file_size, file_mtime FROM invoice_jobs")
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    
+    def reset_interrupted(self) -> int:
+        """
+        Rimette in coda i file rimasti in elaborazione (chiusura o crash).
+        
+        I file che hanno già esaurito MAX_ATTEMPTS vengono segnati come
+        falliti, così un documento che blocca l'OCR non viene ripreso
+        all'infinito.
+        
+        Returns:
+            Numero di file rimessi in coda
+        """
+        cursor = self.connection.cursor()
+        with self.transaction():
+            cursor.execute("""
+                UPDATE invoice_jobs
+                SET status = 'failed', error = 'Elaborazione interrotta troppe volte',
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'processing' AND attempts >= ?
+            """, (self.MAX_ATTEMPTS,))
+            cursor.execute("""
+                UPDATE invoice_jobs SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'processing'
+            """)
+            return cursor.rowcount
+    
+    def claim(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Prende in carico i prossimi file in coda (stato processing).
+        
+        Args:
+            limit: Numero massimo di file
+        """
+        cursor = self.connection.cursor()
+        with self.transaction():
+            cursor.execute(
+                "SELECT * FROM invoice_jobs WHERE status = 'pending' ORDER BY id LIMIT ?",
+                (limit,)
+            )
+            jobs = [self._dict_from_row(row) for row in cursor.fetchall()]
+            cursor.executemany("""
+                UPDATE invoice_jobs
+                SET status = 'processing', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, [(job['id'],) for job in jobs])
+        return jobs
+    
+    def mark_done(self, job_ids: Iterable[int]):
+        """Segna i file come importati"""
+        self._set_status([('done', None, job_id) for job_id in job_ids])
+    
+    def mark_failed(self, errors: Iterable[Tuple[int, str]]):
+        """Segna i file come falliti con il relativo errore ((id, errore))"""
+        self._set_status([('failed', error, job_id) for job_id, error in errors])
+    
+    def release(self, job_ids: Iterable[int]):
+        """Rimette in coda file presi in carico ma non elaborati (es. annullamento)"""
+        cursor = self.connection.cursor()
+        cursor.executemany("""
+            UPDATE invoice_jobs
+            SET status = 'pending', attempts = MAX(attempts - 1, 0), updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'processing'
+        """, [(job_id,) for job_id in job_ids])
+        self._commit()
+    
+    def retry_failed(self) -> int:
+        """Rimette in coda i file falliti; restituisce quanti"""
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            UPDATE invoice_jobs
+            SET status = 'pending', attempts = 0, error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'failed'
+        """)
+        self._commit()
+        return cursor.rowcount
+    
+    def count_by_status(self) -> Dict[str, int]:
+        """Numero di file per stato"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT status, COUNT(*) FROM invoice_jobs GROUP BY status")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    
+    def get_failed(self) -> List[Dict[str, Any]]:
+        """File falliti con il relativo errore"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT * FROM invoice_jobs WHERE status = 'failed' ORDER BY id")
+        return [self._dict_from_row(row) for row in cursor.fetchall()]
+    
+    def _set_status(self, values: List[Tuple[str, Optional[str], int]]):
+        """Aggiorna lo stato dei file ((stato, errore, id))"""
+        cursor = self.connection.cursor()
+        cursor.executemany("""
+            UPDATE invoice_jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, values)
+        self._commit()
+
+
+class CSVImportCheckpointsRepository(BaseRepository):
+    """
+    Repository per i punti di ripresa delle importazioni CSV.
+    
+    Un'importazione è identificata da import_key (file, dimensione, data
+    di modifica, tipo e mappatura): rows_read indica quanti record del file
+    sono già stati scritti, così un'importazione annullata o interrotta
+    riparte dal blocco successivo.
+    """
+    
+    table = 'csv_import_checkpoints'
+    upsert_key = 'import_key'
+    
+    def get(self, import_key: str) -> Optional[Dict[str, Any]]:
+        """Punto di ripresa dell'importazione (None se non presente)"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT * FROM csv_import_checkpoints WHERE import_key = ?", (import_key,))
+        row = cursor.fetchone()
+        return self._dict_from_row(row) if row else None
+    
+    def save(self, import_key: str, file_path: str, import_type: str,
+             rows_read: int, imported: int, error_count: int):
+        """
+        Registra l'avanzamento (da chiamare nella transazione del blocco scritto).
+        
+        Args:
+            import_key: Chiave dell'importazione
+            file_path: File CSV
+            import_type: Tipo di importazione
+            rows_read: Record del file letti fino alla fine del blocco
+            imported: Righe importate finora
+            error_count: Righe con errori finora
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            INSERT INTO csv_import_checkpoints
+                (import_key, file_path, import_type, rows_read, imported, error_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(import_key) DO UPDATE SET
+                rows_read = excluded.rows_read, imported = excluded.imported,
+                error_count = excluded.error_count, updated_at = CURRENT_TIMESTAMP
+        """, (import_key, file_path, import_type, rows_read, imported, error_count))
+        self._commit()
+    
+    def delete(self, import_key: str):
+        """Elimina il punto di ripresa (importazione completata o da ricominciare)"""
+        cursor = self.connection.cursor()
+        cursor.execute("DELETE FROM csv_import_checkpoints WHERE import_key = ?", (import_key,))
+        self._commit()
+
+
+class TotalsRepository(BaseRepository):
+    """
+    Repository (sola lettura) per i totali precalcolati.
+    
+    Le tabelle daily_totals, monthly_totals e supplier_monthly_totals sono
+    mantenute dai trigger del database; i periodi lunghi vengono letti dai
+    totali mensili e solo i giorni ai bordi dai totali giornalieri.
+    """
+    
+    money_columns = frozenset(ROLLUP_MONEY_COLUMNS)
+    
+    SUMMARY_COLUMNS = (
+        'sales_count', 'cash_total', 'card_fees', 'satispay_fees', 'bank_total',
+        'takings', 'purchases_count', 'purchases_cash', 'purchases_bank',
+        'purchases_total', 'profit'
+    )
+    
+    def get_day(self, date: str) -> Optional[Dict[str, Any]]:
+        """Recupera i totali di una data (None se non ci sono movimenti)"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT * FROM daily_totals WHERE date = ?", (date,))
+        return self._dict_from_row(cursor.fetchone())
+    
+    def get_daily_totals(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """Recupera i totali giornalieri in un intervallo di date"""
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT * FROM daily_totals WHERE date BETWEEN ? AND ? ORDER BY date DESC",
+            (start_date, end_date)
+        )
         return [self._dict_from_row(row) for row in cursor.fetchall()]
+    
+    def get_monthly_totals(self, start_month: str, end_month: str) -> List[Dict[str, Any]]:
+        """
+        Recupera i totali mensili.
+        
+        Args:
+            start_month: Mese iniziale (YYYY-MM)
+            end_month: Mese finale (YYYY-MM)
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT * FROM monthly_totals WHERE month BETWEEN ? AND ? ORDER BY month DESC",
+            (start_month, end_month)
+        )
+        return [self._dict_from_row(row) for row in cursor.fetchall()]
+    
+    def get_period_summary(self, start_date: str, end_date: str) -> Dict[str, float]:
+        """
+        Calcola i totali di un periodo (vendite, commissioni, spese, ricavo).
+        
+        Args:
+            start_date: Data inizio (YYYY-MM-DD)
+            end_date: Data fine (YYYY-MM-DD)
+        
+        Returns:
+            Dizionario con le somme di SUMMARY_COLUMNS
+        """
+        day_ranges, month_range = self._split_period(start_date, end_date)
+        columns = ', '.join(self.SUMMARY_COLUMNS)
+        
+        parts = []
+        params = []
+        for range_start, range_end in day_ranges:
+            parts.append(f"SELECT {columns} FROM daily_totals WHERE date BETWEEN ? AND ?")
+            params.extend([range_start, range_end])
+        if month_range:
+            parts.append(f"SELECT {columns} FROM monthly_totals WHERE month BETWEEN ? AND ?")
+            params.extend(month_range)
+        
+        sums = ', '.join(f"COALESCE(SUM({col}), 0) AS {col}" for col in self.SUMMARY_COLUMNS)
+        
+        cursor = self.connection.cursor()
+        cursor.execute(f"SELECT {sums} FROM ({' UNION ALL '.join(parts)})", params)
+        return self._dict_from_row(cursor.fetchone())
+    
+    def get_supplier_totals(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """
+        Calcola le spese per fornitore in un periodo.
+        
+        Returns:
+            Lista di dizionari (supplier_id, supplier_name, cash_total,
+            bank_total, total) ordinata per totale decrescente
+        """
+        day_ranges, month_range = self._split_period(start_date, end_date)
+        
+        parts = []
+        params = []
+        for range_start, range_end in day_ranges:
+            parts.append("""
+                SELECT supplier_id, cash_payment AS cash_total, bank_payment AS bank_total
+                FROM purchases WHERE date BETWEEN ? AND ?
+            """)
+            params.extend([range_start, range_end])
+        if month_range:
+            parts.append("""
+                SELECT supplier_id, cash_total, bank_total
+                FROM supplier_monthly_totals WHERE month BETWEEN ? AND ?
+            """)
+            params.extend(month_range)
+        
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT t.supplier_id, COALESCE(s.name, 'Sconosciuto') AS supplier_name,
+                   SUM(t.cash_total) AS cash_total,
+                   SUM(t.bank_total) AS bank_total,
+                   SUM(t.cash_total + t.bank_total) AS total
+            FROM ({' UNION ALL '.join(parts)}) t
+            LEFT JOIN suppliers s ON t.supplier_id = s.id
+            GROUP BY t.supplier_id
+            ORDER BY total DESC
+        """, params)
+        return [self._dict_from_row(row) for row in cursor.fetchall()]
+    
+    def rebuild(self):
+        """Ricalcola da zero tutti i totali precalcolati"""
+        with self.transaction():
+            rebuild_rollups(self.connection)
+    
+    @staticmethod
+    def _split_period(start_date: str, end_date: str) -> Tuple[List[Tuple[str, str]], Optional[Tuple[str, str]]]:
+        """
+        Divide un periodo in mesi interi e giorni ai bordi.
+        
+        Returns:
+            (intervalli di giorni, (mese iniziale, mese finale) o None)
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        
+        # Primo giorno del primo mese intero e ultimo giorno dell'ultimo mese intero
+        first_full = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        last_full = end if (end + timedelta(days=1)).day == 1 else end.replace(day=1) - timedelta(days=1)
+        
+        if first_full > last_full:
+            return [(start_date, end_date)], None
+        
+        day_ranges = []
+        if start < first_full:
+            day_ranges.append((start_date, (first_full - timedelta(days=1)).isoformat()))
+        if last_full < end:
+            day_ranges.append(((last_full + timedelta(days=1)).isoformat(), end_date))
+        
+        return day_ranges, (first_full.strftime('%Y-%m'), last_full.strftime('%Y-%m'))
@@ -6,51 +6,168 @@ Crea le tabelle e gli indici necessari.
 import sqlite3
 import os
 from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from database.connection import ConnectionManager
+from database.events import DataChange, DataChangeBus
+from models.money import to_cents
+
+
+# Versione dello schema (PRAGMA user_version)
+# 1: importi salvati come INTEGER in centesimi
+SCHEMA_VERSION = 1
+
+# Colonne con importi in centesimi per tabella (le percentuali restano REAL)
+MONEY_COLUMNS = {
+    'sales': (
+        'start_capital', 'cash_income', 'coin_income', 'card_gross',
+        'card_fixed_fee', 'satispay_gross', 'satispay_fixed_fee'
+    ),
+    'purchases': ('cash_payment', 'bank_payment'),
+    'invoices': ('total_amount',),
+}
+
+# Colonne dei totali precalcolati (anch'esse in centesimi)
+ROLLUP_MONEY_COLUMNS = (
+    'cash_total', 'card_fees', 'card_net', 'satispay_fees', 'satispay_net',
+    'bank_total', 'takings', 'purchases_cash', 'purchases_bank',
+    'purchases_total', 'profit', 'total'
+)
+
+# Colonne delle tabelle con importi (usate anche dalla migrazione)
+TABLE_DEFINITIONS = {
+    'sales': """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL UNIQUE,
+        start_capital INTEGER DEFAULT 0,
+        cash_income INTEGER DEFAULT 0,
+        coin_income INTEGER DEFAULT 0,
+        card_gross INTEGER DEFAULT 0,
+        card_percent_fee REAL DEFAULT 1.95,
+        card_fixed_fee INTEGER DEFAULT 15,
+        satispay_gross INTEGER DEFAULT 0,
+        satispay_percent_fee REAL DEFAULT 1.0,
+        satispay_fixed_fee INTEGER DEFAULT 0,
+        notes TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    """,
+    'purchases': """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        supplier_id INTEGER NOT NULL,
+        description TEXT,
+        cash_payment INTEGER DEFAULT 0,
+        bank_payment INTEGER DEFAULT 0,
+        notes TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+    """,
+    'invoices': """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        supplier_id INTEGER,
+        invoice_number TEXT,
+        total_amount INTEGER DEFAULT 0,
+        file_path TEXT,
+        ocr_text TEXT,
+        notes TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+    """,
+}
 
 
 class Database:
     """Gestione connessione e schema database SQLite"""
     
-    def __init__(self, db_path='gestionale.db'):
+    def __init__(self, db_path='gestionale.db', profile: Optional[str] = None):
         """
         Inizializza la connessione al database.
         
         Args:
             db_path: Percorso del file database SQLite
+            profile: Profilo PRAGMA (vedi database.connection.PRAGMA_PROFILES)
         """
         self.db_path = db_path
+        self.manager = ConnectionManager(db_path, profile)
         self.connection = None
         self.connect()
         self.create_tables()
     
     def connect(self):
-        """Crea la connessione al database"""
-        self.connection = sqlite3.connect(self.db_path)
-        self.connection.row_factory = sqlite3.Row  # Permette accesso per nome colonna
+        """Crea la connessione principale (thread GUI) al database"""
+        self.connection = self.manager.get_connection()
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        Restituisce la connessione del thread corrente.
+        
+        Worker OCR, importazioni e report devono usare questa invece di
+        self.connection, che appartiene al thread GUI.
+        """
+        return self.manager.get_connection()
+    
+    def open_connection(self) -> sqlite3.Connection:
+        """Apre una connessione dedicata (da chiudere a cura del chiamante)"""
+        return self.manager.open_connection()
+    
+    def transaction(self):
+        """
+        Unit-of-work sulla connessione del thread corrente.
+        
+        I repository rimandano i commit fino all'uscita dal blocco;
+        i blocchi annidati diventano savepoint.
+        """
+        return self.get_connection().transaction()
+    
+    @property
+    def changes(self) -> DataChangeBus:
+        """Bus delle modifiche fatte dai repository su qualunque connessione"""
+        return self.manager.change_bus
+    
+    def poll_external_changes(self) -> bool:
+        """
+        Rileva le scritture fatte da altri processi (es. importazione da riga di comando).
+        
+        Usa PRAGMA data_version, che costa quanto una lettura in memoria;
+        i commit di questo processo vengono esclusi dal gestore delle
+        connessioni. Le modifiche esterne sono pubblicate come modifiche
+        a tutte le tabelle, senza intervallo di date.
+        
+        Returns:
+            True se sono state rilevate modifiche esterne
+        """
+        external = self.manager.poll_data_version()
+        if external:
+            self.changes.publish([
+                DataChange(table) for table in ('sales', 'purchases', 'invoices', 'suppliers')
+            ])
+        return external
+    
+    def backup(self, file_path: str):
+        """
+        Copia il database in un file, includendo le modifiche ancora nel WAL.
+        
+        Args:
+            file_path: Percorso del file di backup
+        """
+        destination = sqlite3.connect(file_path)
+        try:
+            self.get_connection().backup(destination)
+        finally:
+            destination.close()
         
     def create_tables(self):
         """Crea tutte le tabelle e gli indici se non esistono"""
         cursor = self.connection.cursor()
         
+        # Database creati prima degli importi in centesimi
+        self._migrate_to_cents(cursor)
+        
         # Tabella vendite giornaliere
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL UNIQUE,
-                start_capital REAL DEFAULT 0,
-                cash_income REAL DEFAULT 0,
-                coin_income REAL DEFAULT 0,
-                card_gross REAL DEFAULT 0,
-                card_percent_fee REAL DEFAULT 1.95,
-                card_fixed_fee REAL DEFAULT 0.15,
-                satispay_gross REAL DEFAULT 0,
-                satispay_percent_fee REAL DEFAULT 1.0,
-                satispay_fixed_fee REAL DEFAULT 0.0,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS sales ({TABLE_DEFINITIONS['sales']})")
         
         # Indice sulla data per le vendite
         cursor.execute("""
@@ -75,22 +192,20 @@ class Database:
             ON suppliers(name)
         """)
         
-        # Tabella acquisti/spese
+        # Nomi alternativi dei fornitori (es. come compaiono negli estratti conto)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS purchases (
+            CREATE TABLE IF NOT EXISTS supplier_aliases (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
+                alias TEXT NOT NULL UNIQUE,
                 supplier_id INTEGER NOT NULL,
-                description TEXT,
-                cash_payment REAL DEFAULT 0,
-                bank_payment REAL DEFAULT 0,
-                notes TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
             )
         """)
         
+        # Tabella acquisti/spese
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS purchases ({TABLE_DEFINITIONS['purchases']})")
+        
         # Indici per acquisti
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_purchases_date 
@@ -102,27 +217,21 @@ class Database:
             ON purchases(supplier_id)
         """)
         
-        # Tabella fatture
+        # Spese per fornitore in un periodo (totali mensili per fornitore)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS invoices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                supplier_id INTEGER,
-                invoice_number TEXT,
-                total_amount REAL DEFAULT 0,
-                file_path TEXT,
-                ocr_text TEXT,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
-            )
+            CREATE INDEX IF NOT EXISTS idx_purchases_supplier_date
+            ON purchases(supplier_id, date)
         """)
         
+        # Tabella fatture
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS invoices ({TABLE_DEFINITIONS['invoices']})")
+        
         # Indici per fatture
+        # (date, id) per la paginazione a chiave; sostituisce idx_invoices_date
+        cursor.execute("DROP INDEX IF EXISTS idx_invoices_date")
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_invoices_date 
-            ON invoices(date DESC)
+            CREATE INDEX IF NOT EXISTS idx_invoices_date_id
+            ON invoices(date DESC, id DESC)
         """)
         
         cursor.execute("""
@@ -135,11 +244,326 @@ class Database:
             ON invoices(invoice_number)
         """)
         
+        # Coda persistente dell'importazione fatture da cartella: un file per
+        # riga, deduplicato per hash; lo stato sopravvive a chiusure e crash
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invoice_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT NOT NULL,
+                file_hash TEXT NOT NULL UNIQUE,
+                file_size INTEGER,
+                file_mtime INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                error TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invoice_jobs_status
+            ON invoice_jobs(status, id)
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invoice_jobs_path
+            ON invoice_jobs(file_path)
+        """)
+        
+        # Punto di ripresa delle importazioni CSV: aggiornato nella stessa
+        # transazione di ogni blocco scritto
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS csv_import_checkpoints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                import_key TEXT NOT NULL UNIQUE,
+                file_path TEXT NOT NULL,
+                import_type TEXT NOT NULL,
+                rows_read INTEGER NOT NULL DEFAULT 0,
+                imported INTEGER DEFAULT 0,
+                error_count INTEGER DEFAULT 0,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Indice full-text per la ricerca fatture
+        self._create_invoices_fts(cursor)
+        
+        # Tabelle di totali precalcolati per report e dashboard
+        self._create_rollups(cursor)
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         self.connection.commit()
         
         # Inserisci fornitori di default se la tabella è vuota
         self._insert_default_suppliers()
     
+    def _migrate_to_cents(self, cursor):
+        """
+        Converte un database esistente con importi REAL in centesimi INTEGER.
+        
+        Le tabelle sales, purchases e invoices vengono ricreate con il nuovo
+        schema (SQLite non permette di cambiare il tipo di una colonna) e gli
+        importi convertiti con to_cents, come quelli salvati dai repository
+        (ROUND di SQLite arrotonda in modo diverso tra le versioni).
+        Trigger, indici e totali precalcolati vengono eliminati e poi
+        ricreati da create_tables.
+        Prima della conversione viene salvata una copia del file.
+        """
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] >= 1:
+            return
+        
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales'"
+        )
+        if cursor.fetchone() is None:
+            return  # Database nuovo: le tabelle nascono già in centesimi
+        
+        if not self.manager.is_memory:
+            self.backup(f"{self.db_path}.pre-centesimi.bak")
+        
+        self.connection.create_function(
+            'to_cents', 1, lambda value: None if value is None else to_cents(value), deterministic=True
+        )
+        
+        with self.connection.transaction():
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            for (trigger,) in cursor.fetchall():
+                cursor.execute(f"DROP TRIGGER {trigger}")
+            
+            for table in ('daily_totals', 'monthly_totals', 'supplier_monthly_totals'):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            
+            for table, money_columns in MONEY_COLUMNS.items():
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                )
+                if cursor.fetchone() is None:
+                    continue
+                
+                old_columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+                
+                cursor.execute(
+                    "SELECT name FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+                )
+                for (index,) in cursor.fetchall():
+                    cursor.execute(f"DROP INDEX {index}")
+                
+                cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_real")
+                cursor.execute(f"CREATE TABLE {table} ({TABLE_DEFINITIONS[table]})")
+                
+                new_columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+                columns = [col for col in new_columns if col in old_columns]
+                values = [
+                    f"to_cents({col})" if col in money_columns else col
+                    for col in columns
+                ]
+                cursor.execute(
+                    f"INSERT INTO {table} ({', '.join(columns)}) "
+                    f"SELECT {', '.join(values)} FROM {table}_real"
+                )
+                cursor.execute(f"DROP TABLE {table}_real")
+            
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    def _create_invoices_fts(self, cursor):
+        """
+        Crea l'indice FTS5 sulle fatture e i trigger che lo mantengono allineato.
+        
+        Se SQLite è compilato senza FTS5 l'indice non viene creato e
+        InvoicesRepository.search ripiega sulla ricerca LIKE.
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invoices_fts'"
+        )
+        already_exists = cursor.fetchone() is not None
+        
+        try:
+            # Copia indicizzata di numero, nome fornitore, testo OCR e note
+            # (rowid = invoices.id); prefissi di 2-3 caratteri precalcolati
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5(
+                    invoice_number,
+                    supplier_name,
+                    ocr_text,
+                    notes,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"FTS5 non disponibile, ricerca fatture senza indice: {e}")
+            return
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS invoices_fts_insert
+            AFTER INSERT ON invoices
+            BEGIN
+                INSERT INTO invoices_fts (rowid, invoice_number, supplier_name, ocr_text, notes)
+                VALUES (
+                    new.id, new.invoice_number,
+                    (SELECT name FROM suppliers WHERE id = new.supplier_id),
+                    new.ocr_text, new.notes
+                );
+            END
+        """)
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS invoices_fts_delete
+            AFTER DELETE ON invoices
+            BEGIN
+                DELETE FROM invoices_fts WHERE rowid = old.id;
+            END
+        """)
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS invoices_fts_update
+            AFTER UPDATE OF id, invoice_number, supplier_id, ocr_text, notes ON invoices
+            BEGIN
+                DELETE FROM invoices_fts WHERE rowid = old.id;
+                INSERT INTO invoices_fts (rowid, invoice_number, supplier_name, ocr_text, notes)
+                VALUES (
+                    new.id, new.invoice_number,
+                    (SELECT name FROM suppliers WHERE id = new.supplier_id),
+                    new.ocr_text, new.notes
+                );
+            END
+        """)
+        
+        # Rinomina fornitore: aggiorna il nome nelle fatture indicizzate
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS suppliers_fts_update
+            AFTER UPDATE OF name ON suppliers
+            BEGIN
+                UPDATE invoices_fts SET supplier_name = new.name
+                WHERE rowid IN (SELECT id FROM invoices WHERE supplier_id = new.id);
+            END
+        """)
+        
+        # Database esistente: indicizza le fatture già presenti
+        if not already_exists:
+            rebuild_invoices_fts(self.connection)
+    
+    def _create_rollups(self, cursor):
+        """
+        Crea le tabelle di totali giornalieri/mensili e i trigger che le
+        aggiornano ad ogni scrittura su sales e purchases.
+        
+        I valori sono quelli di SalesCalculator (incasso contante, bancario,
+        commissioni, corrispettivo, ricavo), in centesimi, così i report
+        leggono poche centinaia di righe invece di ricalcolare tutte le vendite.
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_totals'"
+        )
+        already_exists = cursor.fetchone() is not None
+        
+        # Totali per giorno (una riga per ogni data con vendite o acquisti)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_totals (
+                date TEXT PRIMARY KEY,
+                sales_count INTEGER DEFAULT 0,
+                cash_total INTEGER DEFAULT 0,
+                card_fees INTEGER DEFAULT 0,
+                card_net INTEGER DEFAULT 0,
+                satispay_fees INTEGER DEFAULT 0,
+                satispay_net INTEGER DEFAULT 0,
+                bank_total INTEGER DEFAULT 0,
+                takings INTEGER DEFAULT 0,
+                purchases_count INTEGER DEFAULT 0,
+                purchases_cash INTEGER DEFAULT 0,
+                purchases_bank INTEGER DEFAULT 0,
+                purchases_total INTEGER DEFAULT 0,
+                profit INTEGER DEFAULT 0
+            )
+        """)
+        
+        # Totali per mese (YYYY-MM), somma dei totali giornalieri
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_totals (
+                month TEXT PRIMARY KEY,
+                sales_count INTEGER DEFAULT 0,
+                cash_total INTEGER DEFAULT 0,
+                card_fees INTEGER DEFAULT 0,
+                card_net INTEGER DEFAULT 0,
+                satispay_fees INTEGER DEFAULT 0,
+                satispay_net INTEGER DEFAULT 0,
+                bank_total INTEGER DEFAULT 0,
+                takings INTEGER DEFAULT 0,
+                purchases_count INTEGER DEFAULT 0,
+                purchases_cash INTEGER DEFAULT 0,
+                purchases_bank INTEGER DEFAULT 0,
+                purchases_total INTEGER DEFAULT 0,
+                profit INTEGER DEFAULT 0
+            )
+        """)
+        
+        # Spese per fornitore e mese
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS supplier_monthly_totals (
+                month TEXT NOT NULL,
+                supplier_id INTEGER NOT NULL,
+                purchases_count INTEGER DEFAULT 0,
+                cash_total INTEGER DEFAULT 0,
+                bank_total INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                PRIMARY KEY (month, supplier_id)
+            )
+        """)
+        
+        # Flag per sospendere i trigger durante le scritture massive: i
+        # repository lo attivano dentro la propria transazione e ricalcolano
+        # i totali una volta sola alla fine (vedi refresh_rollups)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                suspended INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO rollup_state (id, suspended) VALUES (1, 0)")
+        
+        new_date, old_date = 'new.date', 'old.date'
+        new_month, old_month = 'substr(new.date, 1, 7)', 'substr(old.date, 1, 7)'
+        
+        sales_triggers = {
+            'sales_rollup_insert': ('AFTER INSERT ON sales',
+                                    _daily_refresh_sql(new_date) + _monthly_refresh_sql(new_month)),
+            'sales_rollup_update': ('AFTER UPDATE ON sales',
+                                    _daily_refresh_sql(old_date) + _daily_refresh_sql(new_date) +
+                                    _monthly_refresh_sql(old_month) + _monthly_refresh_sql(new_month)),
+            'sales_rollup_delete': ('AFTER DELETE ON sales',
+                                    _daily_refresh_sql(old_date) + _monthly_refresh_sql(old_month)),
+        }
+        
+        purchases_triggers = {
+            'purchases_rollup_insert': ('AFTER INSERT ON purchases',
+                                        _daily_refresh_sql(new_date) + _monthly_refresh_sql(new_month) +
+                                        _supplier_refresh_sql(new_month, 'new.supplier_id')),
+            'purchases_rollup_update': ('AFTER UPDATE ON purchases',
+                                        _daily_refresh_sql(old_date) + _daily_refresh_sql(new_date) +
+                                        _monthly_refresh_sql(old_month) + _monthly_refresh_sql(new_month) +
+                                        _supplier_refresh_sql(old_month, 'old.supplier_id') +
+                                        _supplier_refresh_sql(new_month, 'new.supplier_id')),
+            'purchases_rollup_delete': ('AFTER DELETE ON purchases',
+                                        _daily_refresh_sql(old_date) + _monthly_refresh_sql(old_month) +
+                                        _supplier_refresh_sql(old_month, 'old.supplier_id')),
+        }
+        
+        for name, (event, statements) in {**sales_triggers, **purchases_triggers}.items():
+            body = ';\n'.join(statements)
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {name} {event} "
+                f"WHEN (SELECT suspended FROM rollup_state) = 0 "
+                f"BEGIN\n{body};\nEND"
+            )
+        
+        # Database esistente: calcola i totali dei dati già presenti
+        if not already_exists:
+            rebuild_rollups(self.connection)
+    
     def _insert_default_suppliers(self):
         """Inserisce i fornitori di default se non esistono"""
         cursor = self.connection.cursor()
@@ -158,9 +582,10 @@ class Database:
             self.connection.commit()
     
     def close(self):
-        """Chiude la connessione al database"""
+        """Chiude tutte le connessioni al database"""
         if self.connection:
-            self.connection.close()
+            self.manager.close_all()
+            self.connection = None
     
     def __enter__(self):
         """Context manager entry"""
@@ -169,3 +594,177 @@ class Database:
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
         self.close()
+
+
+def rebuild_invoices_fts(connection: sqlite3.Connection):
+    """
+    Ricostruisce da zero l'indice full-text delle fatture.
+    
+    Args:
+        connection: Connessione al database
+    """
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM invoices_fts")
+    cursor.execute("""
+        INSERT INTO invoices_fts (rowid, invoice_number, supplier_name, ocr_text, notes)
+        SELECT i.id, i.invoice_number, s.name, i.ocr_text, i.notes
+        FROM invoices i
+        LEFT JOIN suppliers s ON i.supplier_id = s.id
+    """)
+    # Compatta i segmenti dell'indice
+    cursor.execute("INSERT INTO invoices_fts (invoices_fts) VALUES ('optimize')")
+
+
+def _fee_sql(gross: str, percent_fee: str, fixed_fee: str) -> str:
+    """
+    Espressione SQL delle commissioni in centesimi: la parte percentuale è
+    arrotondata al centesimo come in SalesCalculator (models.money).
+    """
+    return f"CAST(ROUND({gross} * {percent_fee} / 100.0) AS INTEGER) + {fixed_fee}"
+
+
+def _daily_refresh_sql(date_expr: str) -> List[str]:
+    """
+    Istruzioni che ricalcolano la riga di daily_totals per una data.
+    
+    Args:
+        date_expr: Espressione SQL della data (es. 'new.date' o ':date')
+    """
+    card_fees = _fee_sql('card_gross', 'card_percent_fee', 'card_fixed_fee')
+    satispay_fees = _fee_sql('satispay_gross', 'satispay_percent_fee', 'satispay_fixed_fee')
+    return [
+        f"DELETE FROM daily_totals WHERE date = {date_expr}",
+        f"""
+        INSERT INTO daily_totals (
+            date, sales_count, cash_total, card_fees, card_net,
+            satispay_fees, satispay_net, bank_total, takings,
+            purchases_count, purchases_cash, purchases_bank, purchases_total, profit
+        )
+        SELECT
+            {date_expr}, s.sales_count, s.cash_total, s.card_fees, s.card_net,
+            s.satispay_fees, s.satispay_net, s.card_net + s.satispay_net,
+            s.cash_total + s.card_net + s.satispay_net,
+            p.purchases_count, p.purchases_cash, p.purchases_bank,
+            p.purchases_cash + p.purchases_bank,
+            s.cash_total + s.card_net + s.satispay_net - (p.purchases_cash + p.purchases_bank)
+        FROM (
+            SELECT
+                COUNT(*) AS sales_count,
+                COALESCE(SUM(cash_income + coin_income), 0) AS cash_total,
+                COALESCE(SUM({card_fees}), 0) AS card_fees,
+                COALESCE(SUM(card_gross - ({card_fees})), 0) AS card_net,
+                COALESCE(SUM({satispay_fees}), 0) AS satispay_fees,
+                COALESCE(SUM(satispay_gross - ({satispay_fees})), 0) AS satispay_net
+            FROM sales WHERE date = {date_expr}
+        ) s, (
+            SELECT
+                COUNT(*) AS purchases_count,
+                COALESCE(SUM(cash_payment), 0) AS purchases_cash,
+                COALESCE(SUM(bank_payment), 0) AS purchases_bank
+            FROM purchases WHERE date = {date_expr}
+        ) p
+        WHERE s.sales_count > 0 OR p.purchases_count > 0
+        """,
+    ]
+
+
+def _monthly_refresh_sql(month_expr: str) -> List[str]:
+    """
+    Istruzioni che ricalcolano la riga di monthly_totals per un mese
+    a partire da daily_totals.
+    
+    Args:
+        month_expr: Espressione SQL del mese YYYY-MM
+    """
+    columns = (
+        'sales_count', 'cash_total', 'card_fees', 'card_net', 'satispay_fees',
+        'satispay_net', 'bank_total', 'takings', 'purchases_count',
+        'purchases_cash', 'purchases_bank', 'purchases_total', 'profit'
+    )
+    sums = ', '.join(f"SUM({col})" for col in columns)
+    return [
+        f"DELETE FROM monthly_totals WHERE month = {month_expr}",
+        f"""
+        INSERT INTO monthly_totals (month, {', '.join(columns)})
+        SELECT {month_expr}, {sums}
+        FROM daily_totals
+        WHERE date BETWEEN {month_expr} || '-01' AND {month_expr} || '-31'
+        HAVING COUNT(*) > 0
+        """,
+    ]
+
+
+def _supplier_refresh_sql(month_expr: str, supplier_expr: str) -> List[str]:
+    """
+    Istruzioni che ricalcolano la riga di supplier_monthly_totals
+    per un fornitore in un mese.
+    """
+    return [
+        f"DELETE FROM supplier_monthly_totals "
+        f"WHERE month = {month_expr} AND supplier_id = {supplier_expr}",
+        f"""
+        INSERT INTO supplier_monthly_totals (
+            month, supplier_id, purchases_count, cash_total, bank_total, total
+        )
+        SELECT
+            {month_expr}, {supplier_expr}, COUNT(*),
+            COALESCE(SUM(cash_payment), 0),
+            COALESCE(SUM(bank_payment), 0),
+            COALESCE(SUM(cash_payment + bank_payment), 0)
+        FROM purchases
+        WHERE supplier_id = {supplier_expr}
+          AND date BETWEEN {month_expr} || '-01' AND {month_expr} || '-31'
+        HAVING COUNT(*) > 0
+        """,
+    ]
+
+
+def refresh_rollups(connection: sqlite3.Connection, dates: Iterable[str],
+                    supplier_months: Iterable[Tuple[str, int]] = ()):
+    """
+    Ricalcola i totali precalcolati solo per le date e i fornitori indicati.
+    
+    Args:
+        connection: Connessione al database
+        dates: Date (YYYY-MM-DD) da ricalcolare; i relativi mesi vengono aggiornati
+        supplier_months: Coppie (mese YYYY-MM, supplier_id) da ricalcolare
+    """
+    cursor = connection.cursor()
+    
+    dates = sorted({date for date in dates if date})
+    for statement in _daily_refresh_sql(':date'):
+        cursor.executemany(statement, [{'date': date} for date in dates])
+    
+    months = sorted({date[:7] for date in dates})
+    for statement in _monthly_refresh_sql(':month'):
+        cursor.executemany(statement, [{'month': month} for month in months])
+    
+    pairs = sorted({(month, supplier_id) for month, supplier_id in supplier_months
+                    if month and supplier_id is not None})
+    for statement in _supplier_refresh_sql(':month', ':supplier_id'):
+        cursor.executemany(
+            statement,
+            [{'month': month, 'supplier_id': supplier_id} for month, supplier_id in pairs]
+        )
+
+
+def rebuild_rollups(connection: sqlite3.Connection):
+    """
+    Ricalcola da zero daily_totals, monthly_totals e supplier_monthly_totals.
+    
+    Args:
+        connection: Connessione al database
+    """
+    cursor = connection.cursor()
+    
+    cursor.execute("DELETE FROM daily_totals")
+    cursor.execute("DELETE FROM monthly_totals")
+    cursor.execute("DELETE FROM supplier_monthly_totals")
+    
+    cursor.execute("SELECT date FROM sales UNION SELECT date FROM purchases")
+    dates = [row[0] for row in cursor.fetchall()]
+    
+    cursor.execute("SELECT DISTINCT substr(date, 1, 7), supplier_id FROM purchases")
+    supplier_months = [(row[0], row[1]) for row in cursor.fetchall()]
+    
+    refresh_rollups(connection, dates, supplier_months)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Gestionale Negozio - Riga di comando.
+Importazione, esportazione e report senza interfaccia grafica (PyQt5 non
+viene caricato), per esempio per elaborazioni notturne su un server.
+
+Esempi:
+    python -m gestionale import vendite.csv --type sales
+    python -m gestionale import spese.csv --type purchases --map date=1 --map supplier_name=Fornitore
+    python -m gestionale export purchases spese.csv --from 2024-01-01 --to 2024-12-31
+    python -m gestionale report --from 2024-10-01 --to 2024-10-31
+    python -m gestionale alias "Allevamenti AIA" AIA
+    python -m gestionale ingest /percorso/fatture --watch
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import date
+from typing import Dict, List, Optional
+from database.schema import MONEY_COLUMNS, Database
+from database.repository import (
+    PurchasesRepository, SalesRepository, SuppliersRepository, TotalsRepository
+)
+from models.money import from_cents
+from services.csv_import_engine import (
+    ENCODING, FIELD_MAPPINGS, CSVImporter, auto_mapping, read_preview
+)
+from services.supplier_resolver import SupplierResolver
+
+
+# Colonne esportate: le stesse chiavi dell'importazione, così un file
+# esportato può essere reimportato senza indicare la mappatura
+EXPORT_COLUMNS = {
+    import_type: [spec.key for spec in specs]
+    for import_type, specs in FIELD_MAPPINGS.items()
+}
+
+# Date usate quando il periodo non è indicato
+MIN_DATE = '0000-01-01'
+MAX_DATE = '9999-12-31'
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Crea il parser degli argomenti"""
+    parser = argparse.ArgumentParser(
+        prog='python -m gestionale',
+        description='Gestionale Negozio - importazione, esportazione e report da riga di comando'
+    )
+    parser.add_argument('--db', default='gestionale.db',
+                        help='File database SQLite (default: gestionale.db)')
+    commands = parser.add_subparsers(dest='command', metavar='COMANDO')
+    commands.required = True
+    
+    # import
+    import_parser = commands.add_parser('import', help='Importa un file CSV')
+    import_parser.add_argument('file', help='File CSV')
+    import_parser.add_argument('--type', required=True, choices=sorted(FIELD_MAPPINGS),
+                               dest='import_type', help='Tipo di dati')
+    import_parser.add_argument('--map', action='append', default=[], metavar='CAMPO=COLONNA',
+                               help='Colonna di un campo: numero (da 1) o nome '
+                                    "dell'intestazione (default: riconosciuta dall'intestazione)")
+    import_parser.add_argument('--delimiter', help='Delimitatore (default: riconosciuto dal file)')
+    import_parser.add_argument('--no-header', action='store_true',
+                               help="La prima riga non è l'intestazione")
+    import_parser.add_argument('--batch-size', type=int, default=None,
+                               help='Righe per transazione')
+    import_parser.add_argument('--restart', action='store_true',
+                               help="Ignora il punto di ripresa di un'importazione interrotta")
+    import_parser.set_defaults(handler=command_import)
+    
+    # export
+    export_parser = commands.add_parser('export', help='Esporta i dati in CSV')
+    export_parser.add_argument('table', choices=sorted(EXPORT_COLUMNS), help='Dati da esportare')
+    export_parser.add_argument('file', help='File CSV di destinazione (- = standard output)')
+    export_parser.add_argument('--from', dest='start_date', default=MIN_DATE,
+                               help='Data inizio (YYYY-MM-DD)')
+    export_parser.add_argument('--to', dest='end_date', default=MAX_DATE,
+                               help='Data fine (YYYY-MM-DD)')
+    export_parser.add_argument('--delimiter', default=',', help='Delimitatore (default: virgola)')
+    export_parser.set_defaults(handler=command_export)
+    
+    # report
+    report_parser = commands.add_parser('report', help='Riepilogo di un periodo')
+    report_parser.add_argument('--from', dest='start_date', default=None,
+                               help='Data inizio (YYYY-MM-DD, default: inizio del mese)')
+    report_parser.add_argument('--to', dest='end_date', default=None,
+                               help='Data fine (YYYY-MM-DD, default: oggi)')
+    report_parser.add_argument('--json', action='store_true', help='Risultato in formato JSON')
+    report_parser.set_defaults(handler=command_report)
+    
+    # alias
+    alias_parser = commands.add_parser(
+        'alias', help='Nome alternativo di un fornitore (usato dalle importazioni)'
+    )
+    alias_parser.add_argument('alias', help='Nome alternativo (es. come appare negli estratti conto)')
+    alias_parser.add_argument('supplier', help='Nome del fornitore esistente')
+    alias_parser.set_defaults(handler=command_alias)
+    
+    # ingest
+    ingest_parser = commands.add_parser(
+        'ingest', help='Importa le fatture (PDF e immagini) di una cartella con OCR'
+    )
+    ingest_parser.add_argument('folder', help='Cartella delle fatture')
+    ingest_parser.add_argument('--recursive', action='store_true', help='Include le sottocartelle')
+    ingest_parser.add_argument('--watch', action='store_true',
+                               help='Sorveglia la cartella finché non viene interrotto (Ctrl+C)')
+    ingest_parser.add_argument('--interval', type=float, default=None,
+                               help='Secondi tra due controlli della cartella con --watch')
+    ingest_parser.add_argument('--retry-failed', action='store_true',
+                               help='Rimette in coda i file falliti in precedenza')
+    ingest_parser.set_defaults(handler=command_ingest)
+    
+    return parser
+
+
+def parse_mapping(values: List[str], headers: List[str]) -> Dict[str, Optional[int]]:
+    """
+    Converte gli argomenti --map in campo -> indice della colonna.
+    
+    Raises:
+        ValueError: se un argomento non è valido
+    """
+    normalized = [' '.join(header.lower().split()) for header in headers]
+    mapping = {}
+    for value in values:
+        field, separator, column = value.partition('=')
+        if not separator or not field.strip() or not column.strip():
+            raise ValueError(f"Mappatura non valida: {value} (atteso CAMPO=COLONNA)")
+        
+        column = column.strip()
+        if column.isdigit():
+            index = int(column) - 1
+        else:
+            name = ' '.join(column.lower().split())
+            if name not in normalized:
+                raise ValueError(f"Colonna non trovata nell'intestazione: {column}")
+            index = normalized.index(name)
+        mapping[field.strip()] = index
+    return mapping
+
+
+def command_import(db: Database, args) -> int:
+    """Importa un file CSV"""
+    delimiter, preview = read_preview(args.file, rows=0)
+    delimiter = args.delimiter or delimiter
+    headers = preview[0] if preview and not args.no_header else []
+    
+    mapping = auto_mapping(args.import_type, headers)
+    mapping.update(parse_mapping(args.map, headers))
+    unknown = set(mapping) - set(EXPORT_COLUMNS[args.import_type])
+    if unknown:
+        raise ValueError(f"Campi sconosciuti: {', '.join(sorted(unknown))}")
+    if not mapping:
+        raise ValueError("Nessuna colonna mappata: usare --map CAMPO=COLONNA")
+    
+    options = {} if args.batch_size is None else {'batch_size': args.batch_size}
+    importer = CSVImporter(db.connection, args.import_type, mapping, delimiter, **options)
+    try:
+        result = importer.run(args.file, has_header=not args.no_header, resume=not args.restart)
+    except KeyboardInterrupt:
+        print("Importazione interrotta: rieseguire lo stesso comando per riprendere",
+              file=sys.stderr)
+        raise
+    
+    if result.resumed_from:
+        print(f"Ripresa dal record {result.resumed_from + 1}")
+    if result.date_format:
+        print(f"Formato date: {result.date_format}")
+    print(f"Righe importate: {result.imported}")
+    if result.error_count:
+        print(f"Righe con errori: {result.error_count}")
+        for line, error in result.errors:
+            print(f"  riga {line}: {error}", file=sys.stderr)
+        return EXIT_ERROR
+    return EXIT_OK
+
+
+def command_export(db: Database, args) -> int:
+    """Esporta vendite, acquisti o fornitori in CSV"""
+    columns = EXPORT_COLUMNS[args.table]
+    money_columns = set(MONEY_COLUMNS.get(args.table, ()))
+    
+    if args.table == 'sales':
+        rows = SalesRepository(db.connection).iter_by_date_range(args.start_date, args.end_date)
+    elif args.table == 'purchases':
+        rows = PurchasesRepository(db.connection).iter_by_date_range(args.start_date, args.end_date)
+    else:
+        rows = SuppliersRepository(db.connection).get_all()
+    
+    if args.file == '-':
+        count = write_csv(sys.stdout, rows, columns, money_columns, args.delimiter)
+    else:
+        with open(args.file, 'w', encoding=ENCODING, newline='') as file:
+            count = write_csv(file, rows, columns, money_columns, args.delimiter)
+    
+    print(f"Righe esportate: {count}", file=sys.stderr)
+    return EXIT_OK
+
+
+def write_csv(file, rows, columns: List[str], money_columns, delimiter: str) -> int:
+    """
+    Scrive le righe (namedtuple in centesimi o dizionari) una alla volta.
+    
+    Returns:
+        Numero di righe scritte
+    """
+    writer = csv.writer(file, delimiter=delimiter)
+    writer.writerow(columns)
+    
+    count = 0
+    for row in rows:
+        values = row if isinstance(row, dict) else row._asdict()
+        writer.writerow([
+            f"{from_cents(values[column]):.2f}" if column in money_columns
+            else ('' if values.get(column) is None else values[column])
+            for column in columns
+        ])
+        count += 1
+    return count
+
+
+def command_report(db: Database, args) -> int:
+    """Stampa i totali di un periodo e le spese per fornitore"""
+    today = date.today()
+    start_date = args.start_date or today.replace(day=1).isoformat()
+    end_date = args.end_date or today.isoformat()
+    
+    totals_repo = TotalsRepository(db.connection)
+    summary = totals_repo.get_period_summary(start_date, end_date)
+    suppliers = totals_repo.get_supplier_totals(start_date, end_date)
+    
+    if args.json:
+        json.dump({
+            'start_date': start_date,
+            'end_date': end_date,
+            'summary': summary,
+            'suppliers': suppliers,
+        }, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return EXIT_OK
+    
+    days = summary['sales_count']
+    print(f"Periodo: {start_date} - {end_date}")
+    print()
+    print(f"Giorni con vendite:     {days}")
+    print(f"Vendite totali:         {format_currency(summary['takings'])}")
+    print(f"  di cui contanti:      {format_currency(summary['cash_total'])}")
+    print(f"  di cui banca:         {format_currency(summary['bank_total'])}")
+    print(f"Media giornaliera:      {format_currency(summary['takings'] / days if days else 0)}")
+    print(f"Spese totali:           {format_currency(summary['purchases_total'])}")
+    print(f"  di cui contanti:      {format_currency(summary['purchases_cash'])}")
+    print(f"  di cui banca:         {format_currency(summary['purchases_bank'])}")
+    print(f"Profitto netto:         {format_currency(summary['profit'])}")
+    
+    if suppliers:
+        print()
+        print("Spese per fornitore:")
+        for totals in suppliers:
+            print(f"  {totals['supplier_name']:<30} {format_currency(totals['total']):>15}")
+    return EXIT_OK
+
+
+def command_alias(db: Database, args) -> int:
+    """Associa un nome alternativo a un fornitore esistente"""
+    suppliers_repo = SuppliersRepository(db.connection)
+    supplier_id = SupplierResolver(suppliers_repo).get(args.supplier)
+    if supplier_id is None:
+        raise ValueError(f"Fornitore non trovato: {args.supplier}")
+    
+    suppliers_repo.add_alias(args.alias, supplier_id)
+    print(f"'{args.alias}' -> {suppliers_repo.get_by_id(supplier_id)['name']}")
+    return EXIT_OK
+
+
+def command_ingest(db: Database, args) -> int:
+    """Importa le fatture di una cartella (una volta o sorvegliandola)"""
+    # OCR importato solo per questo comando
+    from database.repository import InvoiceJobsRepository
+    from services.invoice_ingestion import WATCH_INTERVAL, InvoiceIngestionService
+    
+    if not os.path.isdir(args.folder):
+        raise ValueError(f"Cartella non trovata: {args.folder}")
+    
+    jobs_repo = InvoiceJobsRepository(db.connection)
+    if args.retry_failed:
+        print(f"File falliti rimessi in coda: {jobs_repo.retry_failed()}")
+    
+    service = InvoiceIngestionService(db)
+    try:
+        if args.watch:
+            cancel_event = threading.Event()
+            print(f"Sorveglianza di {args.folder} (Ctrl+C per terminare)")
+            try:
+                service.watch(
+                    args.folder, cancel_event,
+                    interval=args.interval or WATCH_INTERVAL, recursive=args.recursive,
+                    on_summary=print_ingestion_summary
+                )
+            except KeyboardInterrupt:
+                cancel_event.set()
+                print("Sorveglianza terminata: i file non elaborati restano in coda",
+                      file=sys.stderr)
+            return EXIT_OK
+        
+        summary = service.ingest_folder(args.folder, recursive=args.recursive)
+    finally:
+        service.shutdown()
+    
+    print_ingestion_summary(summary)
+    if summary.failed:
+        for job in jobs_repo.get_failed():
+            print(f"  {job['file_path']}: {job['error']}", file=sys.stderr)
+        return EXIT_ERROR
+    return EXIT_OK
+
+
+def print_ingestion_summary(summary):
+    """Stampa l'esito di un'elaborazione della coda fatture"""
+    print(f"File accodati: {summary.queued}  Fatture importate: {summary.imported}  "
+          f"Dalla cache OCR: {summary.cached}  Falliti: {summary.failed}  "
+          f"In coda: {summary.pending}")
+
+
+def format_currency(value: float) -> str:
+    """Formatta un valore come valuta (stesso formato dei report dell'interfaccia)"""
+    return f"€ {value:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Funzione principale: restituisce il codice di uscita"""
+    args = build_parser().parse_args(argv)
+    
+    try:
+        db = Database(args.db)
+    except Exception as e:
+        print(f"Errore apertura database: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    
+    try:
+        return args.handler(db, args)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,7 @@ Model per le fatture.
 
 from dataclasses import dataclass
 from typing import Optional
+from models.slots import slotted
 
 
 @dataclass
@@ -55,3 +56,7 @@ class Invoice:
             created_at=data.get('created_at'),
             updated_at=data.get('updated_at')
         )
+
+
+# Variante compatta, per caricare molte fatture come oggetti
+InvoiceRecord = slotted(Invoice, 'InvoiceRecord')
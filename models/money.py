@@ -0,0 +1,48 @@
+"""
+Importi in centesimi interi.
+
+Il database salva gli importi come INTEGER (centesimi): somme e confronti
+sono esatti e non servono arrotondamenti ripetuti nei report. I model e
+l'interfaccia continuano a usare euro (float); la conversione avviene
+nei repository.
+"""
+
+from typing import Optional
+
+
+def round_half_away(value: float) -> int:
+    """
+    Arrotonda all'intero più vicino, con le metà lontano dallo zero.
+    
+    Stesso risultato di ROUND(x) di SQLite, così i calcoli Python e i
+    totali calcolati dai trigger coincidono al centesimo.
+    """
+    if value >= 0:
+        return int(value + 0.5)
+    return -int(-value + 0.5)
+
+
+def to_cents(euros: Optional[float]) -> int:
+    """Converte un importo in euro in centesimi (None -> 0)"""
+    if euros is None:
+        return 0
+    # round(..., 6) toglie l'errore di rappresentazione (12.345 * 100 = 1234.4999...)
+    return round_half_away(round(euros * 100, 6))
+
+
+def from_cents(cents: Optional[int]) -> float:
+    """Converte centesimi in euro (None -> 0.0)"""
+    if cents is None:
+        return 0.0
+    return cents / 100
+
+
+def percent_of_cents(cents: int, percent: float) -> int:
+    """
+    Calcola una percentuale di un importo, arrotondata al centesimo.
+    
+    Args:
+        cents: Importo in centesimi
+        percent: Percentuale (es. 1.95)
+    """
+    return round_half_away(cents * percent / 100.0)
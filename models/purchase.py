@@ -3,7 +3,9 @@ Model per gli acquisti/spese.
 """
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Optional
+from models.money import from_cents
+from models.slots import slotted
 
 
 @dataclass
@@ -53,7 +55,27 @@ class Purchase:
             updated_at=data.get('updated_at')
         )
     
+    @classmethod
+    def from_row(cls, row: Any) -> 'Purchase':
+        """Crea un'istanza da una riga di PurchasesRepository.iter_by_date_range (importi in centesimi)"""
+        return cls(
+            id=row.id,
+            date=row.date,
+            supplier_id=row.supplier_id,
+            supplier_name=row.supplier_name,
+            description=row.description or '',
+            cash_payment=from_cents(row.cash_payment),
+            bank_payment=from_cents(row.bank_payment),
+            notes=row.notes or '',
+            created_at=row.created_at,
+            updated_at=row.updated_at
+        )
+    
     @property
     def total(self) -> float:
         """Calcola il totale dell'acquisto"""
         return self.cash_payment + self.bank_payment
+
+
+# Variante compatta, per caricare molti acquisti come oggetti
+PurchaseRecord = slotted(Purchase, 'PurchaseRecord')
@@ -2,9 +2,14 @@
 Model per le vendite giornaliere.
 """
 
+from array import array
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from itertools import chain
+from operator import attrgetter, itemgetter
+from typing import Any, Iterable, Iterator, List, Optional
+from models.money import from_cents, to_cents
+from models.slots import slotted
 
 
 @dataclass
@@ -66,3 +71,109 @@ class Sale:
             created_at=data.get('created_at'),
             updated_at=data.get('updated_at')
         )
+
+
+# Variante compatta, per caricare molte vendite come oggetti
+SaleRecord = slotted(Sale, 'SaleRecord')
+
+
+class SalesFrame:
+    """
+    Contenitore colonnare di vendite giornaliere.
+    
+    Ogni campo numerico è una colonna array (8 byte per valore, nessun
+    oggetto per riga): anni di vendite occupano pochi KB e le colonne
+    possono essere passate direttamente a SalesCalculator.calculate_batch.
+    Gli importi sono in centesimi (array('q')), come nel database; le
+    percentuali delle commissioni sono array('d').
+    """
+    
+    # Campi numerici del model Sale, ciascuno una colonna
+    NUMERIC_FIELDS = (
+        'start_capital', 'cash_income', 'coin_income',
+        'card_gross', 'card_percent_fee', 'card_fixed_fee',
+        'satispay_gross', 'satispay_percent_fee', 'satispay_fixed_fee',
+    )
+    PERCENT_FIELDS = ('card_percent_fee', 'satispay_percent_fee')
+    
+    __slots__ = ('dates', 'ids', 'notes') + NUMERIC_FIELDS
+    
+    def __init__(self):
+        self.dates: List[str] = []
+        self.ids = array('q')
+        self.notes: List[str] = []
+        for name in self.NUMERIC_FIELDS:
+            setattr(self, name, array('d' if name in self.PERCENT_FIELDS else 'q'))
+    
+    @classmethod
+    def from_rows(cls, rows: Iterable[Any]) -> 'SalesFrame':
+        """
+        Crea il contenitore da righe del database (importi in centesimi).
+        
+        Args:
+            rows: Dizionari (anche parziali), sqlite3.Row o namedtuple
+                  (es. da SalesRepository.iter_by_date_range)
+        """
+        frame = cls()
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return frame
+        
+        names = ('date', 'id', 'notes') + cls.NUMERIC_FIELDS
+        if hasattr(first, '_fields'):
+            getter = attrgetter(*names)
+        elif isinstance(first, dict):
+            getter = lambda row: tuple(map(row.get, names))
+        else:
+            getter = itemgetter(*names)
+        defaults = [cls._default(name) for name in cls.NUMERIC_FIELDS]
+        columns = [getattr(frame, name) for name in cls.NUMERIC_FIELDS]
+        append_date = frame.dates.append
+        append_id = frame.ids.append
+        append_notes = frame.notes.append
+        
+        for values in map(getter, chain((first,), rows)):
+            append_date(values[0])
+            append_id(values[1] or 0)
+            append_notes(values[2] or '')
+            for column, value, default in zip(columns, values[3:], defaults):
+                column.append(default if value is None else value)
+        
+        return frame
+    
+    @classmethod
+    def _default(cls, name: str):
+        """Valore di default del model Sale per un campo (usato al posto di NULL)"""
+        default = Sale.__dataclass_fields__[name].default
+        return default if name in cls.PERCENT_FIELDS else to_cents(default)
+    
+    def append(self, sale: Sale):
+        """Aggiunge una vendita in coda (importi del model in euro)"""
+        self.dates.append(sale.date)
+        self.ids.append(sale.id or 0)
+        self.notes.append(sale.notes or '')
+        for name in self.NUMERIC_FIELDS:
+            value = getattr(sale, name)
+            getattr(self, name).append(value if name in self.PERCENT_FIELDS else to_cents(value))
+    
+    def __len__(self) -> int:
+        return len(self.dates)
+    
+    def row(self, index: int) -> SaleRecord:
+        """Restituisce la vendita in posizione index come SaleRecord (importi in euro)"""
+        values = {
+            name: getattr(self, name)[index] if name in self.PERCENT_FIELDS
+            else from_cents(getattr(self, name)[index])
+            for name in self.NUMERIC_FIELDS
+        }
+        return SaleRecord(
+            date=self.dates[index],
+            id=self.ids[index] or None,
+            notes=self.notes[index],
+            **values
+        )
+    
+    def __iter__(self) -> Iterator[SaleRecord]:
+        for index in range(len(self)):
+            yield self.row(index)
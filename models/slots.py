@@ -0,0 +1,29 @@
+"""
+Varianti compatte (con __slots__) dei model.
+"""
+
+from dataclasses import fields
+
+
+def slotted(cls: type, name: str) -> type:
+    """
+    Crea una copia di un dataclass che usa __slots__ invece di __dict__.
+    
+    Equivale a @dataclass(slots=True) di Python 3.10+, ma funziona anche
+    con Python 3.8. Le istanze occupano circa la metà della memoria e
+    mantengono gli stessi metodi (to_dict, from_dict, proprietà).
+    
+    Args:
+        cls: Dataclass di partenza
+        name: Nome della nuova classe
+    """
+    field_names = tuple(field.name for field in fields(cls))
+    
+    namespace = {
+        key: value for key, value in cls.__dict__.items()
+        if key not in field_names and key not in ('__dict__', '__weakref__')
+    }
+    namespace['__slots__'] = field_names
+    namespace['__qualname__'] = name
+    
+    return type(cls)(name, cls.__bases__, namespace)
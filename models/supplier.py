@@ -4,6 +4,7 @@ Model per i fornitori.
 
 from dataclasses import dataclass
 from typing import Optional
+from models.slots import slotted
 
 
 @dataclass
@@ -39,3 +40,7 @@ class Supplier:
             notes=data.get('notes', ''),
             created_at=data.get('created_at')
         )
+
+
+# Variante compatta, per caricare molti fornitori come oggetti
+SupplierRecord = slotted(Supplier, 'SupplierRecord')
@@ -3,12 +3,27 @@ Servizio per i calcoli delle vendite giornaliere.
 Implementa la logica di business per i calcoli automatici.
 """
 
-from typing import Dict, Any
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, Sequence
+from models.money import from_cents, percent_of_cents, round_half_away, to_cents
 from models.sale import Sale
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 
 class SalesCalculator:
-    """Calcola i valori derivati per le vendite giornaliere"""
+    """
+    Calcola i valori derivati per le vendite giornaliere.
+    
+    I calcoli avvengono in centesimi interi (la parte percentuale delle
+    commissioni è arrotondata al centesimo), quindi coincidono con i totali
+    salvati nel database; i metodi per singola vendita restituiscono euro.
+    """
     
     @staticmethod
     def calculate_cash_total(sale: Sale) -> float:
@@ -17,7 +32,7 @@ class SalesCalculator:
         
         Formula: Incasso Contante + Incasso Moneta
         """
-        return sale.cash_income + sale.coin_income
+        return from_cents(SalesCalculator.calculate_cents(sale)['cash_total'])
     
     @staticmethod
     def calculate_card_fees(gross: float, percent_fee: float, fixed_fee: float) -> float:
@@ -26,7 +41,18 @@ class SalesCalculator:
         
         Formula: (Lordo * Percentuale / 100) + Costo Fisso
         """
-        return (gross * percent_fee / 100.0) + fixed_fee
+        return from_cents(
+            SalesCalculator.calculate_fees_cents(to_cents(gross), percent_fee, to_cents(fixed_fee))
+        )
+    
+    @staticmethod
+    def calculate_fees_cents(gross: int, percent_fee: float, fixed_fee: int) -> int:
+        """
+        Commissioni in centesimi (importi in centesimi, percentuale es. 1.95).
+        
+        Formula: arrotondamento(Lordo * Percentuale / 100) + Costo Fisso
+        """
+        return percent_of_cents(gross, percent_fee) + fixed_fee
     
     @staticmethod
     def calculate_card_net(sale: Sale) -> float:
@@ -35,12 +61,7 @@ class SalesCalculator:
         
         Formula: Lordo - Commissioni
         """
-        fees = SalesCalculator.calculate_card_fees(
-            sale.card_gross,
-            sale.card_percent_fee,
-            sale.card_fixed_fee
-        )
-        return sale.card_gross - fees
+        return from_cents(SalesCalculator.calculate_cents(sale)['card_net'])
     
     @staticmethod
     def calculate_satispay_net(sale: Sale) -> float:
@@ -49,12 +70,7 @@ class SalesCalculator:
         
         Formula: Lordo - Commissioni
         """
-        fees = SalesCalculator.calculate_card_fees(
-            sale.satispay_gross,
-            sale.satispay_percent_fee,
-            sale.satispay_fixed_fee
-        )
-        return sale.satispay_gross - fees
+        return from_cents(SalesCalculator.calculate_cents(sale)['satispay_net'])
     
     @staticmethod
     def calculate_bank_total(sale: Sale) -> float:
@@ -63,9 +79,7 @@ class SalesCalculator:
         
         Formula: Netto Bancomat + Netto Satispay
         """
-        card_net = SalesCalculator.calculate_card_net(sale)
-        satispay_net = SalesCalculator.calculate_satispay_net(sale)
-        return card_net + satispay_net
+        return from_cents(SalesCalculator.calculate_cents(sale)['bank_total'])
     
     @staticmethod
     def calculate_takings(sale: Sale) -> float:
@@ -74,9 +88,7 @@ class SalesCalculator:
         
         Formula: Incasso Contante + Incasso Bancario
         """
-        cash_total = SalesCalculator.calculate_cash_total(sale)
-        bank_total = SalesCalculator.calculate_bank_total(sale)
-        return cash_total + bank_total
+        return from_cents(SalesCalculator.calculate_cents(sale)['takings'])
     
     @staticmethod
     def calculate_daily_profit(sale: Sale, supplier_payments: float = 0.0) -> float:
@@ -89,8 +101,8 @@ class SalesCalculator:
             sale: Vendita giornaliera
             supplier_payments: Totale pagamenti fornitori del giorno
         """
-        takings = SalesCalculator.calculate_takings(sale)
-        return takings - supplier_payments
+        calculations = SalesCalculator.calculate_cents(sale, to_cents(supplier_payments))
+        return from_cents(calculations['daily_profit'])
     
     @staticmethod
     def get_all_calculations(sale: Sale, supplier_payments: float = 0.0) -> Dict[str, float]:
@@ -98,23 +110,37 @@ class SalesCalculator:
         Restituisce tutti i calcoli per una vendita.
         
         Returns:
-            Dizionario con tutti i valori calcolati
+            Dizionario con tutti i valori calcolati (in euro)
+        """
+        calculations = SalesCalculator.calculate_cents(sale, to_cents(supplier_payments))
+        return {key: from_cents(value) for key, value in calculations.items()}
+        
+    @staticmethod
+    def calculate_cents(sale: Sale, supplier_payments: int = 0) -> Dict[str, int]:
         """
-        cash_total = SalesCalculator.calculate_cash_total(sale)
+        Restituisce tutti i calcoli per una vendita in centesimi interi.
         
-        card_fees = SalesCalculator.calculate_card_fees(
-            sale.card_gross,
+        Args:
+            sale: Vendita giornaliera (importi in euro)
+            supplier_payments: Totale pagamenti fornitori del giorno in centesimi
+        """
+        cash_total = to_cents(sale.cash_income) + to_cents(sale.coin_income)
+        
+        card_gross = to_cents(sale.card_gross)
+        card_fees = SalesCalculator.calculate_fees_cents(
+            card_gross,
             sale.card_percent_fee,
-            sale.card_fixed_fee
+            to_cents(sale.card_fixed_fee)
         )
-        card_net = sale.card_gross - card_fees
+        card_net = card_gross - card_fees
         
-        satispay_fees = SalesCalculator.calculate_card_fees(
-            sale.satispay_gross,
+        satispay_gross = to_cents(sale.satispay_gross)
+        satispay_fees = SalesCalculator.calculate_fees_cents(
+            satispay_gross,
             sale.satispay_percent_fee,
-            sale.satispay_fixed_fee
+            to_cents(sale.satispay_fixed_fee)
         )
-        satispay_net = sale.satispay_gross - satispay_fees
+        satispay_net = satispay_gross - satispay_fees
         
         bank_total = card_net + satispay_net
         takings = cash_total + bank_total
@@ -132,6 +158,126 @@ class SalesCalculator:
             'daily_profit': daily_profit
         }
     
+    @staticmethod
+    def calculate_batch(sales: Any, supplier_payments: Optional[Sequence[int]] = None) -> Dict[str, Sequence[int]]:
+        """
+        Calcola tutti i valori derivati per molte vendite in un solo passaggio.
+        
+        Stesse formule e stesse chiavi di calculate_cents, ma ogni valore è
+        una colonna (un elemento per vendita). Con NumPy il calcolo è
+        vettoriale, altrimenti è un unico ciclo su colonne di interi.
+        
+        Args:
+            sales: SalesFrame, oppure dizionario campo -> colonna
+                   (array.array, array NumPy o lista); importi in centesimi
+            supplier_payments: Pagamenti fornitori per ogni vendita in centesimi (default 0)
+        
+        Returns:
+            Dizionario con una colonna in centesimi per ogni valore calcolato
+            (array NumPy se disponibile, altrimenti array('q'))
+        """
+        def column(name):
+            return sales[name] if isinstance(sales, Mapping) else getattr(sales, name)
+        
+        cash_income = column('cash_income')
+        coin_income = column('coin_income')
+        card_gross = column('card_gross')
+        card_percent_fee = column('card_percent_fee')
+        card_fixed_fee = column('card_fixed_fee')
+        satispay_gross = column('satispay_gross')
+        satispay_percent_fee = column('satispay_percent_fee')
+        satispay_fixed_fee = column('satispay_fixed_fee')
+        
+        if supplier_payments is None:
+            supplier_payments = array('q', bytes(8 * len(cash_income)))
+        
+        if NUMPY_AVAILABLE:
+            return SalesCalculator._calculate_batch_numpy(
+                cash_income, coin_income,
+                card_gross, card_percent_fee, card_fixed_fee,
+                satispay_gross, satispay_percent_fee, satispay_fixed_fee,
+                supplier_payments
+            )
+        
+        cash_totals, card_fees_column, card_nets = array('q'), array('q'), array('q')
+        satispay_fees_column, satispay_nets = array('q'), array('q')
+        bank_totals, takings_column, profits = array('q'), array('q'), array('q')
+        
+        for values in zip(cash_income, coin_income,
+                          card_gross, card_percent_fee, card_fixed_fee,
+                          satispay_gross, satispay_percent_fee, satispay_fixed_fee,
+                          supplier_payments):
+            cash, coin, card, card_pct, card_fixed, satispay, sat_pct, sat_fixed, payments = values
+            
+            cash_total = cash + coin
+            card_fees = round_half_away(card * card_pct / 100.0) + card_fixed
+            card_net = card - card_fees
+            satispay_fees = round_half_away(satispay * sat_pct / 100.0) + sat_fixed
+            satispay_net = satispay - satispay_fees
+            bank_total = card_net + satispay_net
+            takings = cash_total + bank_total
+            
+            cash_totals.append(cash_total)
+            card_fees_column.append(card_fees)
+            card_nets.append(card_net)
+            satispay_fees_column.append(satispay_fees)
+            satispay_nets.append(satispay_net)
+            bank_totals.append(bank_total)
+            takings_column.append(takings)
+            profits.append(takings - payments)
+        
+        return {
+            'cash_total': cash_totals,
+            'card_fees': card_fees_column,
+            'card_net': card_nets,
+            'satispay_fees': satispay_fees_column,
+            'satispay_net': satispay_nets,
+            'bank_total': bank_totals,
+            'takings': takings_column,
+            'supplier_payments': array('q', supplier_payments),
+            'daily_profit': profits
+        }
+    
+    @staticmethod
+    def _calculate_batch_numpy(cash_income, coin_income,
+                               card_gross, card_percent_fee, card_fixed_fee,
+                               satispay_gross, satispay_percent_fee, satispay_fixed_fee,
+                               supplier_payments) -> Dict[str, Any]:
+        """Versione vettoriale di calculate_batch (richiede NumPy)"""
+        def cents(values):
+            return np.asarray(values, dtype=np.int64)
+        
+        def fees(gross, percent_fee, fixed_fee):
+            # Stesso arrotondamento di models.money.round_half_away
+            percent = gross * np.asarray(percent_fee, dtype=np.float64) / 100.0
+            return np.trunc(percent + np.copysign(0.5, percent)).astype(np.int64) + cents(fixed_fee)
+        
+        cash_total = cents(cash_income) + cents(coin_income)
+        
+        card_gross = cents(card_gross)
+        card_fees = fees(card_gross, card_percent_fee, card_fixed_fee)
+        card_net = card_gross - card_fees
+        
+        satispay_gross = cents(satispay_gross)
+        satispay_fees = fees(satispay_gross, satispay_percent_fee, satispay_fixed_fee)
+        satispay_net = satispay_gross - satispay_fees
+        
+        bank_total = card_net + satispay_net
+        takings = cash_total + bank_total
+        supplier_payments = cents(supplier_payments)
+        
+        return {
+            'cash_total': cash_total,
+            'card_fees': card_fees,
+            'card_net': card_net,
+            'satispay_fees': satispay_fees,
+            'satispay_net': satispay_net,
+            'bank_total': bank_total,
+            'takings': takings,
+            'supplier_payments': supplier_payments,
+            'daily_profit': takings - supplier_payments
+        }
+    
     @staticmethod
     def format_currency(value: float) -> str:
         """
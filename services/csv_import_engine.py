@@ -0,0 +1,407 @@
+"""
+Motore di importazione CSV indipendente dall'interfaccia.
+Il file viene letto a blocchi di righe, la mappatura delle colonne è
+risolta una sola volta in un convertitore di righe e ogni blocco viene
+scritto con un'unica transazione: la memoria usata non dipende dalla
+dimensione del file. Insieme a ogni blocco viene salvato il punto di
+ripresa, così un'importazione annullata o interrotta riparte dal blocco
+successivo.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from database.repository import (
+    CSVImportCheckpointsRepository, PurchasesRepository, SalesRepository, SuppliersRepository
+)
+from services.date_parser import DateParser, parse_date
+from services.supplier_resolver import SupplierResolver
+
+
+# Righe scritte per ogni transazione
+DEFAULT_BATCH_SIZE = 1000
+
+# Byte letti per riconoscere il delimitatore
+SNIFF_SAMPLE_SIZE = 8192
+
+# Righe lette all'inizio del file per riconoscere il formato delle date
+DATE_SAMPLE_ROWS = 200
+
+# Righe con errori conservate nel risultato (le altre sono solo contate)
+MAX_REPORTED_ERRORS = 100
+
+ENCODING = 'utf-8-sig'
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """Campo importabile: chiave, etichetta, conversione e valore se la colonna è vuota"""
+    
+    key: str
+    label: str
+    parse: Callable[[str], Any] = str
+    default: Any = ''
+    required: bool = False
+
+
+DATE_LABEL = 'Data (YYYY-MM-DD o DD/MM/YYYY)'
+
+# Campi richiesti per ogni tipo di importazione
+FIELD_MAPPINGS: Dict[str, List[FieldSpec]] = {
+    'sales': [
+        FieldSpec('date', DATE_LABEL, parse_date, required=True),
+        FieldSpec('start_capital', 'Capitale Iniziale', float, 0.0),
+        FieldSpec('cash_income', 'Incasso Contante', float, 0.0),
+        FieldSpec('coin_income', 'Incasso Moneta', float, 0.0),
+        FieldSpec('card_gross', 'Lordo Bancomat', float, 0.0),
+        FieldSpec('card_percent_fee', 'Percentuale Bancomat', float, 1.95),
+        FieldSpec('card_fixed_fee', 'Costo Fisso Bancomat', float, 0.15),
+        FieldSpec('satispay_gross', 'Lordo Satispay', float, 0.0),
+        FieldSpec('satispay_percent_fee', 'Percentuale Satispay', float, 1.0),
+        FieldSpec('satispay_fixed_fee', 'Costo Fisso Satispay', float, 0.0),
+        FieldSpec('notes', 'Note'),
+    ],
+    'suppliers': [
+        FieldSpec('name', 'Nome Fornitore', required=True),
+        FieldSpec('notes', 'Note'),
+    ],
+    'purchases': [
+        FieldSpec('date', DATE_LABEL, parse_date, required=True),
+        FieldSpec('supplier_name', 'Nome Fornitore', required=True),
+        FieldSpec('description', 'Descrizione'),
+        FieldSpec('cash_payment', 'Pagamento Contante', float, 0.0),
+        FieldSpec('bank_payment', 'Pagamento Bancario', float, 0.0),
+        FieldSpec('notes', 'Note'),
+    ],
+}
+
+RowConverter = Callable[[List[str]], Dict[str, Any]]
+
+
+def compile_converter(import_type: str, mapping: Dict[str, Optional[int]],
+                      parsers: Optional[Dict[str, Callable[[str], Any]]] = None) -> RowConverter:
+    """
+    Risolve la mappatura colonne una volta sola e restituisce il convertitore di righe.
+    
+    Args:
+        import_type: 'sales', 'suppliers' o 'purchases'
+        mapping: Campo -> indice della colonna CSV (None o assente = non mappato)
+        parsers: Conversioni che sostituiscono quelle dei campi (es. DateParser.parse)
+    
+    Returns:
+        Funzione che converte una riga CSV nel dizionario da scrivere
+        (ValueError se un valore non è valido o manca un campo obbligatorio)
+    """
+    if import_type not in FIELD_MAPPINGS:
+        raise ValueError(f"Tipo di importazione sconosciuto: {import_type}")
+    
+    parsers = parsers or {}
+    plan = tuple(
+        (spec.key, mapping.get(spec.key), parsers.get(spec.key, spec.parse),
+         spec.default, spec.required)
+        for spec in FIELD_MAPPINGS[import_type]
+    )
+    
+    def convert(row: List[str]) -> Dict[str, Any]:
+        data = {}
+        size = len(row)
+        for key, index, parse, default, required in plan:
+            value = row[index].strip() if index is not None and index < size else ''
+            if value:
+                data[key] = parse(value)
+            elif required:
+                raise ValueError(f"Campo obbligatorio mancante: {key}")
+            else:
+                data[key] = default
+        return data
+    
+    return convert
+
+
+def auto_mapping(import_type: str, headers: List[str]) -> Dict[str, Optional[int]]:
+    """
+    Abbina le colonne ai campi dal nome dell'intestazione.
+    
+    Un'intestazione corrisponde a un campo se è uguale (senza distinzione
+    tra maiuscole e minuscole) alla chiave o all'etichetta del campo, anche
+    senza la parte tra parentesi (es. "Data").
+    
+    Returns:
+        Campo -> indice della colonna (solo i campi trovati)
+    """
+    names = {}
+    for spec in FIELD_MAPPINGS[import_type]:
+        for name in (spec.key, spec.label, spec.label.split('(')[0]):
+            names.setdefault(' '.join(name.lower().split()), spec.key)
+    
+    mapping = {}
+    for index, header in enumerate(headers):
+        key = names.get(' '.join(header.lower().split()))
+        if key is not None:
+            mapping.setdefault(key, index)
+    return mapping
+
+
+def sniff_delimiter(sample: str) -> str:
+    """Riconosce il delimitatore da un campione del file (default: virgola)"""
+    # Solo righe complete: l'ultima del campione può essere troncata
+    if '\n' in sample:
+        sample = sample[:sample.rindex('\n')]
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+    except csv.Error:
+        return ','
+
+
+def read_preview(file_path: str, rows: int = 5) -> Tuple[str, List[List[str]]]:
+    """
+    Legge solo l'intestazione e le prime righe del file.
+    
+    Returns:
+        (delimitatore, righe lette compresa l'intestazione)
+    """
+    with open(file_path, 'r', encoding=ENCODING, newline='') as file:
+        delimiter = sniff_delimiter(file.read(SNIFF_SAMPLE_SIZE))
+        file.seek(0)
+        return delimiter, list(islice(csv.reader(file, delimiter=delimiter), rows + 1))
+
+
+def checkpoint_key(file_path: str, import_type: str, mapping: Dict[str, Optional[int]],
+                   delimiter: str, has_header: bool = True) -> str:
+    """
+    Chiave del punto di ripresa di un'importazione.
+    
+    Comprende dimensione e data di modifica del file: se il file cambia,
+    l'importazione ricomincia da capo invece di saltare righe diverse.
+    """
+    stat = os.stat(file_path)
+    identity = [
+        os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns,
+        import_type, sorted(mapping.items()), delimiter, has_header,
+    ]
+    return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+
+@dataclass
+class ImportResult:
+    """Esito di un'importazione"""
+    
+    imported: int = 0
+    error_count: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (riga del file, errore)
+    resumed_from: int = 0  # Record del file già importati in un'esecuzione precedente
+    date_format: Optional[str] = None  # Formato delle date riconosciuto (es. 'DD/MM/YYYY')
+    
+    def add_error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+class CSVImportCancelled(Exception):
+    """Importazione annullata: i blocchi già scritti restano nel database"""
+
+
+class CSVImporter:
+    """
+    Importa un file CSV a blocchi.
+    
+    Per ogni blocco di batch_size righe: conversione con il convertitore
+    compilato, risoluzione dei fornitori in memoria (SupplierResolver) e
+    scrittura con executemany in una sola transazione. Se la scrittura di
+    un blocco fallisce, le righe vengono riscritte una per una (savepoint)
+    per isolare quelle con errori.
+    
+    Nella transazione di ogni blocco viene aggiornato il punto di ripresa
+    (csv_import_checkpoints): rieseguendo la stessa importazione, i record
+    già scritti vengono saltati senza convertirli.
+    """
+    
+    def __init__(self, connection, import_type: str, mapping: Dict[str, Optional[int]],
+                 delimiter: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            connection: Connessione del thread che esegue l'importazione
+            import_type: 'sales', 'suppliers' o 'purchases'
+            mapping: Campo -> indice della colonna CSV
+            delimiter: Delimitatore (None = riconosciuto dal file)
+            batch_size: Righe per transazione
+        """
+        self.connection = connection
+        self.import_type = import_type
+        self.mapping = dict(mapping)
+        self.date_parser = DateParser()
+        self.convert = compile_converter(import_type, mapping, {'date': self.date_parser.parse})
+        self.delimiter = delimiter
+        self.batch_size = batch_size
+        
+        self.sales_repo = SalesRepository(connection)
+        self.suppliers_repo = SuppliersRepository(connection)
+        self.purchases_repo = PurchasesRepository(connection)
+        self.checkpoints = CSVImportCheckpointsRepository(connection)
+        self.suppliers = SupplierResolver(self.suppliers_repo)
+        
+        self._writers = {
+            'sales': self._write_sales,
+            'suppliers': self._write_suppliers,
+            'purchases': self._write_purchases,
+        }
+    
+    def run(self, file_path: str, has_header: bool = True,
+            on_progress: Optional[Callable[[int, int], None]] = None,
+            cancel_event: Optional[threading.Event] = None,
+            resume: bool = True) -> ImportResult:
+        """
+        Importa il file.
+        
+        Args:
+            file_path: File CSV
+            has_header: La prima riga è l'intestazione
+            on_progress: Chiamata dopo ogni blocco con (byte letti, dimensione file)
+            cancel_event: Evento che interrompe l'importazione tra un blocco e l'altro
+            resume: Riprende dal punto salvato da un'esecuzione precedente
+                (False = ricomincia da capo)
+        
+        Raises:
+            CSVImportCancelled: se l'importazione viene annullata (il punto
+                di ripresa resta salvato)
+        """
+        result = ImportResult()
+        
+        with open(file_path, 'rb') as raw:
+            total_bytes = raw.seek(0, io.SEEK_END)
+            raw.seek(0)
+            text = io.TextIOWrapper(raw, encoding=ENCODING, newline='')
+            
+            delimiter = self.delimiter
+            if delimiter is None:
+                delimiter = sniff_delimiter(text.read(SNIFF_SAMPLE_SIZE))
+                text.seek(0)
+            
+            result.date_format = self._detect_date_format(text, delimiter, has_header)
+            
+            key = checkpoint_key(file_path, self.import_type, self.mapping, delimiter, has_header)
+            checkpoint = self.checkpoints.get(key) if resume else None
+            if checkpoint is not None:
+                result.resumed_from = checkpoint['rows_read']
+                result.imported = checkpoint['imported']
+                result.error_count = checkpoint['error_count']
+            
+            reader = csv.reader(text, delimiter=delimiter)
+            for batch, rows_read in self._iter_batches(reader, has_header, result.resumed_from):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CSVImportCancelled("Importazione annullata")
+                
+                self._import_batch(batch, result, key, file_path, rows_read)
+                if on_progress:
+                    on_progress(raw.tell(), total_bytes)
+        
+        self.checkpoints.delete(key)
+        return result
+    
+    def _detect_date_format(self, text, delimiter: str, has_header: bool) -> Optional[str]:
+        """Riconosce il formato delle date dalle prime DATE_SAMPLE_ROWS righe del file"""
+        index = self.mapping.get('date')
+        if index is None:
+            return None
+        
+        start = int(has_header)
+        sample = islice(csv.reader(text, delimiter=delimiter), start, start + DATE_SAMPLE_ROWS)
+        date_format = self.date_parser.detect(row[index] for row in sample if index < len(row))
+        text.seek(0)
+        return date_format.name if date_format else None
+    
+    def _iter_batches(self, reader, has_header: bool,
+                      start: int = 0) -> Iterator[Tuple[List[Tuple[int, List[str]]], int]]:
+        """
+        Blocchi di (numero riga, valori) saltando intestazione e righe vuote.
+        
+        Args:
+            reader: csv.reader del file
+            has_header: La prima riga è l'intestazione
+            start: Record da saltare (punto di ripresa, intestazione compresa)
+        
+        Yields:
+            (blocco, record del file letti fino alla fine del blocco)
+        """
+        rows_read = sum(1 for _ in islice(reader, start or int(has_header)))
+        
+        while True:
+            batch = []
+            for row in reader:
+                rows_read += 1
+                if any(value.strip() for value in row):
+                    batch.append((reader.line_num, row))
+                    if len(batch) == self.batch_size:
+                        break
+            if not batch:
+                return
+            yield batch, rows_read
+    
+    def _import_batch(self, batch: List[Tuple[int, List[str]]], result: ImportResult,
+                      key: str, file_path: str, rows_read: int):
+        """Converte e scrive un blocco e il punto di ripresa in un'unica transazione"""
+        records = []
+        for line, row in batch:
+            try:
+                records.append((line, self.convert(row)))
+            except (ValueError, TypeError) as e:
+                result.add_error(line, str(e))
+        
+        write = self._writers[self.import_type]
+        try:
+            with self.connection.transaction():
+                if records:
+                    write([data for _, data in records])
+                self.checkpoints.save(key, file_path, self.import_type, rows_read,
+                                      result.imported + len(records), result.error_count)
+            result.imported += len(records)
+            self.suppliers.commit()
+            return
+        except Exception:
+            # I fornitori creati nella transazione annullata non esistono più
+            self.suppliers.rollback()
+        
+        # Riga per riga per trovare quelle che il database rifiuta
+        try:
+            with self.connection.transaction():
+                for line, data in records:
+                    mark = self.suppliers.mark()
+                    try:
+                        with self.connection.transaction():
+                            write([data])
+                        result.imported += 1
+                    except Exception as e:
+                        self.suppliers.rollback(mark)
+                        result.add_error(line, str(e))
+                self.checkpoints.save(key, file_path, self.import_type, rows_read,
+                                      result.imported, result.error_count)
+        except Exception:
+            self.suppliers.rollback()
+            raise
+        self.suppliers.commit()
+    
+    def _write_sales(self, rows: List[Dict[str, Any]]):
+        """Vendite: una riga per data, quelle esistenti vengono aggiornate"""
+        self.sales_repo.bulk_upsert(rows)
+    
+    def _write_suppliers(self, rows: List[Dict[str, Any]]):
+        """Fornitori: vengono creati solo quelli che non esistono (anche come nome alternativo)"""
+        self.suppliers.create(rows)
+    
+    def _write_purchases(self, rows: List[Dict[str, Any]]):
+        """Acquisti: i fornitori mancanti vengono creati, poi gli acquisti in blocco"""
+        supplier_ids = self.suppliers.resolve(row['supplier_name'] for row in rows)
+        
+        purchases = []
+        for row in rows:
+            purchase = dict(row)
+            purchase['supplier_id'] = supplier_ids[purchase.pop('supplier_name')]
+            purchases.append(purchase)
+        self.purchases_repo.bulk_create(purchases)
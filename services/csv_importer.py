@@ -2,31 +2,90 @@
 Servizio per l'importazione di dati da file CSV.
 """
 
-import csv
 import os
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from typing import Dict, Optional
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
     QFileDialog, QTableWidget, QTableWidgetItem, QComboBox,
     QMessageBox, QProgressBar, QGroupBox, QFormLayout
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from database.repository import CSVImportCheckpointsRepository
+from services.csv_import_engine import (
+    FIELD_MAPPINGS, CSVImportCancelled, CSVImporter, checkpoint_key, read_preview
+)
+
+
+class CSVImportWorker(QThread):
+    """Worker thread per l'importazione di un file CSV"""
+    
+    finished = pyqtSignal(object)  # ImportResult
+    error = pyqtSignal(str)
+    progress = pyqtSignal(int)  # Millesimi del file letto
+    cancelled = pyqtSignal()
+    
+    # Intervallo minimo tra due aggiornamenti della barra di avanzamento (secondi)
+    PROGRESS_INTERVAL = 0.1
+    
+    def __init__(self, db, import_type, mapping, delimiter, file_path, resume=True):
+        super().__init__()
+        self.db = db
+        self.import_type = import_type
+        self.mapping = mapping
+        self.delimiter = delimiter
+        self.file_path = file_path
+        self.resume = resume
+        self.cancel_event = threading.Event()
+        self._last_progress = 0.0
+    
+    def cancel(self):
+        """Richiede l'interruzione (i blocchi già scritti restano nel database)"""
+        self.cancel_event.set()
+    
+    def run(self):
+        try:
+            importer = CSVImporter(
+                self.db.get_connection(), self.import_type, self.mapping, self.delimiter
+            )
+            result = importer.run(
+                self.file_path, on_progress=self.on_progress,
+                cancel_event=self.cancel_event, resume=self.resume
+            )
+            self.finished.emit(result)
+        except CSVImportCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            # Connessione aperta da questo thread
+            self.db.manager.close_thread_connection()
+    
+    def on_progress(self, bytes_read: int, total_bytes: int):
+        """Emette l'avanzamento al più ogni PROGRESS_INTERVAL secondi"""
+        now = time.monotonic()
+        if now - self._last_progress < self.PROGRESS_INTERVAL and bytes_read < total_bytes:
+            return
+        self._last_progress = now
+        self.progress.emit(bytes_read * 1000 // max(total_bytes, 1))
 
 
 class CSVImportDialog(QDialog):
     """Dialog per l'importazione di dati da CSV"""
     
-    def __init__(self, parent, sales_repo, suppliers_repo, purchases_repo):
+    def __init__(self, parent, sales_repo, suppliers_repo, purchases_repo, db):
         super().__init__(parent)
         
         self.sales_repo = sales_repo
         self.suppliers_repo = suppliers_repo
         self.purchases_repo = purchases_repo
+        self.db = db
         
         self.csv_file_path = None
-        self.csv_data = []
         self.csv_headers = []
+        self.delimiter = None
+        self.import_worker = None
         
         self.init_ui()
     
@@ -118,45 +177,32 @@ class CSVImportDialog(QDialog):
             self.load_csv_preview()
     
     def load_csv_preview(self):
-        """Carica l'anteprima del file CSV"""
+        """Carica l'anteprima del file CSV (solo le prime righe)"""
         try:
-            with open(self.csv_file_path, 'r', encoding='utf-8-sig') as file:
-                # Prova a rilevare il delimitatore
-                sample = file.read(1024)
-                file.seek(0)
-                
-                sniffer = csv.Sniffer()
-                delimiter = sniffer.sniff(sample).delimiter
-                
-                reader = csv.reader(file, delimiter=delimiter)
-                
-                # Leggi i dati
-                self.csv_data = list(reader)
-                
-                if not self.csv_data:
-                    QMessageBox.warning(self, 'Errore', 'Il file CSV è vuoto.')
-                    return
-                
-                # Prima riga come headers
-                self.csv_headers = self.csv_data[0]
-                
-                # Mostra anteprima (prime 5 righe)
-                preview_data = self.csv_data[:6]  # Header + 5 righe
-                
-                self.preview_table.setRowCount(len(preview_data))
-                self.preview_table.setColumnCount(len(self.csv_headers))
-                self.preview_table.setHorizontalHeaderLabels([f"Col {i+1}" for i in range(len(self.csv_headers))])
-                
-                for row, row_data in enumerate(preview_data):
-                    for col, cell_data in enumerate(row_data):
-                        item = QTableWidgetItem(str(cell_data))
-                        if row == 0:  # Header
-                            item.setBackground(Qt.lightGray)
-                        self.preview_table.setItem(row, col, item)
-                
-                self.create_mapping_controls()
-                self.btn_import.setEnabled(True)
-                
+            self.delimiter, preview_data = read_preview(self.csv_file_path)
+            
+            if not preview_data:
+                QMessageBox.warning(self, 'Errore', 'Il file CSV è vuoto.')
+                return
+            
+            # Prima riga come headers
+            self.csv_headers = preview_data[0]
+            
+            # Mostra anteprima (header + 5 righe)
+            self.preview_table.setRowCount(len(preview_data))
+            self.preview_table.setColumnCount(len(self.csv_headers))
+            self.preview_table.setHorizontalHeaderLabels([f"Col {i+1}" for i in range(len(self.csv_headers))])
+            
+            for row, row_data in enumerate(preview_data):
+                for col, cell_data in enumerate(row_data):
+                    item = QTableWidgetItem(str(cell_data))
+                    if row == 0:  # Header
+                        item.setBackground(Qt.lightGray)
+                    self.preview_table.setItem(row, col, item)
+            
+            self.create_mapping_controls()
+            self.btn_import.setEnabled(True)
+            
         except Exception as e:
             QMessageBox.critical(self, 'Errore', f'Errore durante la lettura del file:\n{str(e)}')
     
@@ -168,182 +214,130 @@ class CSVImportDialog(QDialog):
         
         import_type = self.import_type_combo.currentData()
         
-        # Definisci i campi richiesti per ogni tipo
-        field_mappings = {
-            'sales': [
-                ('date', 'Data (YYYY-MM-DD o DD/MM/YYYY)'),
-                ('start_capital', 'Capitale Iniziale'),
-                ('cash_income', 'Incasso Contante'),
-                ('coin_income', 'Incasso Moneta'),
-                ('card_gross', 'Lordo Bancomat'),
-                ('card_percent_fee', 'Percentuale Bancomat'),
-                ('card_fixed_fee', 'Costo Fisso Bancomat'),
-                ('satispay_gross', 'Lordo Satispay'),
-                ('satispay_percent_fee', 'Percentuale Satispay'),
-                ('satispay_fixed_fee', 'Costo Fisso Satispay'),
-                ('notes', 'Note')
-            ],
-            'suppliers': [
-                ('name', 'Nome Fornitore'),
-                ('notes', 'Note')
-            ],
-            'purchases': [
-                ('date', 'Data (YYYY-MM-DD o DD/MM/YYYY)'),
-                ('supplier_name', 'Nome Fornitore'),
-                ('description', 'Descrizione'),
-                ('cash_payment', 'Pagamento Contante'),
-                ('bank_payment', 'Pagamento Bancario'),
-                ('notes', 'Note')
-            ]
-        }
-        
-        fields = field_mappings.get(import_type, [])
+        fields = FIELD_MAPPINGS.get(import_type, [])
         
         # Crea combo per ogni campo
         self.field_combos = {}
         
-        for field_key, field_label in fields:
+        for spec in fields:
             combo = QComboBox()
             combo.addItem('-- Non mappare --', None)
             
             for i, header in enumerate(self.csv_headers):
                 combo.addItem(f"Colonna {i+1}: {header}", i)
             
-            self.field_combos[field_key] = combo
-            self.mapping_layout.addRow(f'{field_label}:', combo)
+            self.field_combos[spec.key] = combo
+            self.mapping_layout.addRow(f'{spec.label}:', combo)
     
     def import_data(self):
-        """Importa i dati dal CSV"""
+        """Avvia l'importazione in un thread separato (a blocchi, con ripresa)"""
         import_type = self.import_type_combo.currentData()
+        mapping = self.get_mapping()
         
         try:
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setMaximum(len(self.csv_data) - 1)  # Escludi header
-            
-            imported_count = 0
-            error_count = 0
-            
-            for row_idx, row_data in enumerate(self.csv_data[1:], 1):  # Salta header
-                self.progress_bar.setValue(row_idx - 1)
-                
-                try:
-                    if import_type == 'sales':
-                        self.import_sale_row(row_data)
-                    elif import_type == 'suppliers':
-                        self.import_supplier_row(row_data)
-                    elif import_type == 'purchases':
-                        self.import_purchase_row(row_data)
-                    
-                    imported_count += 1
-                    
-                except Exception as e:
-                    print(f"Errore riga {row_idx}: {e}")
-                    error_count += 1
-            
-            self.progress_bar.setVisible(False)
-            
-            # Mostra risultato
-            message = f"Importazione completata!\n\n"
-            message += f"Righe importate: {imported_count}\n"
-            if error_count > 0:
-                message += f"Righe con errori: {error_count}"
-            
-            QMessageBox.information(self, 'Importazione Completata', message)
-            self.accept()
-            
+            resume = self.ask_resume(import_type, mapping)
         except Exception as e:
-            self.progress_bar.setVisible(False)
-            QMessageBox.critical(self, 'Errore', f'Errore durante l\'importazione:\n{str(e)}')
-    
-    def get_mapped_value(self, field_key: str, row_data: List[str]) -> Optional[str]:
-        """Ottiene il valore mappato per un campo"""
-        combo = self.field_combos.get(field_key)
-        if not combo:
-            return None
+            QMessageBox.critical(self, 'Errore', f'Errore durante la lettura del file:\n{str(e)}')
+            return
+        if resume is None:
+            return
         
-        col_index = combo.currentData()
-        if col_index is None or col_index >= len(row_data):
-            return None
+        self.set_importing(True)
         
-        return row_data[col_index].strip()
+        self.import_worker = CSVImportWorker(
+            self.db, import_type, mapping, self.delimiter, self.csv_file_path, resume
+        )
+        self.import_worker.progress.connect(self.progress_bar.setValue)
+        self.import_worker.finished.connect(self.on_import_finished)
+        self.import_worker.error.connect(self.on_import_error)
+        self.import_worker.cancelled.connect(self.on_import_cancelled)
+        self.import_worker.start()
+    
+    def ask_resume(self, import_type: str, mapping: Dict[str, Optional[int]]) -> Optional[bool]:
+        """
+        Chiede se riprendere un'importazione interrotta dello stesso file.
+        
+        Returns:
+            True per riprendere, False per ricominciare, None se annullato
+        """
+        key = checkpoint_key(self.csv_file_path, import_type, mapping, self.delimiter)
+        checkpoint = CSVImportCheckpointsRepository(self.sales_repo.connection).get(key)
+        if checkpoint is None:
+            return False
+        
+        reply = QMessageBox.question(
+            self,
+            'Riprendi Importazione',
+            f"Un'importazione di questo file è stata interrotta "
+            f"({checkpoint['imported']} righe già importate).\n\n"
+            f"Riprendere dal punto in cui si è fermata?\n"
+            f"(No = ricomincia da capo)",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+            QMessageBox.Yes
+        )
+        if reply == QMessageBox.Cancel:
+            return None
+        return reply == QMessageBox.Yes
     
-    def parse_date(self, date_str: str) -> str:
-        """Converte una data in formato YYYY-MM-DD"""
-        if not date_str:
-            return datetime.now().strftime('%Y-%m-%d')
-        
-        # Prova diversi formati
-        formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']
-        
-        for fmt in formats:
-            try:
-                date_obj = datetime.strptime(date_str, fmt)
-                return date_obj.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
-        
-        # Se nessun formato funziona, usa oggi
-        return datetime.now().strftime('%Y-%m-%d')
+    def set_importing(self, importing: bool):
+        """Abilita o disabilita i controlli durante l'importazione"""
+        self.btn_browse.setEnabled(not importing)
+        self.btn_import.setEnabled(not importing)
+        self.import_type_combo.setEnabled(not importing)
+        for combo in self.field_combos.values():
+            combo.setEnabled(not importing)
+        
+        self.progress_bar.setVisible(importing)
+        self.progress_bar.setMaximum(1000)  # Millesimi del file letto
+        self.progress_bar.setValue(0)
+        
+        self.btn_cancel.setEnabled(True)
+        self.btn_cancel.setText('⏹ Interrompi' if importing else '❌ Annulla')
     
-    def import_sale_row(self, row_data: List[str]):
-        """Importa una riga di vendita"""
-        date_str = self.parse_date(self.get_mapped_value('date', row_data))
-        
-        sale_data = {
-            'date': date_str,
-            'start_capital': float(self.get_mapped_value('start_capital', row_data) or 0),
-            'cash_income': float(self.get_mapped_value('cash_income', row_data) or 0),
-            'coin_income': float(self.get_mapped_value('coin_income', row_data) or 0),
-            'card_gross': float(self.get_mapped_value('card_gross', row_data) or 0),
-            'card_percent_fee': float(self.get_mapped_value('card_percent_fee', row_data) or 1.95),
-            'card_fixed_fee': float(self.get_mapped_value('card_fixed_fee', row_data) or 0.15),
-            'satispay_gross': float(self.get_mapped_value('satispay_gross', row_data) or 0),
-            'satispay_percent_fee': float(self.get_mapped_value('satispay_percent_fee', row_data) or 1.0),
-            'satispay_fixed_fee': float(self.get_mapped_value('satispay_fixed_fee', row_data) or 0),
-            'notes': self.get_mapped_value('notes', row_data) or ''
-        }
-        
-        # Controlla se esiste già
-        existing = self.sales_repo.get_by_date(date_str)
-        if existing:
-            self.sales_repo.update(date_str, sale_data)
-        else:
-            self.sales_repo.create(sale_data)
+    def on_import_finished(self, result):
+        """Callback quando l'importazione è completata"""
+        self.import_worker = None
+        self.set_importing(False)
+        
+        for line, error in result.errors:
+            print(f"Errore riga {line}: {error}")
+        
+        # Mostra risultato
+        message = f"Importazione completata!\n\n"
+        message += f"Righe importate: {result.imported}\n"
+        if result.error_count > 0:
+            message += f"Righe con errori: {result.error_count}"
+        
+        QMessageBox.information(self, 'Importazione Completata', message)
+        self.accept()
+    
+    def on_import_error(self, error_msg: str):
+        """Callback in caso di errore durante l'importazione"""
+        self.import_worker = None
+        self.set_importing(False)
+        QMessageBox.critical(self, 'Errore', f'Errore durante l\'importazione:\n{error_msg}')
+    
+    def on_import_cancelled(self):
+        """Callback quando l'importazione viene interrotta"""
+        self.import_worker = None
+        self.set_importing(False)
+        QMessageBox.information(
+            self,
+            'Importazione Interrotta',
+            'Importazione interrotta. Le righe già importate sono state salvate:\n'
+            'importando di nuovo lo stesso file si riprenderà dal punto in cui si è fermata.'
+        )
+        super().reject()
     
-    def import_supplier_row(self, row_data: List[str]):
-        """Importa una riga di fornitore"""
-        name = self.get_mapped_value('name', row_data)
-        if not name:
-            raise ValueError("Nome fornitore mancante")
-        
-        # Controlla se esiste già
-        existing = self.suppliers_repo.get_by_name(name)
-        if not existing:
-            notes = self.get_mapped_value('notes', row_data) or ''
-            self.suppliers_repo.create(name, notes)
+    def reject(self):
+        """Annulla o chiusura: se è in corso un'importazione, la interrompe"""
+        if self.import_worker is not None:
+            self.import_worker.cancel()
+            self.btn_cancel.setEnabled(False)
+            self.btn_cancel.setText('Interruzione...')
+            return
+        super().reject()
     
-    def import_purchase_row(self, row_data: List[str]):
-        """Importa una riga di acquisto"""
-        date_str = self.parse_date(self.get_mapped_value('date', row_data))
-        supplier_name = self.get_mapped_value('supplier_name', row_data)
-        
-        if not supplier_name:
-            raise ValueError("Nome fornitore mancante")
-        
-        # Trova o crea il fornitore
-        supplier = self.suppliers_repo.get_by_name(supplier_name)
-        if not supplier:
-            supplier_id = self.suppliers_repo.create(supplier_name)
-        else:
-            supplier_id = supplier['id']
-        
-        purchase_data = {
-            'date': date_str,
-            'supplier_id': supplier_id,
-            'description': self.get_mapped_value('description', row_data) or '',
-            'cash_payment': float(self.get_mapped_value('cash_payment', row_data) or 0),
-            'bank_payment': float(self.get_mapped_value('bank_payment', row_data) or 0),
-            'notes': self.get_mapped_value('notes', row_data) or ''
-        }
-        
-        self.purchases_repo.create(purchase_data)
+    def get_mapping(self) -> Dict[str, Optional[int]]:
+        """Campo -> indice della colonna scelta (None se non mappato)"""
+        return {key: combo.currentData() for key, combo in self.field_combos.items()}
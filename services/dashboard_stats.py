@@ -0,0 +1,122 @@
+"""
+Servizio per le statistiche della dashboard.
+Legge tutti i valori dai totali precalcolati con un numero fisso di query.
+"""
+
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from database.repository import InvoicesRepository, TotalsRepository
+from models.money import from_cents, to_cents
+
+
+# Giorni mostrati nel grafico andamento vendite
+SERIES_DAYS = 7
+
+# Fornitori mostrati nel grafico distribuzione spese
+TOP_SUPPLIERS = 5
+
+# Tabelle da cui dipendono le statistiche
+STATS_TABLES = ('sales', 'purchases', 'invoices', 'suppliers')
+
+
+@dataclass
+class DashboardStats:
+    """Valori delle card e serie dei grafici della dashboard"""
+    
+    sales_today: float = 0.0
+    sales_month: float = 0.0
+    expenses_month: float = 0.0
+    profit_month: float = 0.0
+    invoices_pending: int = 0
+    active_suppliers: int = 0
+    series_dates: List[datetime] = field(default_factory=list)
+    series_values: List[float] = field(default_factory=list)
+    expense_labels: List[str] = field(default_factory=list)
+    expense_values: List[float] = field(default_factory=list)
+    elapsed: float = 0.0  # Secondi impiegati dalle query
+
+
+class DashboardStatsService:
+    """
+    Calcola le statistiche della dashboard dai totali precalcolati.
+    
+    Le card del mese e la serie degli ultimi giorni arrivano da un'unica
+    lettura di daily_totals (al massimo una quarantina di righe), le spese
+    per fornitore da supplier_monthly_totals: il costo non dipende dalla
+    quantità di vendite e acquisti salvati.
+    """
+    
+    def __init__(self, connection: sqlite3.Connection):
+        self.totals_repo = TotalsRepository(connection)
+        self.invoices_repo = InvoicesRepository(connection)
+    
+    @staticmethod
+    def period(today: Optional[date] = None) -> Tuple[date, date]:
+        """
+        Periodo letto dalle statistiche: mese corrente più gli ultimi giorni del grafico.
+        
+        Returns:
+            (data inizio, data fine)
+        """
+        today = today or date.today()
+        month_start = today.replace(day=1)
+        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        series_start = today - timedelta(days=SERIES_DAYS - 1)
+        return min(month_start, series_start), month_end
+    
+    def get_stats(self, today: Optional[date] = None) -> DashboardStats:
+        """
+        Calcola tutte le statistiche della dashboard.
+        
+        Args:
+            today: Data di riferimento (default: oggi)
+        """
+        started = time.perf_counter()
+        
+        today = today or date.today()
+        month_start = today.replace(day=1)
+        series_start = today - timedelta(days=SERIES_DAYS - 1)
+        period_start, month_end = self.period(today)
+        
+        # Vendite lorde (contanti + lordo carte) per giorno, in centesimi
+        daily_totals = self.totals_repo.get_daily_totals(
+            period_start.isoformat(), month_end.isoformat()
+        )
+        gross_by_date = {}
+        sales_month = expenses_month = 0
+        for day in daily_totals:
+            gross = to_cents(day['takings']) + to_cents(day['card_fees']) + to_cents(day['satispay_fees'])
+            gross_by_date[day['date']] = gross
+            if day['date'] >= month_start.isoformat():
+                sales_month += gross
+                expenses_month += to_cents(day['purchases_total'])
+        
+        stats = DashboardStats(
+            sales_today=from_cents(gross_by_date.get(today.isoformat(), 0)),
+            sales_month=from_cents(sales_month),
+            expenses_month=from_cents(expenses_month),
+            profit_month=from_cents(sales_month - expenses_month),
+        )
+        
+        for offset in range(SERIES_DAYS):
+            day = series_start + timedelta(days=offset)
+            stats.series_dates.append(datetime.combine(day, datetime.min.time()))
+            stats.series_values.append(from_cents(gross_by_date.get(day.isoformat(), 0)))
+        
+        # Spese del mese per fornitore (già ordinate per totale)
+        supplier_totals = self.totals_repo.get_supplier_totals(
+            month_start.isoformat(), month_end.isoformat()
+        )
+        stats.active_suppliers = len(supplier_totals)
+        for totals in supplier_totals:
+            if totals['total'] > 0 and len(stats.expense_labels) < TOP_SUPPLIERS:
+                stats.expense_labels.append(totals['supplier_name'])
+                stats.expense_values.append(totals['total'])
+        
+        stats.invoices_pending = self.invoices_repo.count_pending_ocr()
+        
+        stats.elapsed = time.perf_counter() - started
+        return stats
@@ -0,0 +1,137 @@
+"""
+Conversione veloce delle date dei file importati.
+Il formato di un file viene riconosciuto una sola volta da un campione di
+valori; ogni data viene poi convertita con un'espressione regolare
+precompilata (senza datetime.strptime) e i valori ripetuti sono letti da
+una memoria. Le date non valide generano un errore invece di essere
+sostituite con la data di oggi.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Pattern
+
+
+# Valori ricordati da DateParser (oltre questo numero la memoria viene svuotata)
+MEMO_SIZE = 4096
+
+# Eventuale orario dopo la data (es. "2024-03-01 08:30:00"), ignorato;
+# altro testo dopo la data la rende non valida
+TIME_SUFFIX = r'(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?'
+
+
+@dataclass(frozen=True)
+class DateFormat:
+    """Formato di data: nome, espressione e posizione dei gruppi anno/mese/giorno"""
+    
+    name: str
+    pattern: Pattern
+    year: int
+    month: int
+    day: int
+    
+    def convert(self, value: str) -> Optional[str]:
+        """Converte il valore in YYYY-MM-DD (None se non è in questo formato o non esiste)"""
+        match = self.pattern.fullmatch(value)
+        if match is None:
+            return None
+        groups = match.groups()
+        try:
+            return date(int(groups[self.year]), int(groups[self.month]), int(groups[self.day])).isoformat()
+        except ValueError:
+            return None
+
+
+def _date_format(name: str, regex: str, year: int, month: int, day: int) -> DateFormat:
+    return DateFormat(name, re.compile(regex + TIME_SUFFIX), year, month, day)
+
+
+# Formati accettati, in ordine di preferenza
+DATE_FORMATS = (
+    _date_format('YYYY-MM-DD', r'(\d{4})-(\d{1,2})-(\d{1,2})', 0, 1, 2),
+    _date_format('DD/MM/YYYY', r'(\d{1,2})/(\d{1,2})/(\d{4})', 2, 1, 0),
+    _date_format('DD-MM-YYYY', r'(\d{1,2})-(\d{1,2})-(\d{4})', 2, 1, 0),
+    _date_format('YYYY/MM/DD', r'(\d{4})/(\d{1,2})/(\d{1,2})', 0, 1, 2),
+    _date_format('DD.MM.YYYY', r'(\d{1,2})\.(\d{1,2})\.(\d{4})', 2, 1, 0),
+)
+
+
+def parse_date(value: str) -> str:
+    """
+    Converte una data in formato YYYY-MM-DD provando tutti i formati.
+    
+    Raises:
+        ValueError: se la data è vuota o non valida
+    """
+    for date_format in DATE_FORMATS:
+        result = date_format.convert(value.strip())
+        if result is not None:
+            return result
+    raise ValueError(f"Data non valida: '{value}'")
+
+
+class DateParser:
+    """
+    Converte le date di un file con il formato riconosciuto dal campione.
+    
+    Il formato riconosciuto viene provato per primo; gli altri restano
+    come riserva per i file con formati misti. Da usare in un solo thread.
+    """
+    
+    def __init__(self, formats: Iterable[DateFormat] = DATE_FORMATS):
+        self._all_formats = tuple(formats)
+        self.formats: List[DateFormat] = list(self._all_formats)
+        self.format: Optional[DateFormat] = None
+        self._memo: Dict[str, str] = {}
+    
+    def detect(self, samples: Iterable[str]) -> Optional[DateFormat]:
+        """
+        Riconosce il formato che converte più valori del campione.
+        
+        A parità vince il formato che precede in DATE_FORMATS.
+        
+        Returns:
+            Formato riconosciuto (None se nessun valore è una data)
+        """
+        counts = [0] * len(self._all_formats)
+        for value in samples:
+            value = value.strip()
+            if not value:
+                continue
+            for index, date_format in enumerate(self._all_formats):
+                if date_format.convert(value) is not None:
+                    counts[index] += 1
+        
+        best = max(range(len(counts)), key=counts.__getitem__, default=None)
+        self.formats = list(self._all_formats)
+        if best is None or counts[best] == 0:
+            self.format = None
+        else:
+            self.format = self.formats.pop(best)
+            self.formats.insert(0, self.format)
+        self._memo.clear()
+        return self.format
+    
+    def parse(self, value: str) -> str:
+        """
+        Converte una data in formato YYYY-MM-DD.
+        
+        Raises:
+            ValueError: se la data è vuota o non valida
+        """
+        result = self._memo.get(value)
+        if result is not None:
+            return result
+        
+        for date_format in self.formats:
+            result = date_format.convert(value)
+            if result is not None:
+                break
+        else:
+            raise ValueError(f"Data non valida: '{value}'")
+        
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+        self._memo[value] = result
+        return result
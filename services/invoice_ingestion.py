@@ -0,0 +1,456 @@
+"""
+Importazione automatica di fatture da una cartella.
+I file vengono accodati nella tabella invoice_jobs (deduplicati per hash),
+riconosciuti in parallelo con OCREngine e inseriti in blocco nelle
+fatture. La coda è nel database: dopo una chiusura o un crash
+l'elaborazione riprende dai file non ancora importati.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from database.repository import InvoiceJobsRepository, InvoicesRepository, SuppliersRepository
+from models.invoice import InvoiceRecord
+from services.ocr_cache import file_digest
+from services.ocr_engine import OCRCancelledError, OCREngine
+from services.ocr_service import OCRService
+
+
+# Estensioni dei file importati
+SUPPORTED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
+
+# Intervallo (secondi) tra due controlli della cartella sorvegliata
+WATCH_INTERVAL = 30
+
+# File modificati da meno di questi secondi sono ignorati (copia o scansione in corso)
+SETTLE_SECONDS = 2
+
+# Caratteri iniziali del testo in cui cercare il nome del fornitore (intestazione)
+SUPPLIER_HEADER_CHARS = 600
+
+IMPORT_NOTE = 'Importata automaticamente da cartella'
+
+ProgressCallback = Callable[[int, int], None]
+
+
+@dataclass
+class IngestionSummary:
+    """Esito di un'elaborazione della coda"""
+    
+    queued: int = 0     # File nuovi accodati
+    imported: int = 0   # Fatture inserite
+    failed: int = 0     # File non importati (vedi InvoiceJobsRepository.get_failed)
+    cached: int = 0     # File letti dalla cache OCR
+    pending: int = 0    # File rimasti in coda
+
+
+def parse_invoice_date(value: str) -> Optional[str]:
+    """Converte una data estratta (GG/MM/AAAA) nel formato del database (None se non valida)"""
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_amount(value: str) -> float:
+    """
+    Converte un importo estratto in euro ('1.234,56', '1,234.56', '12,50').
+    
+    L'ultimo separatore seguito da due cifre è quello decimale.
+    """
+    digits = re.sub(r'[^\d.,]', '', value or '')
+    if not digits:
+        return 0.0
+    
+    integer, separator, decimals = digits[:-3], digits[-3:-2], digits[-2:]
+    if separator in ('.', ',') and decimals.isdigit():
+        digits = re.sub(r'[.,]', '', integer) + '.' + decimals
+    else:
+        digits = re.sub(r'[.,]', '', digits)
+    
+    try:
+        return float(digits)
+    except ValueError:
+        return 0.0
+
+
+class SupplierMatcher:
+    """
+    Abbina le fatture ai fornitori esistenti.
+    
+    I fornitori vengono letti una sola volta; il nome estratto viene
+    confrontato senza distinzione di maiuscole, spazi e punteggiatura e,
+    se non corrisponde, si cerca un nome di fornitore nell'intestazione
+    del documento con un'unica espressione regolare.
+    """
+    
+    def __init__(self, suppliers: Iterable[Dict[str, Any]]):
+        self._by_name: Dict[str, int] = {}
+        for supplier in suppliers:
+            name = self.normalize(supplier['name'])
+            if name:
+                self._by_name.setdefault(name, supplier['id'])
+        
+        # Nomi più lunghi prima, così 'mia srl' vince su 'mia'
+        names = sorted(self._by_name, key=len, reverse=True)
+        self._pattern = (
+            re.compile(r'\b(' + '|'.join(map(re.escape, names)) + r')\b') if names else None
+        )
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Minuscolo, senza punteggiatura e con spazi singoli"""
+        return ' '.join(re.findall(r'\w+', (text or '').casefold()))
+    
+    def match(self, supplier_name: str, text: str = '') -> Optional[int]:
+        """
+        Restituisce l'id del fornitore della fattura (None se non riconosciuto).
+        
+        Args:
+            supplier_name: Nome estratto da extract_invoice_data
+            text: Testo completo del documento
+        """
+        supplier_id = self._by_name.get(self.normalize(supplier_name))
+        if supplier_id is not None or self._pattern is None:
+            return supplier_id
+        
+        match = self._pattern.search(self.normalize(text[:SUPPLIER_HEADER_CHARS]))
+        return self._by_name[match.group(1)] if match else None
+
+
+class InvoiceIngestionService:
+    """
+    Importa le fatture di una cartella tramite la coda invoice_jobs.
+    
+    scan_folder accoda i file nuovi, process li elabora a blocchi: tutte
+    le pagine di un blocco vanno nel pool OCR insieme e le fatture del
+    blocco vengono inserite con una sola transazione, che segna anche i
+    file come importati. Va usato da un solo thread alla volta (le
+    connessioni sono quelle del thread chiamante).
+    """
+    
+    def __init__(self, db, ocr_service: Optional[OCRService] = None,
+                 ocr_engine: Optional[OCREngine] = None, batch_size: Optional[int] = None):
+        """
+        Args:
+            db: Database
+            ocr_service: Servizio OCR (default: uno nuovo, chiuso da shutdown)
+            ocr_engine: Motore OCR parallelo (default: uno nuovo, chiuso da shutdown)
+            batch_size: File per blocco (default: quattro per processo OCR)
+        """
+        self.db = db
+        self.ocr_service = ocr_service or OCRService()
+        self.ocr_engine = ocr_engine or OCREngine(
+            self.ocr_service.tesseract_path, capabilities=self.ocr_service.capabilities
+        )
+        self._owns_service = ocr_service is None
+        self._owns_engine = ocr_engine is None
+        self.batch_size = batch_size or max(8, self.ocr_engine.max_workers * 4)
+    
+    def scan_folder(self, folder: str, recursive: bool = False,
+                    min_age: float = 0) -> int:
+        """
+        Accoda i file della cartella non ancora importati.
+        
+        I file già accodati con stessa dimensione e data di modifica non
+        vengono riletti; gli altri sono deduplicati per hash del contenuto
+        (per quelli già in coda si aggiornano percorso e data di modifica).
+        
+        Args:
+            folder: Cartella da importare
+            recursive: Include le sottocartelle
+            min_age: Ignora i file modificati da meno di questi secondi
+        
+        Returns:
+            Numero di file accodati
+        """
+        jobs_repo = InvoiceJobsRepository(self.db.get_connection())
+        known = jobs_repo.known_files()
+        now = time.time()
+        
+        files = []
+        seen = set()
+        for path in self._list_files(folder, recursive):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if min_age and now - stat.st_mtime < min_age:
+                continue
+            
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if known.get(path) == signature:
+                continue
+            
+            try:
+                digest = file_digest(path)
+            except OSError:
+                continue
+            if digest not in seen:
+                seen.add(digest)
+                files.append((path, digest) + signature)
+        
+        return jobs_repo.enqueue(files)
+    
+    def process(self, cancel_event: Optional[threading.Event] = None,
+                on_progress: Optional[ProgressCallback] = None) -> IngestionSummary:
+        """
+        Elabora la coda fino a esaurirla.
+        
+        I file rimasti in elaborazione da una sessione precedente vengono
+        ripresi. In caso di annullamento le fatture già riconosciute sono
+        comunque salvate e gli altri file restano in coda.
+        
+        Args:
+            cancel_event: Evento di annullamento
+            on_progress: Chiamata con (file elaborati, file in coda)
+        
+        Raises:
+            OCRCancelledError: se l'elaborazione viene annullata
+        """
+        connection = self.db.get_connection()
+        jobs_repo = InvoiceJobsRepository(connection)
+        jobs_repo.reset_interrupted()
+        matcher = SupplierMatcher(SuppliersRepository(connection).get_all_active())
+        
+        summary = IngestionSummary()
+        total = jobs_repo.count_by_status().get('pending', 0)
+        processed = 0
+        
+        def file_done():
+            nonlocal processed
+            processed += 1
+            if on_progress:
+                on_progress(min(processed, total), total)
+        
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise OCRCancelledError("Importazione annullata")
+                jobs = jobs_repo.claim(self.batch_size)
+                if not jobs:
+                    break
+                
+                self._process_batch(jobs, matcher, summary, cancel_event, file_done)
+        finally:
+            summary.pending = jobs_repo.count_by_status().get('pending', 0)
+        
+        return summary
+    
+    def ingest_folder(self, folder: str, recursive: bool = False,
+                      cancel_event: Optional[threading.Event] = None,
+                      on_progress: Optional[ProgressCallback] = None) -> IngestionSummary:
+        """Accoda i file nuovi della cartella ed elabora la coda"""
+        queued = self.scan_folder(folder, recursive)
+        summary = self.process(cancel_event, on_progress)
+        summary.queued = queued
+        return summary
+    
+    def watch(self, folder: str, cancel_event: threading.Event,
+              interval: float = WATCH_INTERVAL, recursive: bool = False,
+              on_summary: Optional[Callable[[IngestionSummary], None]] = None):
+        """
+        Sorveglia una cartella finché cancel_event non viene impostato.
+        
+        La cartella viene controllata ogni interval secondi (senza
+        dipendenze esterne); i file in copia vengono ignorati finché non
+        smettono di cambiare.
+        
+        Args:
+            on_summary: Chiamata dopo ogni controllo che ha importato o scartato file
+        """
+        while not cancel_event.is_set():
+            queued = self.scan_folder(folder, recursive, min_age=SETTLE_SECONDS)
+            try:
+                summary = self.process(cancel_event)
+            except OCRCancelledError:
+                return
+            summary.queued = queued
+            
+            if on_summary and (summary.imported or summary.failed):
+                on_summary(summary)
+            cancel_event.wait(interval)
+    
+    def shutdown(self):
+        """Chiude pool OCR e cache dei risultati se creati dal servizio"""
+        if self._owns_engine:
+            self.ocr_engine.shutdown()
+        if self._owns_service:
+            self.ocr_service.close()
+    
+    def _process_batch(self, jobs: List[Dict[str, Any]], matcher: SupplierMatcher,
+                       summary: IngestionSummary, cancel_event: Optional[threading.Event],
+                       file_done: Callable[[], None]):
+        """Riconosce i file di un blocco e salva fatture e stato in un'unica transazione"""
+        engine = self.ocr_engine
+        results: Dict[int, Tuple[str, Dict[str, str]]] = {}
+        errors: Dict[int, str] = {}
+        keys: Dict[int, str] = {}
+        to_ocr: Dict[str, Dict[str, Any]] = {}
+        
+        for job in jobs:
+            path = job['file_path']
+            if not os.path.exists(path):
+                errors[job['id']] = 'File non trovato'
+                continue
+            if path in to_ocr:
+                # Stesso percorso con contenuto diverso: vale la versione accodata per ultima
+                errors[to_ocr.pop(path)['id']] = 'File modificato dopo l\'accodamento'
+            
+            keys[job['id']] = self.ocr_service.cache_key(
+                path, engine.language, engine.dpi, job['file_hash']
+            )
+            cached = self.ocr_service.get_cached(keys[job['id']])
+            if cached is not None:
+                results[job['id']] = cached
+                summary.cached += 1
+                file_done()
+            else:
+                to_ocr[path] = job
+        
+        try:
+            for job_id, text, error in self._recognize(list(to_ocr.values()), cancel_event):
+                if error:
+                    errors[job_id] = error
+                elif not text.strip():
+                    errors[job_id] = 'Nessun testo riconosciuto'
+                else:
+                    data = self.ocr_service.extract_invoice_data(text)
+                    self.ocr_service.store_cached(keys[job_id], text, data)
+                    results[job_id] = (text, data)
+                file_done()
+        finally:
+            # Anche se annullato: salva i file completati e rimette in coda gli altri
+            self._save_batch(jobs, results, errors, matcher, summary)
+    
+    def _recognize(self, jobs: List[Dict[str, Any]],
+                   cancel_event: Optional[threading.Event]) -> Iterator[Tuple[int, str, Optional[str]]]:
+        """
+        Restituisce (id, testo, errore) per ogni file, appena tutte le sue pagine sono pronte.
+        
+        Se il blocco si interrompe per un errore (PDF illeggibile, processo
+        OCR terminato), i file non completati vengono ripresi uno per uno
+        così l'errore resta circoscritto al file che lo causa.
+        """
+        if not jobs:
+            return
+        
+        by_path = {job['file_path']: job for job in jobs}
+        pages = defaultdict(list)
+        page_errors: Dict[str, str] = {}
+        completed = set()
+        
+        try:
+            for page in self.ocr_engine.iter_pages(list(by_path), cancel_event):
+                pages[page.file_path].append(page)
+                if page.error and page.file_path not in page_errors:
+                    page_errors[page.file_path] = f"Pagina {page.page + 1}: {page.error}"
+                if len(pages[page.file_path]) < page.page_count:
+                    continue
+                
+                completed.add(page.file_path)
+                job_id = by_path[page.file_path]['id']
+                if page.file_path in page_errors:
+                    yield job_id, '', page_errors[page.file_path]
+                else:
+                    ordered = sorted(pages[page.file_path], key=lambda result: result.page)
+                    yield job_id, '\n\n'.join(result.text for result in ordered if result.text), None
+        except OCRCancelledError:
+            raise
+        except Exception as e:
+            remaining = [job for path, job in by_path.items() if path not in completed]
+            if len(jobs) == 1:
+                for job in remaining:
+                    yield job['id'], '', str(e)
+                return
+            for job in remaining:
+                yield from self._recognize([job], cancel_event)
+    
+    def _save_batch(self, jobs: List[Dict[str, Any]], results: Dict[int, Tuple[str, Dict[str, str]]],
+                    errors: Dict[int, str], matcher: SupplierMatcher, summary: IngestionSummary):
+        """Inserisce le fatture riconosciute e aggiorna lo stato della coda"""
+        connection = self.db.get_connection()
+        jobs_repo = InvoiceJobsRepository(connection)
+        
+        invoices = []
+        done = []
+        failed = []
+        unfinished = []
+        for job in jobs:
+            if job['id'] in errors:
+                failed.append((job['id'], errors[job['id']]))
+            elif job['id'] in results:
+                text, data = results[job['id']]
+                invoices.append(self.build_invoice(job, text, data, matcher))
+                done.append(job['id'])
+            else:
+                unfinished.append(job['id'])
+        
+        with connection.transaction():
+            if invoices:
+                InvoicesRepository(connection).bulk_create(invoices)
+            jobs_repo.mark_done(done)
+            jobs_repo.mark_failed(failed)
+            jobs_repo.release(unfinished)
+        
+        summary.imported += len(done)
+        summary.failed += len(failed)
+    
+    @staticmethod
+    def build_invoice(job: Dict[str, Any], text: str, data: Dict[str, str],
+                      matcher: SupplierMatcher) -> Dict[str, Any]:
+        """
+        Crea la riga della fattura dai dati estratti.
+        
+        Senza una data leggibile si usa la data di modifica del file; il
+        fornitore resta vuoto se non corrisponde a uno esistente (nessun
+        fornitore viene creato da testo OCR non verificato).
+        """
+        notes = [IMPORT_NOTE]
+        
+        date = parse_invoice_date(data.get('date'))
+        if date is None:
+            date = datetime.fromtimestamp(job['file_mtime'] / 1e9).strftime('%Y-%m-%d')
+            notes.append('Data non riconosciuta: usata la data del file')
+        
+        supplier_id = matcher.match(data.get('supplier_name', ''), text)
+        if supplier_id is None and data.get('supplier_name'):
+            notes.append(f"Fornitore da verificare: {data['supplier_name']}")
+        
+        if data.get('vat_number'):
+            notes.append(f"P.IVA: {data['vat_number']}")
+        
+        return InvoiceRecord(
+            date=date,
+            supplier_id=supplier_id,
+            invoice_number=data.get('invoice_number', ''),
+            total_amount=parse_amount(data.get('total_amount', '')),
+            file_path=job['file_path'],
+            ocr_text=text,
+            notes='\n'.join(notes)
+        ).to_dict()
+    
+    @staticmethod
+    def _list_files(folder: str, recursive: bool) -> Iterator[str]:
+        """File supportati della cartella (percorsi assoluti, in ordine di nome)"""
+        folder = os.path.abspath(folder)
+        if recursive:
+            walker = os.walk(folder)
+        else:
+            walker = [(folder, [], sorted(os.listdir(folder)))]
+        
+        for directory, subdirs, names in walker:
+            subdirs.sort()
+            for name in sorted(names):
+                # File nascosti e temporanei di Office/scanner
+                if name.startswith(('.', '~$')):
+                    continue
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    path = os.path.join(directory, name)
+                    if os.path.isfile(path):
+                        yield path
@@ -0,0 +1,150 @@
+"""
+Cache persistente dei risultati OCR.
+I risultati sono indicizzati per contenuto del file (SHA-256), lingua,
+impostazioni di preelaborazione e versione di Tesseract: riaprire o
+reimportare lo stesso documento non riesegue l'OCR.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from services.ocr_capabilities import get_cache_dir
+
+
+CACHE_FILE_NAME = 'ocr_cache.db'
+
+# Dimensione massima della cache (MB), modificabile con GESTIONALE_OCR_CACHE_MB
+DEFAULT_MAX_MB = 64
+
+# Blocchi di lettura per l'hash dei file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 del contenuto di un file (letto a blocchi)"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Cache LRU su SQLite di testo OCR e dati fattura estratti.
+    
+    Ogni lettura aggiorna l'ultimo utilizzo; quando la dimensione totale
+    supera il limite vengono eliminate le voci usate meno di recente.
+    Può essere usata da più thread.
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: File SQLite della cache (default: nella cartella cache dell'applicazione)
+            max_bytes: Dimensione massima dei risultati salvati
+        """
+        if path is None:
+            path = os.path.join(get_cache_dir(), CACHE_FILE_NAME)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('GESTIONALE_OCR_CACHE_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ocr_results_last_used ON ocr_results(last_used)"
+        )
+    
+    @staticmethod
+    def make_key(file_path: str, language: str, settings: str, version: Optional[str],
+                 digest: Optional[str] = None) -> str:
+        """
+        Chiave di cache per un file.
+        
+        Args:
+            file_path: File elaborato
+            language: Lingue OCR
+            settings: Impostazioni di preelaborazione (es. 'dpi=300;min_width=1000')
+            version: Versione di Tesseract
+            digest: SHA-256 del file, se già calcolato
+        """
+        return '|'.join((digest or file_digest(file_path), language, settings, version or ''))
+    
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """Restituisce (testo, dati estratti) se presenti in cache"""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT text, data FROM ocr_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+        
+        return row[0], json.loads(row[1])
+    
+    def put(self, key: str, text: str, data: Dict[str, str]):
+        """Salva un risultato ed elimina le voci meno recenti oltre il limite"""
+        data_json = json.dumps(data, ensure_ascii=False)
+        size = len(key) + len(text.encode('utf-8')) + len(data_json.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO ocr_results (key, text, data, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, text, data_json, size, time.time())
+                )
+                self._evict()
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+    
+    def _evict(self):
+        """Elimina le voci usate meno di recente finché la cache rientra nel limite"""
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        stale = []
+        cursor = self.connection.execute("SELECT key, size FROM ocr_results ORDER BY last_used")
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        cursor.close()
+        
+        self.connection.executemany("DELETE FROM ocr_results WHERE key = ?", stale)
+    
+    def clear(self):
+        """Svuota la cache"""
+        with self._lock:
+            self.connection.execute("DELETE FROM ocr_results")
+    
+    def close(self):
+        """Chiude il file della cache"""
+        with self._lock:
+            self.connection.close()
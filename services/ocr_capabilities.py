@@ -0,0 +1,225 @@
+"""
+Rilevamento di Tesseract e delle sue funzionalità.
+Il risultato viene salvato su disco e riutilizzato finché l'eseguibile
+non cambia, così creare l'OCRService non avvia processi esterni.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from dataclasses import asdict, dataclass, field
+from importlib.util import find_spec
+from typing import List, Optional
+
+
+# Versione del formato del file di cache (da incrementare se cambia TesseractCapabilities)
+CACHE_FORMAT = 2
+
+CACHE_FILE_NAME = 'tesseract.json'
+
+# Moduli Python che permettono di leggere o convertire PDF
+PDF_BACKEND_MODULES = {
+    'pymupdf': 'fitz',
+    'pdf2image': 'pdf2image',
+    'pypdf2': 'PyPDF2',
+}
+
+@dataclass
+class TesseractCapabilities:
+    """Installazione di Tesseract e backend PDF disponibili"""
+    
+    path: Optional[str] = None
+    version: Optional[str] = None
+    languages: List[str] = field(default_factory=list)
+    pdf_backends: List[str] = field(default_factory=list)  # Ricalcolati a ogni richiesta, non salvati
+    mtime: Optional[int] = None  # Data modifica dell'eseguibile (ns), chiave della cache
+    
+    @property
+    def available(self) -> bool:
+        """True se Tesseract è installato"""
+        return self.path is not None
+    
+    def supports_language(self, language: str) -> bool:
+        """
+        Verifica che tutte le lingue richieste siano installate.
+        
+        Args:
+            language: Lingue nel formato di Tesseract (es. 'ita+eng')
+        """
+        if not self.languages:
+            return True  # Elenco non disponibile: si lascia decidere a Tesseract
+        return all(lang in self.languages for lang in language.split('+'))
+    
+    def check_language(self, language: str):
+        """Solleva un'eccezione se una delle lingue richieste non è installata"""
+        if not self.supports_language(language):
+            raise Exception(
+                f"Lingua OCR '{language}' non installata "
+                f"(disponibili: {', '.join(self.languages)})"
+            )
+
+
+def get_cache_dir() -> str:
+    """
+    Restituisce la cartella della cache dell'applicazione, creandola se necessario.
+    
+    Si può cambiare con la variabile d'ambiente GESTIONALE_CACHE_DIR.
+    """
+    cache_dir = os.getenv('GESTIONALE_CACHE_DIR')
+    if not cache_dir:
+        if sys.platform == 'win32':
+            base = os.getenv('LOCALAPPDATA') or os.path.expanduser('~')
+            cache_dir = os.path.join(base, 'Gestionale', 'cache')
+        else:
+            base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            cache_dir = os.path.join(base, 'gestionale')
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def find_tesseract() -> Optional[str]:
+    """Trova l'eseguibile di Tesseract senza avviarlo"""
+    possible_paths = [
+        r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+        r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
+        r'C:\Users\{}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe'.format(os.getenv('USERNAME')),
+    ]
+    
+    for path in possible_paths:
+        if os.path.exists(path):
+            return path
+    
+    # Se è nel PATH
+    return shutil.which('tesseract')
+
+
+def find_pdf_backends() -> List[str]:
+    """Backend PDF installati (senza importarli)"""
+    backends = [
+        name for name, module in PDF_BACKEND_MODULES.items()
+        if find_spec(module) is not None
+    ]
+    
+    # pdf2image richiede anche poppler (pdftoppm)
+    if 'pdf2image' in backends and shutil.which('pdftoppm') is None:
+        backends.remove('pdf2image')
+    
+    return backends
+
+
+def probe_tesseract(path: str) -> TesseractCapabilities:
+    """
+    Interroga Tesseract per versione e lingue installate.
+    
+    Args:
+        path: Percorso dell'eseguibile
+    """
+    capabilities = TesseractCapabilities(path=path, mtime=_executable_mtime(path))
+    
+    try:
+        result = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=10)
+        # La versione è sulla prima riga (es. "tesseract 5.3.0" o "tesseract v5.0.0.20211201")
+        output = (result.stdout or result.stderr).strip()
+        if result.returncode != 0 or not output:
+            return TesseractCapabilities()
+        capabilities.version = output.splitlines()[0].split()[-1].lstrip('v')
+        
+        result = subprocess.run([path, '--list-langs'], capture_output=True, text=True, timeout=10)
+        # Prima riga: "List of available languages in ... (N):"
+        lines = (result.stdout or result.stderr).strip().splitlines()
+        capabilities.languages = sorted(line.strip() for line in lines[1:] if line.strip())
+    except (OSError, subprocess.SubprocessError):
+        return TesseractCapabilities()
+    
+    return capabilities
+
+
+_capabilities: Optional[TesseractCapabilities] = None
+_lock = threading.Lock()
+
+
+def get_tesseract_capabilities(refresh: bool = False) -> TesseractCapabilities:
+    """
+    Restituisce le funzionalità di Tesseract, dalla cache se ancora valida.
+    
+    La cache (in memoria e su disco) resta valida finché percorso e data
+    di modifica dell'eseguibile non cambiano: dopo il primo avvio non
+    vengono eseguiti processi esterni. I backend PDF non dipendono da
+    Tesseract e vengono verificati a ogni chiamata (senza importarli).
+    
+    Args:
+        refresh: Ignora la cache e interroga di nuovo Tesseract
+    """
+    global _capabilities
+    
+    with _lock:
+        path = find_tesseract()
+        mtime = _executable_mtime(path)
+        
+        if (refresh or _capabilities is None
+                or _capabilities.path != path or _capabilities.mtime != mtime):
+            capabilities = None if refresh or path is None else _load_cached(path, mtime)
+            if capabilities is None:
+                if path is None:
+                    capabilities = TesseractCapabilities()
+                else:
+                    capabilities = probe_tesseract(path)
+                    if capabilities.available:
+                        _save_cached(capabilities)
+            _capabilities = capabilities
+        
+        _capabilities.pdf_backends = find_pdf_backends()
+        return _capabilities
+
+
+def _executable_mtime(path: Optional[str]) -> Optional[int]:
+    """Data di modifica dell'eseguibile in nanosecondi (None se non esiste)"""
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _cache_path() -> str:
+    return os.path.join(get_cache_dir(), CACHE_FILE_NAME)
+
+
+def _load_cached(path: str, mtime: Optional[int]) -> Optional[TesseractCapabilities]:
+    """Legge le funzionalità salvate se corrispondono all'eseguibile attuale"""
+    try:
+        with open(_cache_path(), 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    
+    if data.pop('format', None) != CACHE_FORMAT:
+        return None
+    if data.get('path') != path or data.get('mtime') != mtime:
+        return None
+    
+    try:
+        return TesseractCapabilities(**data)
+    except TypeError:
+        return None
+
+
+def _save_cached(capabilities: TesseractCapabilities):
+    """Salva le funzionalità su disco (errori ignorati: la cache è facoltativa)"""
+    data = asdict(capabilities)
+    del data['pdf_backends']
+    data['format'] = CACHE_FORMAT
+    
+    try:
+        cache_path = _cache_path()
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=2)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Impossibile salvare la cache di Tesseract: {e}")
@@ -0,0 +1,339 @@
+"""
+Motore OCR parallelo per fatture con più pagine o più file.
+Le pagine vengono distribuite su un pool di processi (uno per CPU) e i
+risultati restituiti man mano che sono pronti.
+"""
+
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from PIL import Image
+from services.ocr_capabilities import TesseractCapabilities, find_pdf_backends, get_tesseract_capabilities
+
+
+# Estensioni trattate come PDF (le altre come immagini)
+PDF_EXTENSIONS = ('.pdf',)
+
+# Caratteri (esclusi gli spazi) perché il testo nativo di una pagina sia utilizzabile
+MIN_TEXT_CHARS = 20
+
+# Intervallo di controllo della richiesta di annullamento (secondi)
+CANCEL_POLL_INTERVAL = 0.2
+
+PDF_BACKEND_MISSING = "Nessuna libreria PDF installata (PyMuPDF, PyPDF2 o pdf2image)"
+
+
+class OCRCancelledError(Exception):
+    """OCR annullato prima del completamento"""
+
+
+@dataclass(frozen=True)
+class OCRTask:
+    """Pagina da elaborare (passata ai processi del pool)"""
+    
+    file_path: str
+    page: int            # Indice pagina (0 = prima); 0 per le immagini
+    page_count: int
+    is_pdf: bool
+    tesseract_path: Optional[str]
+    language: str
+    dpi: int
+    pdf_backends: Tuple[str, ...] = ()  # Backend PDF installati (vedi find_pdf_backends)
+
+
+@dataclass
+class PageResult:
+    """Testo estratto da una pagina"""
+    
+    file_path: str
+    page: int
+    page_count: int
+    text: str = ''
+    error: Optional[str] = None
+    from_text_layer: bool = False  # True se il testo è nativo del PDF (senza OCR)
+
+
+def has_usable_text(text: str) -> bool:
+    """True se il testo nativo di una pagina è sufficiente (altrimenti la pagina va in OCR)"""
+    return len(''.join(text.split())) >= MIN_TEXT_CHARS
+
+
+def extract_text_layer(pdf_path: str,
+                       backends: Optional[Iterable[str]] = None) -> Optional[List[str]]:
+    """
+    Testo nativo di ogni pagina di un PDF.
+    
+    Usa PyMuPDF (molto più veloce), altrimenti PyPDF2.
+    
+    Args:
+        pdf_path: Percorso del PDF
+        backends: Backend PDF installati (default: find_pdf_backends)
+    
+    Returns:
+        Testo per pagina, None se nessuna delle due librerie è installata
+    """
+    backends = find_pdf_backends() if backends is None else backends
+    
+    if 'pymupdf' in backends:
+        import fitz
+        with fitz.open(pdf_path) as document:
+            return [page.get_text().strip() for page in document]
+    
+    if 'pypdf2' in backends:
+        import PyPDF2
+        with open(pdf_path, 'rb') as file:
+            return [(page.extract_text() or '').strip() for page in PyPDF2.PdfReader(file).pages]
+    
+    return None
+
+
+def count_pdf_pages(pdf_path: str, backends: Optional[Iterable[str]] = None) -> int:
+    """Numero di pagine di un PDF (PyMuPDF, altrimenti PyPDF2 o pdf2image)"""
+    backends = find_pdf_backends() if backends is None else backends
+    
+    if 'pymupdf' in backends:
+        import fitz
+        with fitz.open(pdf_path) as document:
+            return document.page_count
+    
+    if 'pypdf2' in backends:
+        import PyPDF2
+        with open(pdf_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+    
+    if 'pdf2image' in backends:
+        from pdf2image import pdfinfo_from_path
+        return int(pdfinfo_from_path(pdf_path)['Pages'])
+    
+    raise Exception(PDF_BACKEND_MISSING)
+
+
+def render_pdf_page(pdf_path: str, page: int, dpi: int = 300,
+                    backends: Optional[Iterable[str]] = None) -> Image.Image:
+    """
+    Converte una sola pagina di un PDF in immagine, in memoria.
+    
+    Args:
+        pdf_path: Percorso del PDF
+        page: Indice pagina (0 = prima)
+        dpi: Risoluzione
+        backends: Backend PDF installati (default: find_pdf_backends)
+    """
+    backends = find_pdf_backends() if backends is None else backends
+    
+    if 'pymupdf' in backends:
+        import fitz
+        with fitz.open(pdf_path) as document:
+            pixmap = document[page].get_pixmap(dpi=dpi)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    
+    if 'pdf2image' in backends:
+        from pdf2image import convert_from_path
+        return convert_from_path(pdf_path, dpi=dpi, first_page=page + 1, last_page=page + 1)[0]
+    
+    raise Exception(PDF_BACKEND_MISSING)
+
+
+def ocr_page(task: OCRTask) -> PageResult:
+    """
+    Esegue l'OCR di una pagina (funzione eseguita nei processi del pool).
+    
+    Gli errori vengono restituiti nel risultato, così le altre pagine
+    proseguono.
+    """
+    result = PageResult(task.file_path, task.page, task.page_count)
+    
+    try:
+        import pytesseract
+        from services.ocr_service import OCRService
+        
+        if task.tesseract_path:
+            pytesseract.pytesseract.tesseract_cmd = task.tesseract_path
+        
+        if task.is_pdf:
+            image = render_pdf_page(task.file_path, task.page, task.dpi, task.pdf_backends)
+        else:
+            image = Image.open(task.file_path)
+        
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image = OCRService._preprocess_image(image)
+        
+        result.text = pytesseract.image_to_string(image, lang=task.language).strip()
+    except Exception as e:
+        result.error = str(e)
+    
+    return result
+
+
+class OCREngine:
+    """
+    Esegue l'OCR di pagine e file in parallelo su un ProcessPoolExecutor.
+    
+    Ogni processo converte solo la propria pagina, quindi l'OCR della
+    prima pagina inizia subito invece di attendere la conversione
+    dell'intero PDF. Il pool viene creato al primo uso e riutilizzato.
+    """
+    
+    def __init__(self, tesseract_path: Optional[str] = None, language: str = 'ita+eng',
+                 dpi: int = 300, max_workers: Optional[int] = None,
+                 capabilities: Optional[TesseractCapabilities] = None):
+        """
+        Args:
+            tesseract_path: Percorso dell'eseguibile Tesseract (None = dal PATH)
+            language: Lingue OCR
+            dpi: Risoluzione di conversione delle pagine PDF
+            max_workers: Processi del pool (default: numero di CPU)
+            capabilities: Lingue e backend PDF installati (default: get_tesseract_capabilities
+                          e find_pdf_backends)
+        """
+        self.tesseract_path = tesseract_path
+        self.capabilities = capabilities
+        self.language = language
+        self.dpi = dpi
+        self.max_workers = max_workers or os.cpu_count() or 1
+        
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+    
+    def build_tasks(self, file_paths: Iterable[str],
+                    use_text_layer: bool = True) -> Tuple[List[PageResult], List[OCRTask]]:
+        """
+        Prepara le pagine dei file (immagini = una pagina).
+        
+        Le pagine PDF con testo nativo sufficiente sono già complete; solo
+        le altre diventano attività OCR.
+        
+        Returns:
+            (pagine già complete, attività OCR)
+        """
+        backends = tuple(
+            find_pdf_backends() if self.capabilities is None else self.capabilities.pdf_backends
+        )
+        ready = []
+        tasks = []
+        for file_path in file_paths:
+            is_pdf = file_path.lower().endswith(PDF_EXTENSIONS)
+            
+            texts = extract_text_layer(file_path, backends) if is_pdf and use_text_layer else None
+            if texts is not None:
+                page_count = len(texts)
+            else:
+                page_count = count_pdf_pages(file_path, backends) if is_pdf else 1
+            
+            for page in range(page_count):
+                if texts is not None and has_usable_text(texts[page]):
+                    ready.append(PageResult(
+                        file_path, page, page_count, texts[page], from_text_layer=True
+                    ))
+                else:
+                    tasks.append(OCRTask(
+                        file_path, page, page_count, is_pdf,
+                        self.tesseract_path, self.language, self.dpi, backends
+                    ))
+        return ready, tasks
+    
+    def iter_pages(self, file_paths: Iterable[str],
+                   cancel_event: Optional[threading.Event] = None,
+                   use_text_layer: bool = True) -> Iterator[PageResult]:
+        """
+        Restituisce i risultati delle pagine nell'ordine in cui terminano.
+        
+        Le pagine con testo nativo arrivano subito; le altre vengono
+        convertite in memoria e riconosciute nel pool di processi.
+        
+        Args:
+            file_paths: PDF e immagini da elaborare
+            cancel_event: Evento che, se impostato, interrompe l'elaborazione
+            use_text_layer: Usa il testo nativo dei PDF quando presente
+        
+        Raises:
+            OCRCancelledError: se l'elaborazione viene annullata
+            Exception: se servono pagine OCR e una lingua non è installata
+        """
+        ready, tasks = self.build_tasks(file_paths, use_text_layer)
+        
+        # Un solo controllo prima di avviare l'OCR (invece di un errore di Tesseract per pagina)
+        if tasks:
+            (self.capabilities or get_tesseract_capabilities()).check_language(self.language)
+        
+        for result in ready:
+            self._check_cancelled(cancel_event)
+            yield result
+        
+        if not tasks:
+            return
+        
+        # Una sola pagina: nel thread corrente, senza avviare il pool
+        if len(tasks) == 1:
+            self._check_cancelled(cancel_event)
+            yield ocr_page(tasks[0])
+            return
+        
+        executor = self._get_executor()
+        pending = {executor.submit(ocr_page, task) for task in tasks}
+        
+        try:
+            while pending:
+                self._check_cancelled(cancel_event)
+                done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL,
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        except BrokenProcessPool:
+            self._discard_executor()
+            raise
+        finally:
+            # Annullamento, errore o iterazione interrotta: le pagine non avviate vengono scartate
+            for future in pending:
+                future.cancel()
+    
+    def extract_text(self, file_path: str, cancel_event: Optional[threading.Event] = None,
+                     on_page: Optional[Callable[[PageResult, int], None]] = None) -> str:
+        """
+        Estrae il testo di tutte le pagine di un file, nell'ordine delle pagine.
+        
+        Per i PDF digitali (con testo nativo) non viene eseguito alcun OCR.
+        
+        Args:
+            file_path: PDF o immagine
+            cancel_event: Evento di annullamento
+            on_page: Chiamata per ogni pagina completata con (risultato, pagine completate)
+        """
+        results = []
+        for result in self.iter_pages([file_path], cancel_event):
+            if result.error:
+                raise Exception(f"Errore durante l'OCR (pagina {result.page + 1}): {result.error}")
+            results.append(result)
+            if on_page:
+                on_page(result, len(results))
+        
+        results.sort(key=lambda result: result.page)
+        return '\n\n'.join(result.text for result in results if result.text)
+    
+    def shutdown(self):
+        """Chiude il pool di processi (le pagine non avviate vengono scartate)"""
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+    
+    def _discard_executor(self):
+        """Scarta un pool non più utilizzabile (un processo è terminato in modo anomalo)"""
+        with self._lock:
+            self._executor = None
+    
+    @staticmethod
+    def _check_cancelled(cancel_event: Optional[threading.Event]):
+        if cancel_event is not None and cancel_event.is_set():
+            raise OCRCancelledError("OCR annullato")
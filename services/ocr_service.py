@@ -8,55 +8,84 @@ import tempfile
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from PIL import Image
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-import pytesseract
+from services.ocr_cache import OCRCache
+from services.ocr_capabilities import get_tesseract_capabilities
 
-try:
-    from pdf2image import convert_from_path
-    PDF2IMAGE_AVAILABLE = True
-except ImportError:
-    PDF2IMAGE_AVAILABLE = False
 
-try:
-    import PyPDF2
-    PYPDF2_AVAILABLE = True
-except ImportError:
-    PYPDF2_AVAILABLE = False
+# Larghezza minima (pixel) a cui vengono ingrandite le immagini prima dell'OCR
+PREPROCESS_MIN_WIDTH = 1000
 
 
 class OCRService:
     """Servizio per OCR e gestione PDF fatture"""
     
     def __init__(self):
-        self.tesseract_path = self._find_tesseract()
+        # Percorso, versione e lingue dalla cache (nessun processo esterno dopo il primo avvio)
+        self.capabilities = get_tesseract_capabilities()
+        self.tesseract_path = self.capabilities.path
+    
+        self._cache = None         # Cache dei risultati, aperta al primo uso
+        self._cache_error = False  # True se la cache non è utilizzabile
+    
+    def _pytesseract(self):
+        """Importa pytesseract al primo uso e lo configura con il percorso trovato"""
+        import pytesseract
+        
         if self.tesseract_path:
             pytesseract.pytesseract.tesseract_cmd = self.tesseract_path
+        return pytesseract
     
-    def _find_tesseract(self) -> Optional[str]:
-        """Trova l'installazione di Tesseract"""
-        possible_paths = [
-            r'C:\Program Files\Tesseract-OCR\tesseract.exe',
-            r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
-            r'C:\Users\{}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe'.format(os.getenv('USERNAME')),
-            'tesseract'  # Se è nel PATH
-        ]
-        
-        for path in possible_paths:
+    @property
+    def cache(self) -> Optional[OCRCache]:
+        """Cache persistente dei risultati OCR (None se non utilizzabile)"""
+        if self._cache is None and not self._cache_error:
             try:
-                if os.path.exists(path):
-                    return path
-                elif path == 'tesseract':
-                    # Testa se tesseract è nel PATH
-                    import subprocess
-                    result = subprocess.run(['tesseract', '--version'], 
-                                          capture_output=True, text=True)
-                    if result.returncode == 0:
-                        return 'tesseract'
-            except:
-                continue
+                self._cache = OCRCache()
+            except Exception as e:
+                print(f"Cache OCR non disponibile: {e}")
+                self._cache_error = True
+        return self._cache
+    
+    def cache_key(self, file_path: str, language: str = 'ita+eng', dpi: int = 300,
+                  digest: Optional[str] = None) -> str:
+        """
+        Chiave di cache di un file: contenuto, lingua, preelaborazione e versione di Tesseract.
         
-        return None
+        Args:
+            file_path: File da elaborare
+            language: Lingue OCR
+            dpi: Risoluzione di conversione delle pagine PDF
+            digest: SHA-256 del file, se già calcolato
+        """
+        settings = f"dpi={dpi};min_width={PREPROCESS_MIN_WIDTH}"
+        return OCRCache.make_key(file_path, language, settings, self.capabilities.version, digest)
+    
+    def get_cached(self, key: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """Restituisce (testo, dati estratti) dalla cache, se presenti"""
+        cache = self.cache
+        if cache is None:
+            return None
+        try:
+            return cache.get(key)
+        except Exception as e:
+            print(f"Errore lettura cache OCR: {e}")
+            return None
+    
+    def store_cached(self, key: str, text: str, data: Dict[str, str]):
+        """Salva testo e dati estratti nella cache (gli errori non interrompono l'OCR)"""
+        cache = self.cache
+        if cache is None:
+            return
+        try:
+            cache.put(key, text, data)
+        except Exception as e:
+            print(f"Errore scrittura cache OCR: {e}")
+    
+    def close(self):
+        """Chiude la cache dei risultati, se aperta (verrà riaperta al prossimo uso)"""
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
     
     def is_available(self) -> bool:
         """Verifica se OCR è disponibile"""
@@ -89,6 +118,8 @@ Tesseract è gratuito e open source.
         if not self.is_available():
             raise Exception("Tesseract OCR non disponibile")
         
+        self.capabilities.check_language(language)
+        
         try:
             # Apri e preprocessa l'immagine
             image = Image.open(image_path)
@@ -101,19 +132,20 @@ Tesseract è gratuito e open source.
             image = self._preprocess_image(image)
             
             # Estrai testo
-            text = pytesseract.image_to_string(image, lang=language)
+            text = self._pytesseract().image_to_string(image, lang=language)
             
             return text.strip()
             
         except Exception as e:
             raise Exception(f"Errore durante l'OCR: {str(e)}")
     
-    def _preprocess_image(self, image: Image.Image) -> Image.Image:
+    @staticmethod
+    def _preprocess_image(image: Image.Image) -> Image.Image:
         """Preprocessa l'immagine per migliorare l'OCR"""
         # Ridimensiona se troppo piccola
         width, height = image.size
-        if width < 1000:
-            scale = 1000 / width
+        if width < PREPROCESS_MIN_WIDTH:
+            scale = PREPROCESS_MIN_WIDTH / width
             new_width = int(width * scale)
             new_height = int(height * scale)
             image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
@@ -133,6 +165,9 @@ Tesseract è gratuito e open source.
         Returns:
             Testo estratto (se include_ocr=True)
         """
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4
+        
         try:
             # Apri l'immagine
             image = Image.open(image_path)
@@ -172,7 +207,13 @@ Tesseract è gratuito e open source.
                 # Aggiungi testo OCR invisibile se richiesto
                 if include_ocr and self.is_available():
                     try:
-                        extracted_text = self.extract_text_from_image(image_path)
+                        key = self.cache_key(image_path)
+                        cached = self.get_cached(key)
+                        if cached is not None:
+                            extracted_text = cached[0]
+                        else:
+                            extracted_text = self.extract_text_from_image(image_path)
+                            self.store_cached(key, extracted_text, self.extract_invoice_data(extracted_text))
                         
                         if extracted_text.strip():
                             # Aggiungi testo invisibile per ricerca
@@ -325,7 +366,9 @@ Tesseract è gratuito e open source.
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
-        Estrae testo da un PDF esistente.
+        Estrae il testo nativo di un PDF esistente (senza OCR).
+        
+        Usa PyMuPDF se installato, altrimenti PyPDF2 (vedi capabilities.pdf_backends).
         
         Args:
             pdf_path: Percorso del file PDF
@@ -333,28 +376,25 @@ Tesseract è gratuito e open source.
         Returns:
             Testo estratto
         """
-        if not PYPDF2_AVAILABLE:
-            raise Exception("PyPDF2 non disponibile per leggere PDF")
+        from services.ocr_engine import extract_text_layer
         
         try:
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            
-            return text.strip()
-            
+            texts = extract_text_layer(pdf_path, self.capabilities.pdf_backends)
         except Exception as e:
             raise Exception(f"Errore lettura PDF: {str(e)}")
+        
+        if texts is None:
+            raise Exception("PyMuPDF o PyPDF2 non disponibili per leggere PDF")
+        
+        return '\n'.join(text for text in texts if text).strip()
     
     def convert_pdf_to_images(self, pdf_path: str, output_dir: str) -> List[str]:
         """
         Converte le pagine di un PDF in immagini per OCR.
         
+        Le pagine vengono convertite una alla volta (PyMuPDF, altrimenti
+        pdf2image); per l'OCR conviene OCREngine, che non scrive file.
+        
         Args:
             pdf_path: Percorso del PDF
             output_dir: Directory per salvare le immagini
@@ -362,15 +402,13 @@ Tesseract è gratuito e open source.
         Returns:
             Lista dei percorsi delle immagini create
         """
-        if not PDF2IMAGE_AVAILABLE:
-            raise Exception("pdf2image non disponibile")
+        from services.ocr_engine import count_pdf_pages, render_pdf_page
         
+        backends = self.capabilities.pdf_backends
         try:
-            # Converti PDF in immagini
-            images = convert_from_path(pdf_path, dpi=300)
-            
             image_paths = []
-            for i, image in enumerate(images):
+            for i in range(count_pdf_pages(pdf_path, backends)):
+                image = render_pdf_page(pdf_path, i, dpi=300, backends=backends)
                 image_path = os.path.join(output_dir, f"page_{i+1}.jpg")
                 image.save(image_path, 'JPEG', quality=95)
                 image_paths.append(image_path)
@@ -0,0 +1,101 @@
+"""
+Risoluzione in memoria dei nomi dei fornitori.
+Fornitori e nomi alternativi vengono letti una sola volta: durante
+un'importazione ogni riga viene abbinata con un accesso a un dizionario e
+i fornitori mancanti sono creati in blocco.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+from database.repository import SuppliersRepository
+
+
+def normalize_supplier_name(name: str) -> str:
+    """Chiave di confronto: minuscolo e spazi singoli ('  AIA  Spa' -> 'aia spa')"""
+    return ' '.join((name or '').casefold().split())
+
+
+class SupplierResolver:
+    """
+    Abbina nomi di fornitori agli id, creando quelli mancanti.
+    
+    Il confronto non distingue maiuscole e spazi; i nomi alternativi
+    (supplier_aliases) valgono solo se nessun fornitore ha quel nome.
+    Chi scrive deve chiamare commit() dopo il commit della transazione e
+    rollback() se viene annullata (rollback(mark()) per un savepoint):
+    i fornitori creati nella parte annullata vengono dimenticati.
+    """
+    
+    def __init__(self, suppliers_repo: SuppliersRepository):
+        self.suppliers_repo = suppliers_repo
+        self._ids: Optional[Dict[str, int]] = None
+        self._created: List[str] = []
+    
+    def _load(self) -> Dict[str, int]:
+        """Legge fornitori (prima gli attivi) e nomi alternativi alla prima richiesta"""
+        if self._ids is None:
+            ids = {}
+            suppliers = sorted(self.suppliers_repo.get_all(), key=lambda s: not s['active'])
+            for supplier in suppliers:
+                ids.setdefault(normalize_supplier_name(supplier['name']), supplier['id'])
+            for alias, supplier_id in self.suppliers_repo.get_aliases().items():
+                ids.setdefault(normalize_supplier_name(alias), supplier_id)
+            self._ids = ids
+        return self._ids
+    
+    def get(self, name: str) -> Optional[int]:
+        """Id del fornitore con questo nome o nome alternativo (None se non esiste)"""
+        return self._load().get(normalize_supplier_name(name))
+    
+    def resolve(self, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Restituisce nome -> id, creando in blocco i fornitori mancanti.
+        
+        Returns:
+            Dizionario con tutti i nomi ricevuti
+        """
+        names = dict.fromkeys(names)
+        self.create({'name': name} for name in names)
+        ids = self._load()
+        return {name: ids[normalize_supplier_name(name)] for name in names}
+    
+    def create(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Crea i fornitori (dizionari con almeno 'name') che non esistono già.
+        
+        Per nomi equivalenti viene creato solo il primo, con gli spazi
+        superflui rimossi.
+        
+        Returns:
+            Numero di fornitori creati
+        """
+        ids = self._load()
+        missing = {}
+        for row in rows:
+            key = normalize_supplier_name(row['name'])
+            if key and key not in ids and key not in missing:
+                missing[key] = dict(row, name=' '.join(row['name'].split()))
+        
+        if not missing:
+            return 0
+        
+        self.suppliers_repo.bulk_upsert(missing.values())
+        created = self.suppliers_repo.get_ids_by_names(row['name'] for row in missing.values())
+        for key, row in missing.items():
+            ids[key] = created[row['name']]
+        self._created.extend(missing)
+        return len(missing)
+    
+    def mark(self) -> int:
+        """Posizione da passare a rollback per annullare solo le creazioni successive"""
+        return len(self._created)
+    
+    def commit(self):
+        """Conferma i fornitori creati (la transazione è stata salvata)"""
+        self._created.clear()
+    
+    def rollback(self, mark: int = 0):
+        """Dimentica i fornitori creati dopo mark (transazione o savepoint annullato)"""
+        if self._ids is not None:
+            for key in self._created[mark:]:
+                self._ids.pop(key, None)
+        del self._created[mark:]
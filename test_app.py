@@ -64,6 +64,147 @@ def test_database():
         suppliers = suppliers_repo.get_all_active()
         print(f"✅ Database creato con {len(suppliers)} fornitori di default")
         
+        # Verifica WAL e connessioni per thread
+        import threading
+        journal_mode = db.connection.execute("PRAGMA journal_mode").fetchone()[0]
+        thread_connections = []
+        worker = threading.Thread(target=lambda: thread_connections.append(db.get_connection()))
+        worker.start()
+        worker.join()
+        if journal_mode != 'wal' or thread_connections[0] is db.connection:
+            print("❌ Connessioni non configurate correttamente")
+            db.close()
+            return False
+        print("✅ WAL attivo, connessione dedicata per thread")
+        
+        # Verifica rollback della unit-of-work
+        try:
+            with db.transaction():
+                sales_repo.create({'date': '2024-01-01'})
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        if sales_repo.get_by_date('2024-01-01') is not None:
+            print("❌ Transazione non annullata")
+            db.close()
+            return False
+        print("✅ Transazioni con rollback funzionanti")
+        
+        # Verifica totali precalcolati
+        from database.repository import PurchasesRepository, TotalsRepository
+        sales_repo.create({'date': '2024-01-02', 'cash_income': 100.0, 'card_gross': 200.0})
+        PurchasesRepository(db.connection).create(
+            {'date': '2024-01-02', 'supplier_id': suppliers[0]['id'], 'cash_payment': 50.0}
+        )
+        day = TotalsRepository(db.connection).get_day('2024-01-02')
+        if abs(day['profit'] - (100.0 + 200.0 - (200.0 * 1.95 / 100 + 0.15) - 0.0 - 50.0)) > 1e-9:
+            print("❌ Totali giornalieri non corretti")
+            db.close()
+            return False
+        print("✅ Totali giornalieri aggiornati dai trigger")
+        
+        # Verifica lettura a blocchi
+        rows = list(sales_repo.iter_by_date_range('2024-01-01', '2024-01-31'))
+        if len(rows) != 1 or rows[0].cash_income != 10000:  # Importi in centesimi
+            print("❌ Lettura a blocchi non corretta")
+            db.close()
+            return False
+        print("✅ Lettura a blocchi funzionante")
+        
+        # Spese lette a blocchi come oggetti compatti (importi in euro)
+        from models.purchase import PurchaseRecord
+        purchases = [
+            PurchaseRecord.from_row(row)
+            for row in PurchasesRepository(db.connection).iter_by_date_range('2024-01-01', '2024-01-31')
+        ]
+        if (len(purchases) != 1 or purchases[0].total != 50.0
+                or purchases[0].supplier_name != suppliers[0]['name'] or hasattr(purchases[0], '__dict__')):
+            print("❌ PurchaseRecord non corretto")
+            db.close()
+            return False
+        print("✅ Spese caricate come PurchaseRecord")
+        
+        # Verifica statistiche dashboard (dai totali precalcolati)
+        from datetime import date
+        from services.dashboard_stats import DashboardStatsService
+        stats = DashboardStatsService(db.connection).get_stats(date(2024, 1, 2))
+        if stats.sales_today != 300.0 or stats.expenses_month != 50.0 or stats.active_suppliers != 1:
+            print("❌ Statistiche dashboard non corrette")
+            db.close()
+            return False
+        print("✅ Statistiche dashboard corrette")
+        
+        # Verifica notifiche di modifica (pubblicate solo dopo il commit)
+        changes = []
+        db.changes.subscribe(changes.extend)
+        try:
+            with db.transaction():
+                sales_repo.create({'date': '2024-01-05'})
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        sales_repo.update('2024-01-02', {'cash_income': 120.0})
+        if [(c.table, c.start_date, c.end_date) for c in changes] != [('sales', '2024-01-02', '2024-01-02')]:
+            print("❌ Notifiche di modifica non corrette")
+            db.close()
+            return False
+        print("✅ Notifiche di modifica corrette")
+        
+        # Il notificatore della finestra principale si scollega dal bus
+        from database.events import DataChangeBus
+        from ui.main_window import DataChangeNotifier
+        bus = DataChangeBus()
+        DataChangeNotifier(bus).close()
+        if bus._subscribers:
+            print("❌ Notificatore ancora registrato sul bus dopo close()")
+            db.close()
+            return False
+        print("✅ Notificatore rimosso dal bus alla chiusura")
+        
+        # Upsert in blocco: date esistenti o ripetute aggiornate, non duplicate
+        totals_repo = TotalsRepository(db.connection)
+        sales_repo.bulk_upsert([
+            {'date': '2024-01-02', 'cash_income': 150.0},
+            {'date': '2024-01-03', 'cash_income': 10.0},
+            {'date': '2024-01-03', 'cash_income': 30.0},
+        ])
+        sale = sales_repo.get_by_date('2024-01-02')
+        days = [totals_repo.get_day('2024-01-02'), totals_repo.get_day('2024-01-03')]
+        month = totals_repo.get_monthly_totals('2024-01', '2024-01')[0]
+        expected_profit = 150.0 + 200.0 - (200.0 * 1.95 / 100 + 0.15) - 50.0
+        if (len(sales_repo.get_by_date_range('2024-01-01', '2024-01-31')) != 2
+                or sale['cash_income'] != 150.0 or sale['card_gross'] != 200.0
+                or [d['sales_count'] for d in days] != [1, 1] or days[1]['cash_total'] != 30.0
+                or abs(days[0]['profit'] - expected_profit) > 1e-9
+                or month['sales_count'] != 2
+                or abs(month['profit'] - days[0]['profit'] - days[1]['profit']) > 1e-9):
+            print(f"❌ Upsert in blocco non corretto: {sale} {days} {month}")
+            db.close()
+            return False
+        print("✅ Upsert in blocco senza duplicati, totali ricalcolati")
+        
+        # Scritture esterne riconosciute anche se questo processo ha scritto nello stesso intervallo
+        import sqlite3
+        db.poll_external_changes()
+        sales_repo.update('2024-01-03', {'cash_income': 40.0})
+        worker = threading.Thread(
+            target=lambda: SalesRepository(db.get_connection()).update('2024-01-02', {'cash_income': 160.0})
+        )
+        worker.start()
+        worker.join()
+        local_only = db.poll_external_changes()
+        external = sqlite3.connect('test_gestionale.db')
+        external.execute("UPDATE sales SET notes = 'esterna' WHERE date = '2024-01-03'")
+        external.commit()
+        external.close()
+        sales_repo.update('2024-01-02', {'cash_income': 170.0})
+        mixed = db.poll_external_changes()
+        if local_only or not mixed or db.poll_external_changes():
+            print(f"❌ Modifiche esterne non riconosciute: {local_only} {mixed}")
+            db.close()
+            return False
+        print("✅ Modifiche esterne distinte da quelle di questo processo")
+        
         # Pulisci
         db.close()
         if os.path.exists('test_gestionale.db'):
@@ -75,6 +216,252 @@ def test_database():
         print(f"❌ Errore database: {e}")
         return False
 
+def test_migration():
+    """Testa la conversione in centesimi di un database con importi REAL"""
+    print("\n💶 Testando migrazione importi in centesimi...")
+    
+    import sqlite3
+    import tempfile
+    
+    try:
+        from database.schema import SCHEMA_VERSION, Database
+        from database.repository import InvoicesRepository, TotalsRepository
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'gestionale.db')
+            backup_path = db_path + '.pre-centesimi.bak'
+            
+            # Database creato dalla versione con importi REAL
+            connection = sqlite3.connect(db_path)
+            connection.executescript("""
+                CREATE TABLE sales (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL UNIQUE,
+                    start_capital REAL DEFAULT 0,
+                    cash_income REAL DEFAULT 0,
+                    coin_income REAL DEFAULT 0,
+                    card_gross REAL DEFAULT 0,
+                    card_percent_fee REAL DEFAULT 1.95,
+                    card_fixed_fee REAL DEFAULT 0.15,
+                    satispay_gross REAL DEFAULT 0,
+                    satispay_percent_fee REAL DEFAULT 1.0,
+                    satispay_fixed_fee REAL DEFAULT 0.0,
+                    notes TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE INDEX idx_sales_date ON sales(date DESC);
+                CREATE TABLE suppliers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    active INTEGER DEFAULT 1,
+                    notes TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE TABLE purchases (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    supplier_id INTEGER NOT NULL,
+                    description TEXT,
+                    cash_payment REAL DEFAULT 0,
+                    bank_payment REAL DEFAULT 0,
+                    notes TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+                );
+                CREATE INDEX idx_purchases_date ON purchases(date DESC);
+                CREATE TABLE invoices (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    supplier_id INTEGER,
+                    invoice_number TEXT,
+                    total_amount REAL DEFAULT 0,
+                    file_path TEXT,
+                    ocr_text TEXT,
+                    notes TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+                );
+                CREATE INDEX idx_invoices_date ON invoices(date DESC);
+                INSERT INTO suppliers (name) VALUES ('AIA');
+                INSERT INTO sales (date, cash_income, card_gross) VALUES ('2024-02-01', 0.005, 12.345);
+                INSERT INTO purchases (date, supplier_id, cash_payment, bank_payment)
+                    VALUES ('2024-02-01', 1, 12.345, -3.5);
+                INSERT INTO invoices (date, supplier_id, invoice_number, total_amount, ocr_text)
+                    VALUES ('2024-02-01', 1, 'F1', -7.125, 'acqua minerale');
+            """)
+            connection.commit()
+            connection.close()
+            
+            def stored_amounts(db):
+                return (
+                    db.connection.execute(
+                        "SELECT cash_income, card_gross, card_fixed_fee, typeof(card_gross) FROM sales"
+                    ).fetchall()
+                    + db.connection.execute("SELECT cash_payment, bank_payment, 0, typeof(cash_payment) FROM purchases").fetchall()
+                    + db.connection.execute("SELECT total_amount, 0, 0, typeof(total_amount) FROM invoices").fetchall()
+                )
+            
+            expected = [(1, 1235, 15, 'integer'), (1235, -350, 0, 'integer'), (-713, 0, 0, 'integer')]
+            
+            db = Database(db_path)
+            amounts = [tuple(row) for row in stored_amounts(db)]
+            user_version = db.connection.execute("PRAGMA user_version").fetchone()[0]
+            if amounts != expected or user_version != SCHEMA_VERSION or not os.path.exists(backup_path):
+                print(f"❌ Conversione non corretta: {amounts} (versione {user_version})")
+                db.close()
+                return False
+            print("✅ Importi convertiti in centesimi, copia .pre-centesimi.bak creata")
+            
+            # Totali precalcolati e indice di ricerca ricostruiti
+            totals_repo = TotalsRepository(db.connection)
+            day = totals_repo.get_day('2024-02-01')
+            month = totals_repo.get_monthly_totals('2024-02', '2024-02')
+            supplier_month = db.connection.execute(
+                "SELECT total FROM supplier_monthly_totals WHERE month = '2024-02' AND supplier_id = 1"
+            ).fetchone()
+            invoices_repo = InvoicesRepository(db.connection)
+            if (day is None or day['cash_total'] != 0.01 or day['purchases_total'] != 8.85
+                    or len(month) != 1 or month[0]['purchases_total'] != 8.85
+                    or supplier_month is None or supplier_month[0] != 885
+                    or (invoices_repo._has_search_index()
+                        and [i['id'] for i in invoices_repo.search('minerale')] != [1])):
+                print(f"❌ Totali o indice non ricostruiti: {day} {month} {supplier_month}")
+                db.close()
+                return False
+            print("✅ Totali precalcolati e indice di ricerca ricostruiti")
+            db.close()
+            
+            # Seconda apertura: nessuna nuova conversione né copia
+            os.remove(backup_path)
+            db = Database(db_path)
+            amounts = [tuple(row) for row in stored_amounts(db)]
+            db.close()
+            if amounts != expected or os.path.exists(backup_path):
+                print(f"❌ Migrazione ripetuta alla seconda apertura: {amounts}")
+                return False
+            print("✅ Seconda apertura senza nuova migrazione")
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Errore migrazione: {e}")
+        return False
+
+def test_invoices():
+    """Testa paginazione e ricerca full-text delle fatture"""
+    print("\n🧾 Testando fatture...")
+    
+    import tempfile
+    
+    try:
+        from database.schema import Database
+        from database.repository import InvoicesRepository, SuppliersRepository
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Paginazione a chiave: pagine piccole con più fatture nella stessa data
+            db = Database(os.path.join(temp_dir, 'pagine.db'))
+            invoices_repo = InvoicesRepository(db.connection)
+            for day in ('2024-04-01', '2024-04-02', '2024-04-01', '2024-03-31', '2024-04-01', '2024-04-02'):
+                invoices_repo.create({'date': day})
+            expected = [
+                (invoice['date'], invoice['id'])
+                for invoice in invoices_repo.get_by_date_range('2024-01-01', '2024-12-31')
+            ]
+            expected.sort(reverse=True)
+            pages = []
+            page, token = invoices_repo.get_page(limit=2)
+            pages.append(page)
+            while token is not None and len(pages) <= len(expected):
+                page, token = invoices_repo.get_page(limit=2, page_token=token)
+                pages.append(page)
+            seen = [(invoice['date'], invoice['id']) for page in pages for invoice in page]
+            if seen != expected or [len(page) for page in pages] != [2, 2, 2] or token is not None:
+                print(f"❌ Paginazione non corretta: {seen} (attese {expected})")
+                db.close()
+                return False
+            try:
+                invoices_repo.get_page(page_token='non-valido')
+                print("❌ Token di paginazione non valido accettato")
+                db.close()
+                return False
+            except ValueError:
+                pass
+            db.close()
+            print("✅ Paginazione senza salti né ripetizioni tra fatture della stessa data")
+            
+            db = Database(os.path.join(temp_dir, 'fatture.db'))
+            invoices_repo = InvoicesRepository(db.connection)
+            suppliers_repo = SuppliersRepository(db.connection)
+            
+            if not invoices_repo._has_search_index():
+                print("⚠️ FTS5 non disponibile, test ricerca saltato")
+                db.close()
+                return True
+            
+            def found(query):
+                return sorted(invoice['id'] for invoice in invoices_repo.search(query))
+            
+            supplier_id = suppliers_repo.create('Minerali Rossi')
+            first = invoices_repo.create({
+                'date': '2024-03-01', 'supplier_id': supplier_id, 'invoice_number': '2024/001',
+                'total_amount': 10.0, 'ocr_text': 'acqua frizzante'
+            })
+            second = invoices_repo.create({'date': '2024-03-02', 'invoice_number': '001/2024'})
+            
+            # Inserimento: parole cercate come prefisso, con estratto evidenziato
+            results = invoices_repo.search('miner')
+            if [r['id'] for r in results] != [first] or '[' not in results[0]['snippet'] or found('frizz') != [first]:
+                print(f"❌ Ricerca per prefisso non corretta: {results}")
+                db.close()
+                return False
+            print("✅ Ricerca per prefisso ('miner' trova 'Minerali')")
+            
+            # '2024/001' sono due parole: trova i numeri con entrambe, in qualsiasi ordine
+            if (InvoicesRepository._fts_match_query('2024/001') != '"2024"* "001"*'
+                    or found('2024/001') != [first, second] or found('2024/00') != [first, second]):
+                print(f"❌ Ricerca per numero fattura non corretta: {found('2024/001')}")
+                db.close()
+                return False
+            print("✅ Numero fattura diviso in parole cercate come prefissi")
+            
+            # Modifica di fattura e fornitore: l'indice segue i trigger
+            invoices_repo.update(first, {'ocr_text': 'vino rosso'})
+            suppliers_repo.update(supplier_id, 'Acque Bianchi')
+            if found('frizz') or found('vino') != [first] or found('miner') or found('bianchi') != [first]:
+                print("❌ Indice non aggiornato dopo la modifica")
+                db.close()
+                return False
+            print("✅ Indice aggiornato dai trigger di modifica")
+            
+            # Ricostruzione dell'indice
+            db.connection.execute("DELETE FROM invoices_fts")
+            db.connection.commit()
+            invoices_repo.rebuild_search_index()
+            if found('vino') != [first] or found('2024') != [first, second]:
+                print("❌ Ricostruzione dell'indice non corretta")
+                db.close()
+                return False
+            print("✅ Indice ricostruito da rebuild_invoices_fts")
+            
+            # Eliminazione
+            invoices_repo.delete(first)
+            if found('vino') or found('2024') != [second]:
+                print("❌ Fattura eliminata ancora nell'indice")
+                db.close()
+                return False
+            print("✅ Fattura eliminata rimossa dall'indice")
+            
+            db.close()
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Errore fatture: {e}")
+        return False
+
 def test_calculations():
     """Testa i calcoli delle vendite"""
     print("\n🧮 Testando calcoli...")
@@ -106,12 +493,561 @@ def test_calculations():
         print(f"✅ Incasso bancario: {calc.format_currency(bank_total)}")
         print(f"✅ Corrispettivo: {calc.format_currency(takings)}")
         
+        # Contenitore colonnare
+        from models.sale import SalesFrame
+        frame = SalesFrame()
+        frame.append(sale)
+        if calc.calculate_takings(frame.row(0)) != takings:
+            print("❌ SalesFrame non corrisponde alla vendita")
+            return False
+        print("✅ SalesFrame colonnare funzionante")
+        
+        # Calcolo a blocchi
+        batch = calc.calculate_batch(frame, [2500])
+        if batch['daily_profit'][0] / 100 != calc.calculate_daily_profit(sale, 25.0):
+            print("❌ Calcolo a blocchi non corrisponde")
+            return False
+        print("✅ Calcolo a blocchi funzionante")
+        
         return True
         
     except Exception as e:
         print(f"❌ Errore calcoli: {e}")
         return False
 
+def test_startup():
+    """Testa il tempo di avvio della finestra principale"""
+    print("\n⏱️ Testando avvio...")
+    
+    import json
+    import subprocess
+    import tempfile
+    
+    # Limite in secondi per import e costruzione della finestra (esclusi Qt e QApplication)
+    budget = float(os.getenv('GESTIONALE_STARTUP_BUDGET', '0.5'))
+    
+    # Avvio a freddo in un processo separato, su un database nuovo
+    script = (
+        "import json, sys, time\n"
+        "from PyQt5.QtWidgets import QApplication\n"
+        "app = QApplication([])\n"
+        "started = time.perf_counter()\n"
+        "from ui.main_window import MainWindow\n"
+        "window = MainWindow()\n"
+        "window.show()\n"
+        "elapsed = time.perf_counter() - started\n"
+        "heavy = [m for m in ('matplotlib', 'pytesseract') if m in sys.modules]\n"
+        "window.dashboard_tab.shutdown()\n"
+        "window.db.close()\n"
+        "print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))\n"
+    )
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen',
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            result = subprocess.run(
+                [sys.executable, '-c', script], cwd=temp_dir, env=env,
+                capture_output=True, text=True, timeout=60
+            )
+        if result.returncode != 0:
+            print(f"❌ Errore avvio: {result.stderr.strip().splitlines()[-1:]}")
+            return False
+        
+        startup = json.loads(result.stdout.strip().splitlines()[-1])
+        if startup['heavy']:
+            print(f"❌ Moduli pesanti caricati all'avvio: {', '.join(startup['heavy'])}")
+            return False
+        if startup['elapsed'] > budget:
+            print(f"❌ Avvio troppo lento: {startup['elapsed']:.2f}s (limite {budget:.2f}s)")
+            return False
+        print(f"✅ Finestra pronta in {startup['elapsed']:.2f}s")
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Errore avvio: {e}")
+        return False
+
+def test_csv_import():
+    """Testa l'importazione CSV a blocchi (senza interfaccia)"""
+    print("\n📥 Testando importazione CSV...")
+    
+    import tempfile
+    
+    try:
+        from database.schema import Database
+        from database.repository import PurchasesRepository, SalesRepository, SuppliersRepository
+        import threading
+        from datetime import datetime
+        from services.csv_import_engine import CSVImportCancelled, CSVImporter, read_preview
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = os.path.join(temp_dir, 'acquisti.csv')
+            with open(csv_path, 'w', encoding='utf-8') as file:
+                file.write("data;fornitore;descrizione;contante\n")
+                file.write("2024-03-01;AIA;uova;12.5\n")
+                file.write("02/03/2024;Nuovo Fornitore;farina;3\n")
+                file.write("\n")
+                file.write("03/03/2024;;senza fornitore;1\n")
+                file.write("04/03/2024;Nuovo Fornitore;zucchero;abc\n")
+                file.write("05/03/2024;AIA;latte;2\n")
+            
+            delimiter, preview = read_preview(csv_path, rows=2)
+            if delimiter != ';' or len(preview) != 3:
+                print(f"❌ Anteprima non corretta: {delimiter!r} {preview}")
+                return False
+            print("✅ Anteprima letta senza caricare il file")
+            
+            db = Database(os.path.join(temp_dir, 'test.db'))
+            mapping = {'date': 0, 'supplier_name': 1, 'description': 2, 'cash_payment': 3}
+            result = CSVImporter(db.connection, 'purchases', mapping, batch_size=2).run(csv_path)
+            
+            purchases = PurchasesRepository(db.connection).get_by_date_range('2024-03-01', '2024-03-31')
+            new_supplier = SuppliersRepository(db.connection).get_by_name('Nuovo Fornitore')
+            if (result.imported != 3 or [line for line, _ in result.errors] != [5, 6]
+                    or len(purchases) != 3 or new_supplier is None):
+                print(f"❌ Importazione acquisti non corretta: {result}")
+                db.close()
+                return False
+            print("✅ Acquisti importati a blocchi, righe errate segnalate")
+            
+            # Vendite: la stessa data viene aggiornata, non duplicata
+            sales_path = os.path.join(temp_dir, 'vendite.csv')
+            with open(sales_path, 'w', encoding='utf-8') as file:
+                file.write("data,contante\n2024-03-01,100\n2024-03-01,150\n")
+            CSVImporter(db.connection, 'sales', {'date': 0, 'cash_income': 1}).run(sales_path)
+            sale = SalesRepository(db.connection).get_by_date('2024-03-01')
+            if sale is None or sale['cash_income'] != 150.0:
+                print(f"❌ Importazione vendite non corretta: {sale}")
+                db.close()
+                return False
+            print("✅ Vendite importate con aggiornamento delle date esistenti")
+            
+            # Formato date riconosciuto dal file; date non valide segnalate (non sostituite con oggi)
+            dates_path = os.path.join(temp_dir, 'vendite_date.csv')
+            with open(dates_path, 'w', encoding='utf-8') as file:
+                file.write("data,contante\n01/06/2024,10\n31/02/2024,20\n,30\n2024-06-02,40\nieri,50\n03/06/2024,60\n"
+                           "04/06/2024 08:30,70\n05/06/2024 abc,80\n")
+            result = CSVImporter(db.connection, 'sales', {'date': 0, 'cash_income': 1}).run(dates_path)
+            today = SalesRepository(db.connection).get_by_date(datetime.now().strftime('%Y-%m-%d'))
+            if (result.date_format != 'DD/MM/YYYY' or result.imported != 4
+                    or [line for line, _ in result.errors] != [3, 4, 6, 9] or today is not None):
+                print(f"❌ Conversione date non corretta: {result}")
+                db.close()
+                return False
+            print("✅ Formato date riconosciuto, date non valide segnalate (anche con testo dopo la data)")
+            
+            # Interruzione dopo il primo blocco e ripresa dal punto salvato
+            resume_path = os.path.join(temp_dir, 'vendite_aprile.csv')
+            with open(resume_path, 'w', encoding='utf-8') as file:
+                file.write("data,contante\n")
+                for day in range(1, 6):
+                    file.write(f"2024-04-0{day},{day}0\n")
+            
+            mapping = {'date': 0, 'cash_income': 1}
+            cancel_event = threading.Event()
+            try:
+                CSVImporter(db.connection, 'sales', mapping, batch_size=2).run(
+                    resume_path, on_progress=lambda *_: cancel_event.set(),
+                    cancel_event=cancel_event
+                )
+                print("❌ Importazione non interrotta")
+                db.close()
+                return False
+            except CSVImportCancelled:
+                pass
+            
+            sales_repo = SalesRepository(db.connection)
+            if len(sales_repo.get_by_date_range('2024-04-01', '2024-04-30')) != 2:
+                print("❌ Il primo blocco non è stato salvato")
+                db.close()
+                return False
+            
+            result = CSVImporter(db.connection, 'sales', mapping, batch_size=2).run(resume_path)
+            sales = sales_repo.get_by_date_range('2024-04-01', '2024-04-30')
+            cursor = db.connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM csv_import_checkpoints")
+            if (result.resumed_from != 3 or result.imported != 5 or len(sales) != 5
+                    or cursor.fetchone()[0] != 0):
+                print(f"❌ Ripresa importazione non corretta: {result}")
+                db.close()
+                return False
+            print("✅ Importazione interrotta ripresa dall'ultimo blocco scritto")
+            
+            # Fornitori abbinati in memoria: maiuscole, spazi e nomi alternativi
+            suppliers_repo = SuppliersRepository(db.connection)
+            aia_id = suppliers_repo.get_by_name('AIA')['id']
+            suppliers_repo.add_alias('Allevamenti AIA', aia_id)
+            names_path = os.path.join(temp_dir, 'acquisti_nomi.csv')
+            with open(names_path, 'w', encoding='utf-8') as file:
+                file.write("data,fornitore,contante\n")
+                for name in ('aia', '  AIA ', 'allevamenti  aia', 'Forno Rossi', 'FORNO ROSSI'):
+                    file.write(f"2024-05-01,{name},1\n")
+            
+            queries = []
+            db.connection.set_trace_callback(queries.append)
+            CSVImporter(db.connection, 'purchases', {'date': 0, 'supplier_name': 1, 'cash_payment': 2}).run(names_path)
+            db.connection.set_trace_callback(None)
+            
+            supplier_ids = [p['supplier_id'] for p in PurchasesRepository(db.connection).get_by_date('2024-05-01')]
+            supplier_queries = [q for q in queries if q.lstrip().upper().startswith('SELECT') and 'suppliers' in q]
+            if (supplier_ids.count(aia_id) != 3 or len(set(supplier_ids)) != 2
+                    or len(supplier_queries) > 3 or len(suppliers_repo.search('Forno Rossi')) != 1):
+                print(f"❌ Risoluzione fornitori non corretta: {supplier_ids} {supplier_queries}")
+                db.close()
+                return False
+            print("✅ Fornitori risolti in memoria (maiuscole, spazi e nomi alternativi)")
+            
+            db.close()
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Errore importazione CSV: {e}")
+        return False
+
+def test_cli():
+    """Testa la riga di comando (importazione, esportazione e report senza Qt)"""
+    print("\n⌨️ Testando riga di comando...")
+    
+    import subprocess
+    import tempfile
+    
+    try:
+        import gestionale
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            base_dir = os.path.dirname(os.path.abspath(__file__))
+            db_path = os.path.join(temp_dir, 'test.db')
+            export_path = os.path.join(temp_dir, 'spese.csv')
+            
+            code = gestionale.main(['--db', db_path, 'import', os.path.join(base_dir, 'esempio_spese.csv'), '--type', 'purchases'])
+            if code != 0:
+                print(f"❌ Importazione da riga di comando fallita ({code})")
+                return False
+            
+            # L'esportazione usa le chiavi dei campi: si reimporta senza mappatura
+            gestionale.main(['--db', db_path, 'export', 'purchases', export_path])
+            copy_path = os.path.join(temp_dir, 'copia.db')
+            gestionale.main(['--db', copy_path, 'import', export_path, '--type', 'purchases'])
+            
+            from database.schema import Database
+            from database.repository import TotalsRepository
+            totals = []
+            for path in (db_path, copy_path):
+                db = Database(path)
+                totals.append(TotalsRepository(db.connection).get_period_summary('2024-01-01', '2024-12-31'))
+                db.close()
+            if totals[0]['purchases_total'] == 0 or totals[0] != totals[1]:
+                print(f"❌ Esportazione e reimportazione non coincidono: {totals}")
+                return False
+            print("✅ Importazione ed esportazione da riga di comando")
+            
+            # Il modulo non deve caricare PyQt5
+            check = subprocess.run(
+                [sys.executable, '-c', "import sys, gestionale; sys.exit('PyQt5' in sys.modules)"],
+                cwd=base_dir
+            )
+            if check.returncode != 0:
+                print("❌ La riga di comando carica PyQt5")
+                return False
+            print("✅ Riga di comando senza interfaccia grafica")
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Errore riga di comando: {e}")
+        return False
+
+def test_invoice_ingestion():
+    """Testa l'importazione di fatture da cartella con coda persistente"""
+    print("\n📂 Testando importazione fatture da cartella...")
+    
+    import shutil
+    import tempfile
+    import time
+    
+    try:
+        import fitz
+    except ImportError:
+        print("⚠️ PyMuPDF non installato, test saltato")
+        return True
+    
+    cache_dir = os.environ.get('GESTIONALE_CACHE_DIR')
+    try:
+        from database.schema import Database
+        from database.repository import InvoiceJobsRepository, InvoicesRepository
+        from services.invoice_ingestion import InvoiceIngestionService
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ['GESTIONALE_CACHE_DIR'] = os.path.join(temp_dir, 'cache')
+            folder = os.path.join(temp_dir, 'fatture')
+            os.makedirs(folder)
+            
+            # PDF digitali (testo nativo, nessun OCR) e una copia con altro nome
+            for number, supplier in ((1, 'GranTerre'), (2, 'AIA')):
+                document = fitz.open()
+                document.new_page().insert_text(
+                    (72, 72), f"Fattura F{number}/24 del 0{number}/03/2024\n{supplier} S.r.l.\nTotale: 1.234,5{number} EUR"
+                )
+                document.save(os.path.join(folder, f'fattura_{number}.pdf'))
+                document.close()
+            shutil.copy(os.path.join(folder, 'fattura_1.pdf'), os.path.join(folder, 'copia.pdf'))
+            
+            db = Database(os.path.join(temp_dir, 'test.db'))
+            jobs_repo = InvoiceJobsRepository(db.connection)
+            service = InvoiceIngestionService(db)
+            
+            # Crash simulato: un file preso in carico e mai completato
+            queued = service.scan_folder(folder)
+            jobs_repo.claim(1)
+            summary = service.process()
+            
+            invoices = InvoicesRepository(db.connection).get_all()
+            if queued != 2 or summary.imported != 2 or jobs_repo.count_by_status() != {'done': 2}:
+                print(f"❌ Coda non corretta: {summary}")
+                service.shutdown()
+                db.close()
+                return False
+            print("✅ File deduplicati per hash e ripresi dopo l'interruzione")
+            
+            by_number = {invoice['invoice_number']: invoice for invoice in invoices}
+            first = by_number.get('F1/24')
+            if (first is None or first['date'] != '2024-03-01' or first['total_amount'] != 1234.51
+                    or first['supplier_name'] != 'GranTerre'):
+                print(f"❌ Dati fattura non corretti: {first}")
+                service.shutdown()
+                db.close()
+                return False
+            print("✅ Dati estratti e fornitore abbinato")
+            
+            # Una seconda scansione non accoda nulla
+            if service.ingest_folder(folder).queued != 0:
+                print("❌ File già importati accodati di nuovo")
+                service.shutdown()
+                db.close()
+                return False
+            print("✅ File già importati ignorati")
+            
+            # Un file toccato viene riletto una sola volta, senza tornare in coda
+            touched = os.path.join(folder, 'fattura_2.pdf')
+            os.utime(touched, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+            queued = service.scan_folder(folder)
+            signature = jobs_repo.known_files().get(touched)
+            if (queued != 0 or jobs_repo.count_by_status() != {'done': 2}
+                    or signature != (os.stat(touched).st_size, os.stat(touched).st_mtime_ns)):
+                print(f"❌ File toccato non aggiornato in coda: {signature}")
+                service.shutdown()
+                db.close()
+                return False
+            print("✅ Data di modifica aggiornata senza riaccodare il file")
+            
+            service.shutdown()
+            db.close()
+        
+            # Stessa importazione da riga di comando, su un database nuovo
+            import gestionale
+            cli_db_path = os.path.join(temp_dir, 'cli.db')
+            code = gestionale.main(['--db', cli_db_path, 'ingest', folder])
+            db = Database(cli_db_path)
+            count = len(InvoicesRepository(db.connection).get_all())
+            db.close()
+            if code != 0 or count != 2:
+                print(f"❌ Importazione cartella da riga di comando non corretta ({code}, {count})")
+                return False
+            print("✅ Importazione cartella da riga di comando")
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Errore importazione cartella: {e}")
+        return False
+    
+    finally:
+        if cache_dir is None:
+            os.environ.pop('GESTIONALE_CACHE_DIR', None)
+        else:
+            os.environ['GESTIONALE_CACHE_DIR'] = cache_dir
+
+def test_tesseract_cache():
+    """Testa la cache su disco del rilevamento di Tesseract con un eseguibile finto"""
+    import tempfile
+    from services import ocr_capabilities
+    
+    saved_env = {name: os.environ.get(name) for name in ('PATH', 'GESTIONALE_CACHE_DIR')}
+    saved_capabilities = ocr_capabilities._capabilities
+    
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bin_dir = os.path.join(temp_dir, 'bin')
+            os.makedirs(bin_dir)
+            calls_path = os.path.join(temp_dir, 'calls.log')
+            tesseract_path = os.path.join(bin_dir, 'tesseract')
+            with open(tesseract_path, 'w') as file:
+                file.write(
+                    '#!/bin/sh\n'
+                    f'echo "$1" >> "{calls_path}"\n'
+                    'if [ "$1" = "--version" ]; then echo "tesseract 5.3.0"; exit 0; fi\n'
+                    'printf "List of available languages (2):\\neng\\nita\\n"\n'
+                )
+            os.chmod(tesseract_path, 0o755)
+            
+            os.environ['PATH'] = bin_dir + os.pathsep + (saved_env['PATH'] or '')
+            os.environ['GESTIONALE_CACHE_DIR'] = os.path.join(temp_dir, 'cache')
+            
+            def probe_count():
+                if not os.path.exists(calls_path):
+                    return 0
+                with open(calls_path) as file:
+                    return len(file.read().split())
+            
+            ocr_capabilities._capabilities = None
+            first = ocr_capabilities.get_tesseract_capabilities()
+            if (first.path != tesseract_path or first.version != '5.3.0'
+                    or first.languages != ['eng', 'ita'] or probe_count() != 2):
+                print(f"❌ Rilevamento Tesseract non corretto: {first}")
+                return False
+            
+            # Backend PDF: verificati a ogni richiesta, non salvati nella cache
+            import json
+            with open(os.path.join(temp_dir, 'cache', ocr_capabilities.CACHE_FILE_NAME)) as file:
+                saved = json.load(file)
+            if first.pdf_backends != ocr_capabilities.find_pdf_backends() or 'pdf_backends' in saved:
+                print(f"❌ Backend PDF non corretti: {first.pdf_backends} {saved}")
+                return False
+            
+            # Nuovo avvio (memoria vuota): si legge il file senza avviare l'eseguibile
+            ocr_capabilities._capabilities = None
+            cached = ocr_capabilities.get_tesseract_capabilities()
+            if cached != first or probe_count() != 2:
+                print(f"❌ Cache di Tesseract non riutilizzata ({probe_count()} avvii)")
+                return False
+            print("✅ Cache di Tesseract riutilizzata senza avviare l'eseguibile")
+            
+            # Eseguibile aggiornato: la cache non vale più
+            stat = os.stat(tesseract_path)
+            os.utime(tesseract_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            ocr_capabilities._capabilities = None
+            updated = ocr_capabilities.get_tesseract_capabilities()
+            if probe_count() != 4 or updated.mtime == first.mtime:
+                print(f"❌ Cache di Tesseract non invalidata ({probe_count()} avvii)")
+                return False
+            print("✅ Cache di Tesseract invalidata quando l'eseguibile cambia")
+        
+        return True
+    
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        ocr_capabilities._capabilities = saved_capabilities
+
+def test_ocr():
+    """Testa i moduli OCR che non richiedono Tesseract"""
+    print("\n🔍 Testando moduli OCR...")
+    
+    import tempfile
+    
+    try:
+        from PIL import Image
+        from services.ocr_capabilities import TesseractCapabilities
+        from services.ocr_engine import OCREngine
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Lingua mancante: errore chiaro prima di avviare l'OCR
+            image_path = os.path.join(temp_dir, 'scontrino.png')
+            Image.new('RGB', (50, 50), 'white').save(image_path)
+            engine = OCREngine(capabilities=TesseractCapabilities(path='tesseract', languages=['eng']))
+            try:
+                list(engine.iter_pages([image_path]))
+                print("❌ Lingua mancante non segnalata")
+                return False
+            except Exception as e:
+                if 'non installata' not in str(e) or engine._executor is not None:
+                    print(f"❌ Errore lingua non corretto: {e}")
+                    return False
+            print("✅ Lingua OCR mancante segnalata prima dell'elaborazione")
+        
+            # PDF misto: solo la pagina senza testo nativo va in OCR
+            try:
+                import fitz
+            except ImportError:
+                print("⚠️ PyMuPDF non installato, test PDF misto saltato")
+            else:
+                pdf_path = os.path.join(temp_dir, 'misto.pdf')
+                document = fitz.open()
+                document.new_page().insert_text((72, 72), "Fattura F1/24 del 01/03/2024\nTotale: 1.234,50 EUR")
+                document.new_page()  # Pagina scansionata: nessun testo
+                document.save(pdf_path)
+                document.close()
+                ready, tasks = OCREngine().build_tasks([pdf_path])
+                if ([(r.page, r.page_count, r.from_text_layer) for r in ready] != [(0, 2, True)]
+                        or 'F1/24' not in ready[0].text
+                        or [(t.page, t.page_count, t.is_pdf) for t in tasks] != [(1, 2, True)]
+                        or 'pymupdf' not in tasks[0].pdf_backends):
+                    print(f"❌ Pagine del PDF misto non corrette: {ready} {tasks}")
+                    return False
+                print("✅ PDF misto: pagina con testo nativo pronta, pagina vuota in OCR")
+                
+                # Nessun backend PDF: errore chiaro invece di ImportError
+                from services.ocr_engine import PDF_BACKEND_MISSING, count_pdf_pages, extract_text_layer
+                try:
+                    count_pdf_pages(pdf_path, ())
+                    print("❌ PDF letto senza backend")
+                    return False
+                except Exception as e:
+                    if str(e) != PDF_BACKEND_MISSING or extract_text_layer(pdf_path, ()) is not None:
+                        print(f"❌ Errore senza backend PDF non corretto: {e}")
+                        return False
+                print("✅ Backend PDF mancanti segnalati")
+            
+            # Cache dei risultati: spazio per due voci, esce la meno usata di recente
+            import sqlite3
+            import time
+            from services.ocr_cache import OCRCache
+            from services.ocr_service import OCRService
+            cache = OCRCache(os.path.join(temp_dir, 'ocr_cache.db'), max_bytes=100)
+            cache.put('a', 'x' * 40, {'number': '1'})
+            time.sleep(0.02)
+            cache.put('b', 'y' * 40, {})
+            time.sleep(0.02)
+            if cache.get('a') != ('x' * 40, {'number': '1'}):
+                print("❌ Risultato OCR non letto dalla cache")
+                cache.close()
+                return False
+            time.sleep(0.02)
+            cache.put('c', 'z' * 40, {})
+            cache.put('d', 'w' * 200, {})  # Più grande dell'intera cache: non salvato
+            if cache.get('b') is not None or cache.get('a') is None or cache.get('c') is None or cache.get('d') is not None:
+                print("❌ Eliminazione LRU della cache OCR non corretta")
+                cache.close()
+                return False
+            print("✅ Cache OCR con eliminazione delle voci meno recenti")
+            
+            # Il servizio chiude la cache aperta
+            service = OCRService()
+            service._cache = cache
+            service.close()
+            try:
+                cache.get('a')
+                print("❌ Cache OCR non chiusa dal servizio")
+                return False
+            except sqlite3.ProgrammingError:
+                pass
+            print("✅ Cache OCR chiusa alla chiusura del servizio")
+        
+        if sys.platform != 'win32' and not test_tesseract_cache():
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Errore moduli OCR: {e}")
+        return False
+
 def main():
     """Funzione principale di test"""
     print("🚀 Test Gestionale Negozio")
@@ -121,7 +1057,14 @@ def main():
     tests = [
         test_imports,
         test_database,
-        test_calculations
+        test_migration,
+        test_invoices,
+        test_calculations,
+        test_csv_import,
+        test_cli,
+        test_invoice_ingestion,
+        test_ocr,
+        test_startup
     ]
     
     passed = 0
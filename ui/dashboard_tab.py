@@ -8,14 +8,9 @@ from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
     QLabel, QFrame, QPushButton, QScrollArea
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QObject, QRunnable, QThreadPool, QDateTime, pyqtSignal
 from PyQt5.QtGui import QFont, QPalette
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import matplotlib.dates as mdates
-from datetime import datetime, timedelta
-import sqlite3
+from services.dashboard_stats import DashboardStatsService, STATS_TABLES
 
 
 class StatCard(QFrame):
@@ -86,7 +81,14 @@ class StatCard(QFrame):
 
 
 class ChartWidget(QWidget):
-    """Widget per grafici matplotlib"""
+    """
+    Widget per grafici matplotlib.
+    
+    Assi e stile vengono creati una sola volta: ad ogni aggiornamento
+    cambiano solo i dati degli artisti. Se i dati sono identici al
+    disegno precedente il grafico non viene ridisegnato; se i limiti
+    degli assi non cambiano si ridisegnano solo le serie (blitting).
+    """
     
     def __init__(self, title="Grafico"):
         super().__init__()
@@ -103,46 +105,139 @@ class ChartWidget(QWidget):
         """)
         layout.addWidget(title_label)
         
-        # Figura matplotlib
+        # La figura matplotlib viene creata al primo grafico (import pesante,
+        # rimandato a dopo la comparsa della finestra)
+        self.placeholder = QWidget()
+        self.placeholder.setMinimumHeight(300)
+        layout.addWidget(self.placeholder)
+        self.setLayout(layout)
+    
+        self.figure = None
+        self.canvas = None
+        self.ax = None
+        self._data_hash = None   # Dati dell'ultimo disegno
+        self._artists = []       # Artisti ricreati ad ogni aggiornamento
+        self._line = None        # Linea vendite (aggiornata in place)
+        self._background = None  # Sfondo (assi, griglia, etichette) per il blitting
+        
+    def _ensure_axes(self):
+        """Crea figura, canvas e assi stilizzati (solo al primo grafico)"""
+        if self.ax is not None:
+            return self.ax
+        
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+        
         self.figure = Figure(figsize=(8, 4), facecolor='#424242')
         self.canvas = FigureCanvas(self.figure)
         self.canvas.setStyleSheet("background-color: #424242; border-radius: 8px;")
-        
-        layout.addWidget(self.canvas)
-        self.setLayout(layout)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.mpl_connect('resize_event', self._on_resize)
     
-    def plot_sales_trend(self, dates, values):
-        """Grafico andamento vendite"""
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        
-        ax.plot(dates, values, color='#2196F3', linewidth=2, marker='o', markersize=4)
-        ax.fill_between(dates, values, alpha=0.3, color='#2196F3')
+        self.layout().replaceWidget(self.placeholder, self.canvas)
+        self.placeholder.deleteLater()
+        self.placeholder = None
         
+        ax = self.figure.add_subplot(111)
         ax.set_facecolor('#424242')
         ax.tick_params(colors='white')
         ax.xaxis.label.set_color('white')
         ax.yaxis.label.set_color('white')
-        ax.spines['bottom'].set_color('white')
-        ax.spines['top'].set_color('white')
-        ax.spines['right'].set_color('white')
-        ax.spines['left'].set_color('white')
-        
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
-        ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
-        plt.setp(ax.xaxis.get_majorticklabels(), rotation=45)
-        
-        ax.set_ylabel('Vendite (€)', color='white')
-        ax.grid(True, alpha=0.3, color='white')
-        
-        self.figure.tight_layout()
-        self.canvas.draw()
+        for spine in ax.spines.values():
+            spine.set_color('white')
+        
+        self.ax = ax
+        return ax
+        
+    def _on_draw(self, event):
+        """Dopo un disegno completo salva lo sfondo e disegna le serie animate"""
+        if self.ax is None:
+            return
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()
+        
+    def _on_resize(self, event):
+        """Ricalcola i margini solo quando cambia la dimensione"""
+        self._background = None
+        if self.ax is not None:
+            self.figure.tight_layout()
+    
+    def _draw_artists(self):
+        """Disegna gli artisti animati (esclusi dal disegno normale)"""
+        for artist in (*self._artists, self._line):
+            if artist is not None and artist.get_animated():
+                self.ax.draw_artist(artist)
+    
+    def _remove_artists(self):
+        """Rimuove gli artisti della serie precedente"""
+        for artist in self._artists:
+            artist.remove()
+        self._artists = []
+    
+    @staticmethod
+    def _hash_data(*data):
+        """Impronta dei dati di un grafico"""
+        return hash(tuple(tuple(values) for values in data))
+    
+    def plot_sales_trend(self, dates, values):
+        """Grafico andamento vendite"""
+        data_hash = self._hash_data(dates, values)
+        if data_hash == self._data_hash:
+            return
+        
+        first_plot = self.ax is None
+        ax = self._ensure_axes()
+        limits = (ax.get_xlim(), ax.get_ylim())
+        
+        import matplotlib.dates as mdates
+        
+        if self._line is None:
+            self._line, = ax.plot(dates, values, color='#2196F3', linewidth=2,
+                                  marker='o', markersize=4, animated=True)
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
+            ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
+            ax.tick_params(axis='x', labelrotation=45)
+            ax.set_ylabel('Vendite (€)', color='white')
+            ax.grid(True, alpha=0.3, color='white')
+        else:
+            self._line.set_data(dates, values)
+        
+        # L'area sotto la linea non si aggiorna in place: si sostituisce solo lei
+        self._remove_artists()
+        fill = ax.fill_between(dates, values, alpha=0.3, color='#2196F3', animated=True)
+        self._artists = [fill]
+        
+        # Limiti dai dati della linea, includendo lo zero (base dell'area)
+        ax.relim()
+        if dates:
+            ax.update_datalim([(mdates.date2num(dates[0]), 0)])
+        ax.autoscale_view()
+        
+        if first_plot:
+            self.figure.tight_layout()
+        
+        if self._background is not None and limits == (ax.get_xlim(), ax.get_ylim()):
+            # Stessi assi: ridisegna solo le serie sopra lo sfondo salvato
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(ax.bbox)
+        else:
+            # Cambiati limiti o etichette: disegno completo (lo sfondo viene risalvato)
+            self.canvas.draw_idle()
+        
+        self._data_hash = data_hash
     
     def plot_expenses_pie(self, labels, values):
         """Grafico a torta delle spese"""
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
+        data_hash = self._hash_data(labels, values)
+        if data_hash == self._data_hash:
+            return
         
+        first_plot = self.ax is None
+        ax = self._ensure_axes()
+        
+        # Spicchi ed etichette dipendono dal numero di fornitori: si sostituiscono
+        self._remove_artists()
         colors = ['#2196F3', '#4CAF50', '#FF9800', '#F44336', '#9C27B0']
         wedges, texts, autotexts = ax.pie(values, labels=labels, autopct='%1.1f%%',
                                          colors=colors, startangle=90)
@@ -152,24 +247,64 @@ class ChartWidget(QWidget):
         for autotext in autotexts:
             autotext.set_color('white')
             autotext.set_weight('bold')
+        self._artists = [*wedges, *texts, *autotexts]
         
-        ax.set_facecolor('#424242')
-        self.figure.tight_layout()
-        self.canvas.draw()
+        if first_plot:
+            self.figure.tight_layout()
+        self.canvas.draw_idle()
+        
+        self._data_hash = data_hash
+
+
+class StatsWorkerSignals(QObject):
+    """Segnali del worker statistiche (QRunnable non è un QObject)"""
+    
+    finished = pyqtSignal(int, object)  # generazione, DashboardStats
+    error = pyqtSignal(int, str)
+
+
+class StatsWorker(QRunnable):
+    """Calcola le statistiche della dashboard in un thread del pool"""
+    
+    def __init__(self, db, generation):
+        super().__init__()
+        self.db = db
+        self.generation = generation
+        self.signals = StatsWorkerSignals()
+    
+    def run(self):
+        try:
+            # Connessione del thread del pool, non quella del thread GUI
+            service = DashboardStatsService(self.db.get_connection())
+            self.signals.finished.emit(self.generation, service.get_stats())
+        except Exception as e:
+            self.signals.error.emit(self.generation, str(e))
 
 
 class DashboardTab(QWidget):
     """Tab principale con dashboard e statistiche"""
     
-    def __init__(self, db_connection):
+    def __init__(self, db):
         super().__init__()
-        self.db_connection = db_connection
+        self.db = db
+        
+        # Un solo thread dedicato (e quindi una sola connessione di lettura)
+        self.stats_pool = QThreadPool(self)
+        self.stats_pool.setMaxThreadCount(1)
+        self.stats_pool.setExpiryTimeout(-1)
+        
+        self.stats_worker = None      # Aggiornamento in corso
+        self.stats_generation = 0     # Numero dell'ultimo aggiornamento avviato
+        self.refresh_pending = False  # Richiesto un aggiornamento durante quello in corso
+        
         self.init_ui()
         
-        # Timer per aggiornamento automatico
-        self.refresh_timer = QTimer()
-        self.refresh_timer.timeout.connect(self.refresh_data)
-        self.refresh_timer.start(30000)  # Aggiorna ogni 30 secondi
+        # Nessun aggiornamento periodico: si aggiorna quando cambiano i dati
+        # (on_data_changed) e a mezzanotte, quando cambiano "oggi" e il mese
+        self.midnight_timer = QTimer(self)
+        self.midnight_timer.setSingleShot(True)
+        self.midnight_timer.timeout.connect(self.on_day_changed)
+        self.schedule_midnight_refresh()
         
         # Carica dati iniziali
         self.refresh_data()
@@ -279,120 +414,93 @@ class DashboardTab(QWidget):
         layout.addLayout(charts_layout)
     
     def refresh_data(self):
-        """Aggiorna tutti i dati del dashboard"""
-        try:
-            cursor = self.db_connection.cursor()
+        """
+        Richiede l'aggiornamento dei dati del dashboard.
             
-            # Vendite oggi
-            today = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute("""
-                SELECT COALESCE(SUM(cash_income + coin_income + card_gross + satispay_gross), 0) 
-                FROM sales 
-                WHERE date = ?
-            """, (today,))
-            sales_today = cursor.fetchone()[0]
-            self.sales_today_card.update_value(f"€ {sales_today:.2f}")
+        Le query vengono eseguite in background: se un aggiornamento è già
+        in corso, il suo risultato viene scartato (non più attuale) e ne
+        parte uno nuovo appena termina.
+        """
+        if self.stats_worker is not None:
+            self.refresh_pending = True
+            return
             
-            # Vendite mese
-            month_start = datetime.now().replace(day=1).strftime('%Y-%m-%d')
-            cursor.execute("""
-                SELECT COALESCE(SUM(cash_income + coin_income + card_gross + satispay_gross), 0) 
-                FROM sales 
-                WHERE date >= ?
-            """, (month_start,))
-            sales_month = cursor.fetchone()[0]
-            self.sales_month_card.update_value(f"€ {sales_month:.2f}")
+        self.refresh_pending = False
+        self.stats_generation += 1
             
-            # Spese mese
-            cursor.execute("""
-                SELECT COALESCE(SUM(cash_payment + bank_payment), 0) 
-                FROM purchases 
-                WHERE date >= ?
-            """, (month_start,))
-            expenses_month = cursor.fetchone()[0]
-            self.expenses_month_card.update_value(f"€ {expenses_month:.2f}")
-            
-            # Profitto
-            profit = sales_month - expenses_month
-            self.profit_card.update_value(f"€ {profit:.2f}")
-            
-            # Fatture pending
-            try:
-                cursor.execute("""
-                    SELECT COUNT(*) 
-                    FROM invoices 
-                    WHERE ocr_status = 'pending' OR ocr_status IS NULL
-                """)
-                result = cursor.fetchone()
-                pending_invoices = result[0] if result else 0
-            except:
-                pending_invoices = 0
-            self.invoices_pending_card.update_value(str(pending_invoices))
-            
-            # Fornitori attivi
-            cursor.execute("""
-                SELECT COUNT(DISTINCT supplier_id) 
-                FROM purchases 
-                WHERE date >= ?
-            """, (month_start,))
-            active_suppliers = cursor.fetchone()[0]
-            self.suppliers_card.update_value(str(active_suppliers))
-            
-            # Aggiorna grafici
-            self.update_sales_chart(cursor)
-            self.update_expenses_chart(cursor)
-            
-        except Exception as e:
-            print(f"Errore aggiornamento dashboard: {e}")
+        self.stats_worker = StatsWorker(self.db, self.stats_generation)
+        self.stats_worker.signals.finished.connect(self.on_stats_ready)
+        self.stats_worker.signals.error.connect(self.on_stats_error)
+        self.stats_pool.start(self.stats_worker)
+    
+    def on_data_changed(self, changes):
+        """Aggiorna solo se le modifiche riguardano il periodo mostrato"""
+        start, end = DashboardStatsService.period()
+        if any(change.affects(STATS_TABLES, start.isoformat(), end.isoformat()) for change in changes):
+            self.refresh_data()
     
-    def update_sales_chart(self, cursor):
-        """Aggiorna il grafico delle vendite"""
+    def schedule_midnight_refresh(self):
+        """Programma l'aggiornamento al cambio di giorno"""
+        now = QDateTime.currentDateTime()
+        midnight = QDateTime(now.date().addDays(1))
+        self.midnight_timer.start(max(1000, now.msecsTo(midnight) + 1000))
+    
+    def on_day_changed(self):
+        """Cambio di giorno: le card e il grafico si spostano sul nuovo giorno"""
+        self.refresh_data()
+        self.schedule_midnight_refresh()
+    
+    def on_stats_ready(self, generation, stats):
+        """Mostra le statistiche calcolate dal worker"""
+        if not self._finish_refresh(generation):
+            return
+        
+        self.sales_today_card.update_value(f"€ {stats.sales_today:.2f}")
+        self.sales_month_card.update_value(f"€ {stats.sales_month:.2f}")
+        self.expenses_month_card.update_value(f"€ {stats.expenses_month:.2f}")
+        self.profit_card.update_value(f"€ {stats.profit_month:.2f}")
+        self.invoices_pending_card.update_value(str(stats.invoices_pending))
+        self.suppliers_card.update_value(str(stats.active_suppliers))
+        
+        # Aggiorna grafici
+        self.update_sales_chart(stats)
+        self.update_expenses_chart(stats)
+    
+    def on_stats_error(self, generation, message):
+        """Errore del worker statistiche"""
+        if self._finish_refresh(generation):
+            print(f"Errore aggiornamento dashboard: {message}")
+    
+    def _finish_refresh(self, generation):
+        """
+        Chiude l'aggiornamento in corso.
+        
+        Returns:
+            False se il risultato è superato (e in tal caso ne avvia uno nuovo)
+        """
+        self.stats_worker = None
+        
+        if self.refresh_pending or generation != self.stats_generation:
+            self.refresh_data()
+            return False
+        return True
+    
+    def shutdown(self):
+        """Attende la fine dell'aggiornamento in corso (prima di chiudere il database)"""
+        self.midnight_timer.stop()
+        self.stats_pool.waitForDone()
+    
+    def update_sales_chart(self, stats):
+        """Aggiorna il grafico delle vendite (ultimi 7 giorni)"""
         try:
-            # Ultimi 7 giorni
-            dates = []
-            values = []
-            
-            for i in range(6, -1, -1):
-                date = datetime.now() - timedelta(days=i)
-                date_str = date.strftime('%Y-%m-%d')
-                
-                cursor.execute("""
-                    SELECT COALESCE(SUM(cash_income + coin_income + card_gross + satispay_gross), 0) 
-                    FROM sales 
-                    WHERE date = ?
-                """, (date_str,))
-                
-                daily_sales = cursor.fetchone()[0]
-                dates.append(date)
-                values.append(float(daily_sales))
-            
-            self.sales_chart.plot_sales_trend(dates, values)
-            
+            self.sales_chart.plot_sales_trend(stats.series_dates, stats.series_values)
         except Exception as e:
             print(f"Errore aggiornamento grafico vendite: {e}")
     
-    def update_expenses_chart(self, cursor):
+    def update_expenses_chart(self, stats):
         """Aggiorna il grafico delle spese"""
         try:
-            month_start = datetime.now().replace(day=1).strftime('%Y-%m-%d')
-            
-            cursor.execute("""
-                SELECT s.name, COALESCE(SUM(p.cash_payment + p.bank_payment), 0)
-                FROM suppliers s
-                LEFT JOIN purchases p ON s.id = p.supplier_id 
-                    AND p.date >= ?
-                GROUP BY s.id, s.name
-                HAVING SUM(p.cash_payment + p.bank_payment) > 0
-                ORDER BY SUM(p.cash_payment + p.bank_payment) DESC
-                LIMIT 5
-            """, (month_start,))
-            
-            results = cursor.fetchall()
-            
-            if results:
-                labels = [row[0] for row in results]
-                values = [float(row[1]) for row in results]
-                self.expenses_chart.plot_expenses_pie(labels, values)
-            
+            if stats.expense_labels:
+                self.expenses_chart.plot_expenses_pie(stats.expense_labels, stats.expense_values)
         except Exception as e:
-            print(f"Errore aggiornamento grafico spese: {e}")
\ No newline at end of file
+            print(f"Errore aggiornamento grafico spese: {e}")
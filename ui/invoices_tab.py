@@ -7,13 +7,15 @@ from PyQt5.QtWidgets import (
     QFileDialog, QSplitter, QAbstractItemView, QProgressBar,
     QTabWidget, QScrollArea
 )
-from PyQt5.QtCore import Qt, QDate, pyqtSignal, QThread
+from PyQt5.QtCore import Qt, QDate, pyqtSignal, QThread, QTimer
 from PyQt5.QtGui import QDoubleValidator, QFont, QPixmap
 from datetime import datetime
 import os
 import tempfile
+import threading
 from models.invoice import Invoice
 from services.ocr_service import OCRService
+from services.ocr_engine import OCREngine, OCRCancelledError
 
 
 class OCRWorker(QThread):
@@ -21,25 +23,91 @@ class OCRWorker(QThread):
     
     finished = pyqtSignal(str, dict)  # testo, dati_estratti
     error = pyqtSignal(str)
+    progress = pyqtSignal(int, int)  # pagine completate, pagine totali
+    cancelled = pyqtSignal()
     
-    def __init__(self, ocr_service, file_path, operation_type):
+    def __init__(self, ocr_service, ocr_engine, file_path, operation_type):
         super().__init__()
         self.ocr_service = ocr_service
+        self.ocr_engine = ocr_engine
         self.file_path = file_path
         self.operation_type = operation_type
+        self.cancel_event = threading.Event()
+    
+    def cancel(self):
+        """Richiede l'interruzione (le pagine in corso vengono completate e scartate)"""
+        self.cancel_event.set()
     
     def run(self):
         try:
+            # Stesso file già elaborato con le stesse impostazioni: risultato dalla cache
+            key = self.ocr_service.cache_key(
+                self.file_path, self.ocr_engine.language, self.ocr_engine.dpi
+            )
+            cached = self.ocr_service.get_cached(key)
+            if cached is not None:
+                self.finished.emit(*cached)
+                return
+            
             if self.operation_type == 'image_ocr':
-                text = self.ocr_service.extract_text_from_image(self.file_path)
-                data = self.ocr_service.extract_invoice_data(text)
-                self.finished.emit(text, data)
+                text = self.ocr_engine.extract_text(self.file_path, self.cancel_event)
             elif self.operation_type == 'pdf_text':
-                text = self.ocr_service.extract_text_from_pdf(self.file_path)
-                data = self.ocr_service.extract_invoice_data(text)
-                self.finished.emit(text, data)
+                # Testo nativo delle pagine; OCR in parallelo solo per quelle scansionate
+                text = self.ocr_engine.extract_text(
+                    self.file_path, self.cancel_event, on_page=self.on_page
+                )
+            else:
+                return
+            
+            data = self.ocr_service.extract_invoice_data(text)
+            self.ocr_service.store_cached(key, text, data)
+            self.finished.emit(text, data)
+        except OCRCancelledError:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+    
+    def on_page(self, result, completed):
+        """Pagina completata (chiamato nel thread del worker)"""
+        self.progress.emit(completed, result.page_count)
+
+
+class IngestionWorker(QThread):
+    """Worker thread per l'importazione delle fatture da una cartella"""
+    
+    finished = pyqtSignal(object)  # IngestionSummary
+    error = pyqtSignal(str)
+    progress = pyqtSignal(int, int)  # file elaborati, file in coda
+    cancelled = pyqtSignal()
+    
+    def __init__(self, db, ocr_service, ocr_engine, folder):
+        super().__init__()
+        self.db = db
+        self.ocr_service = ocr_service
+        self.ocr_engine = ocr_engine
+        self.folder = folder
+        self.cancel_event = threading.Event()
+    
+    def cancel(self):
+        """Richiede l'interruzione (le fatture già riconosciute vengono salvate)"""
+        self.cancel_event.set()
+    
+    def run(self):
+        from services.invoice_ingestion import InvoiceIngestionService
+        
+        try:
+            service = InvoiceIngestionService(self.db, self.ocr_service, self.ocr_engine)
+            summary = service.ingest_folder(
+                self.folder, cancel_event=self.cancel_event, on_progress=self.progress.emit
+            )
+            self.finished.emit(summary)
+        except OCRCancelledError:
+            self.cancelled.emit()
         except Exception as e:
             self.error.emit(str(e))
+        finally:
+            # Connessione aperta da questo thread
+            self.db.manager.close_thread_connection()
 
 
 class InvoicesTab(QWidget):
@@ -47,15 +115,22 @@ class InvoicesTab(QWidget):
     
     invoice_saved = pyqtSignal()  # Segnale emesso quando si salva una fattura
     
-    def __init__(self, invoices_repo, suppliers_repo):
+    PAGE_SIZE = 200  # Fatture caricate per ogni pagina della tabella
+    
+    def __init__(self, invoices_repo, suppliers_repo, db=None):
         super().__init__()
         
         self.invoices_repo = invoices_repo
         self.suppliers_repo = suppliers_repo
+        self.db = db  # Per l'importazione da cartella (connessione del worker)
         self.ocr_service = OCRService()
+        self.ocr_engine = None  # Pool di processi OCR, creato al primo uso
+        self.ocr_worker = None
+        self.ingestion_worker = None
         
         self.current_invoice = None
         self.current_file_path = None
+        self.next_page_token = None  # Token della prossima pagina di fatture
         
         self.init_ui()
         self.load_invoices()
@@ -241,6 +316,13 @@ class InvoicesTab(QWidget):
         self.btn_load_image.setMinimumSize(140, 40)
         buttons_layout.addWidget(self.btn_load_image)
         
+        self.btn_import_folder = QPushButton('📂 Importa Cartella')
+        self.btn_import_folder.setToolTip('Importa tutte le fatture (PDF e foto) di una cartella')
+        self.btn_import_folder.clicked.connect(self.import_folder)
+        self.btn_import_folder.setMinimumSize(140, 40)
+        self.btn_import_folder.setEnabled(self.db is not None)
+        buttons_layout.addWidget(self.btn_import_folder)
+        
         file_layout.addLayout(buttons_layout)
         
         # Info file caricato
@@ -253,7 +335,15 @@ class InvoicesTab(QWidget):
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
         self.progress_bar.setMinimumHeight(25)
-        file_layout.addWidget(self.progress_bar)
+        
+        self.btn_cancel_ocr = QPushButton('✖ Annulla')
+        self.btn_cancel_ocr.setVisible(False)
+        self.btn_cancel_ocr.clicked.connect(self.cancel_ocr_processing)
+        
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.btn_cancel_ocr)
+        file_layout.addLayout(progress_layout)
         
         file_group.setLayout(file_layout)
         layout.addWidget(file_group)
@@ -410,6 +500,10 @@ class InvoicesTab(QWidget):
         self.invoices_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.invoices_table.setAlternatingRowColors(True)
         self.invoices_table.doubleClicked.connect(self.edit_invoice)
+        scrollbar = self.invoices_table.verticalScrollBar()
+        scrollbar.valueChanged.connect(self.load_more_invoices)
+        # Se le righe non riempiono la tabella non si può scorrere: servono altre pagine
+        scrollbar.rangeChanged.connect(self.fill_invoices_table)
         
         layout.addWidget(QLabel('<b>📋 ELENCO FATTURE</b>'))
         layout.addWidget(self.invoices_table)
@@ -548,20 +642,126 @@ class InvoicesTab(QWidget):
                 f'Errore durante la conversione:\\n{str(e)}'
             )
 
+    def get_ocr_engine(self):
+        """Restituisce il motore OCR parallelo (creato al primo uso)"""
+        if self.ocr_engine is None:
+            self.ocr_engine = OCREngine(
+                self.ocr_service.tesseract_path, capabilities=self.ocr_service.capabilities
+            )
+        return self.ocr_engine
+    
     def start_ocr_processing(self, operation_type):
         """Avvia il processing OCR in background"""
         self.progress_bar.setVisible(True)
         self.progress_bar.setRange(0, 0)  # Indeterminato
+        self.btn_cancel_ocr.setVisible(True)
+        self.btn_cancel_ocr.setEnabled(True)
         
         # Crea worker thread per OCR
-        self.ocr_worker = OCRWorker(self.ocr_service, self.current_file_path, operation_type)
+        self.ocr_worker = OCRWorker(
+            self.ocr_service, self.get_ocr_engine(), self.current_file_path, operation_type
+        )
         self.ocr_worker.finished.connect(self.on_ocr_finished)
         self.ocr_worker.error.connect(self.on_ocr_error)
+        self.ocr_worker.progress.connect(self.on_ocr_progress)
+        self.ocr_worker.cancelled.connect(self.on_ocr_cancelled)
         self.ocr_worker.start()
+    
+    def cancel_ocr_processing(self):
+        """Annulla l'OCR o l'importazione in corso"""
+        for worker in (self.ocr_worker, self.ingestion_worker):
+            if worker is not None and worker.isRunning():
+                worker.cancel()
+        self.btn_cancel_ocr.setEnabled(False)
+    
+    def import_folder(self):
+        """Importa in background tutte le fatture di una cartella"""
+        if self.ingestion_worker is not None and self.ingestion_worker.isRunning():
+            return
+        
+        if not self.ocr_service.is_available():
+            QMessageBox.warning(
+                self,
+                'OCR non disponibile',
+                'Le fatture scansionate richiedono Tesseract OCR; '
+                'verranno importati solo i PDF con testo.'
+            )
+        
+        folder = QFileDialog.getExistingDirectory(self, 'Seleziona Cartella Fatture')
+        if not folder:
+            return
+        
+        self.btn_import_folder.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, 0)  # Indeterminato finché i file non sono accodati
+        self.btn_cancel_ocr.setVisible(True)
+        self.btn_cancel_ocr.setEnabled(True)
+        self.lbl_file_info.setText(f'Importazione cartella: {folder}')
+        
+        self.ingestion_worker = IngestionWorker(
+            self.db, self.ocr_service, self.get_ocr_engine(), folder
+        )
+        self.ingestion_worker.finished.connect(self.on_import_finished)
+        self.ingestion_worker.error.connect(self.on_import_error)
+        self.ingestion_worker.progress.connect(self.on_ocr_progress)
+        self.ingestion_worker.cancelled.connect(self.on_import_cancelled)
+        self.ingestion_worker.start()
+    
+    def on_import_finished(self, summary):
+        """Mostra l'esito dell'importazione da cartella"""
+        self.hide_ocr_progress()
+        self.btn_import_folder.setEnabled(True)
+        self.lbl_file_info.setText('Nessun file caricato')
+        self.load_invoices()
+        self.load_suppliers()
+        
+        message = (
+            f'Fatture importate: {summary.imported}\n'
+            f'File nuovi accodati: {summary.queued}\n'
+            f'Letti dalla cache OCR: {summary.cached}'
+        )
+        if summary.failed:
+            message += f'\nFile non importati: {summary.failed}'
+        QMessageBox.information(self, 'Importazione Completata', message)
+        if summary.imported:
+            self.invoice_saved.emit()
+    
+    def on_import_error(self, error_message):
+        """Gestisce gli errori dell'importazione da cartella"""
+        self.hide_ocr_progress()
+        self.btn_import_folder.setEnabled(True)
+        self.load_invoices()
+        QMessageBox.warning(
+            self,
+            'Errore Importazione',
+            f'Errore durante l\'importazione:\n{error_message}'
+        )
+    
+    def on_import_cancelled(self):
+        """Importazione annullata: le fatture già riconosciute restano salvate"""
+        self.hide_ocr_progress()
+        self.btn_import_folder.setEnabled(True)
+        self.lbl_file_info.setText('Importazione annullata: i file rimanenti restano in coda')
+        self.load_invoices()
+    
+    def on_ocr_progress(self, completed, total):
+        """Aggiorna l'avanzamento dell'OCR delle pagine"""
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(completed)
+    
+    def hide_ocr_progress(self):
+        """Nasconde barra di avanzamento e pulsante annulla"""
+        self.progress_bar.setVisible(False)
+        self.btn_cancel_ocr.setVisible(False)
+    
+    def on_ocr_cancelled(self):
+        """Gestisce l'annullamento dell'OCR"""
+        self.hide_ocr_progress()
+        self.lbl_file_info.setText(self.lbl_file_info.text() + ' (OCR annullato)')
 
     def on_ocr_finished(self, text, extracted_data):
         """Gestisce il completamento dell'OCR"""
-        self.progress_bar.setVisible(False)
+        self.hide_ocr_progress()
         
         # Mostra testo estratto
         self.ocr_text_edit.setPlainText(text)
@@ -580,12 +780,22 @@ class InvoicesTab(QWidget):
 
     def on_ocr_error(self, error_message):
         """Gestisce errori OCR"""
-        self.progress_bar.setVisible(False)
+        self.hide_ocr_progress()
         QMessageBox.warning(
             self,
             'Errore OCR',
             f'Errore durante l\'estrazione testo:\\n{error_message}'
         )
+    
+    def shutdown(self):
+        """Interrompe OCR e importazioni in corso, chiude il pool di processi e la cache OCR"""
+        for worker in (self.ocr_worker, self.ingestion_worker):
+            if worker is not None:
+                worker.cancel()
+                worker.wait()
+        if self.ocr_engine is not None:
+            self.ocr_engine.shutdown()
+        self.ocr_service.close()
 
     def extract_data_from_text(self):
         """Estrae dati strutturati dal testo OCR"""
@@ -733,15 +943,51 @@ class InvoicesTab(QWidget):
         self.btn_extract_data.setEnabled(False)
 
     def load_invoices(self):
-        """Carica tutte le fatture nella tabella"""
-        invoices = self.invoices_repo.get_all(limit=1000)
+        """Carica la prima pagina di fatture nella tabella"""
+        invoices, self.next_page_token = self.invoices_repo.get_page(limit=self.PAGE_SIZE)
         self.populate_invoices_table(invoices)
+        QTimer.singleShot(0, self.fill_invoices_table)  # Dopo il ricalcolo della barra di scorrimento
 
-    def populate_invoices_table(self, invoices):
-        """Popola la tabella con le fatture"""
-        self.invoices_table.setRowCount(len(invoices))
+    def load_more_invoices(self, value):
+        """Carica la pagina successiva quando la tabella arriva in fondo"""
+        scrollbar = self.invoices_table.verticalScrollBar()
+        if value < scrollbar.maximum() or not self.next_page_token:
+            return
+        
+        self.load_next_page()
+    
+    def fill_invoices_table(self, *args):
+        """
+        Carica altre pagine finché la tabella visibile non ha una barra di scorrimento.
+        
+        Senza barra (righe poche o molto basse, finestra grande) valueChanged
+        non viene mai emesso e le pagine successive non sarebbero raggiungibili.
+        """
+        scrollbar = self.invoices_table.verticalScrollBar()
+        if not self.next_page_token or scrollbar.maximum() > 0 or not self.invoices_table.isVisible():
+            return
         
-        for row, invoice in enumerate(invoices):
+        self.load_next_page()
+        QTimer.singleShot(0, self.fill_invoices_table)
+    
+    def load_next_page(self):
+        """Aggiunge in coda alla tabella la pagina successiva di fatture"""
+        invoices, self.next_page_token = self.invoices_repo.get_page(
+            limit=self.PAGE_SIZE, page_token=self.next_page_token
+        )
+        self.populate_invoices_table(invoices, append=True)
+    
+    def showEvent(self, event):
+        """Completa la tabella quando il tab diventa visibile"""
+        super().showEvent(event)
+        QTimer.singleShot(0, self.fill_invoices_table)
+    
+    def populate_invoices_table(self, invoices, append=False):
+        """Popola la tabella con le fatture (append=True aggiunge in coda)"""
+        first_row = self.invoices_table.rowCount() if append else 0
+        self.invoices_table.setRowCount(first_row + len(invoices))
+        
+        for row, invoice in enumerate(invoices, first_row):
             # Data
             date_item = QTableWidgetItem(invoice.get('date', ''))
             self.invoices_table.setItem(row, 0, date_item)
@@ -773,16 +1019,23 @@ class InvoicesTab(QWidget):
             # Memorizza l'ID per azioni
             date_item.setData(Qt.UserRole, invoice['id'])
 
+            # Risultato di ricerca: mostra l'estratto con i termini trovati
+            snippet = invoice.get('snippet')
+            if snippet:
+                for col in range(self.invoices_table.columnCount()):
+                    self.invoices_table.item(row, col).setToolTip(snippet)
+    
     def filter_invoices(self):
         """Filtra le fatture in base al testo di ricerca"""
         search_text = self.search_edit.text().strip()
         
         if search_text:
+            # I risultati di ricerca non sono paginati
             invoices = self.invoices_repo.search(search_text)
+            self.next_page_token = None
+            self.populate_invoices_table(invoices)
         else:
-            invoices = self.invoices_repo.get_all(limit=1000)
-        
-        self.populate_invoices_table(invoices)
+            self.load_invoices()
 
     def edit_invoice(self):
         """Modifica la fattura selezionata"""
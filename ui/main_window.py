@@ -6,19 +6,51 @@ from PyQt5.QtWidgets import (
     QMainWindow, QTabWidget, QWidget, QVBoxLayout,
     QStatusBar, QMessageBox, QAction
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QEvent, QObject, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon
 import qdarkstyle
 from database.schema import Database
 from database.repository import (
     SalesRepository, SuppliersRepository,
-    PurchasesRepository, InvoicesRepository
+    PurchasesRepository, InvoicesRepository, TotalsRepository
 )
-from ui.dashboard_tab import DashboardTab
-from ui.sales_tab import SalesTab
-from ui.suppliers_tab import SuppliersTab
-from ui.reports_tab import ReportsTab
-from ui.invoices_tab import InvoicesTab
+
+
+# Tab della finestra: (attributo, titolo). Vengono creati alla prima apertura
+TABS = [
+    ('dashboard_tab', '🏠 Dashboard'),
+    ('sales_tab', '📊 Vendite Giornaliere'),
+    ('suppliers_tab', '🏭 Fornitori e Spese'),
+    ('reports_tab', '📈 Report e Filtri'),
+    ('invoices_tab', '📄 Fatture'),
+]
+
+# Intervallo di controllo delle modifiche fatte da altri processi (ms),
+# solo mentre la finestra è attiva
+EXTERNAL_CHANGES_INTERVAL = 5000
+
+
+class DataChangeNotifier(QObject):
+    """
+    Inoltra le modifiche del bus dati al thread GUI.
+    
+    Il bus chiama i sottoscrittori nel thread che ha eseguito il commit:
+    il segnale Qt consegna la notifica nel thread del destinatario.
+    """
+    
+    changed = pyqtSignal(object)  # Lista di DataChange
+    
+    def __init__(self, bus, parent=None):
+        super().__init__(parent)
+        self.bus = bus
+        # Ogni accesso a self.changed.emit crea un nuovo oggetto: lo stesso
+        # va passato a subscribe e unsubscribe
+        self._forward = self.changed.emit
+        self.bus.subscribe(self._forward)
+    
+    def close(self):
+        """Smette di ricevere notifiche"""
+        self.bus.unsubscribe(self._forward)
 
 
 class MainWindow(QMainWindow):
@@ -35,6 +67,7 @@ class MainWindow(QMainWindow):
         self.suppliers_repo = SuppliersRepository(self.db.connection)
         self.purchases_repo = PurchasesRepository(self.db.connection)
         self.invoices_repo = InvoicesRepository(self.db.connection)
+        self.totals_repo = TotalsRepository(self.db.connection)
         
         self.init_ui()
     
@@ -120,33 +153,17 @@ class MainWindow(QMainWindow):
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
         
-        # Crea i tab
-        self.dashboard_tab = DashboardTab(self.db.connection)
-        self.sales_tab = SalesTab(
-            self.sales_repo,
-            self.purchases_repo,
-            self.suppliers_repo
-        )
-        self.suppliers_tab = SuppliersTab(
-            self.suppliers_repo,
-            self.purchases_repo
-        )
-        self.reports_tab = ReportsTab(
-            self.sales_repo,
-            self.purchases_repo,
-            self.suppliers_repo
-        )
-        self.invoices_tab = InvoicesTab(
-            self.invoices_repo,
-            self.suppliers_repo
-        )
+        # Segnaposto dei tab: il contenuto viene creato alla prima apertura
+        self.tab_containers = []
+        for attribute, title in TABS:
+            setattr(self, attribute, None)
+            container = QWidget()
+            container_layout = QVBoxLayout(container)
+            container_layout.setContentsMargins(0, 0, 0, 0)
+            self.tab_containers.append(container)
+            self.tabs.addTab(container, title)
         
-        # Aggiungi i tab
-        self.tabs.addTab(self.dashboard_tab, '🏠 Dashboard')
-        self.tabs.addTab(self.sales_tab, '📊 Vendite Giornaliere')
-        self.tabs.addTab(self.suppliers_tab, '🏭 Fornitori e Spese')
-        self.tabs.addTab(self.reports_tab, '📈 Report e Filtri')
-        self.tabs.addTab(self.invoices_tab, '📄 Fatture')
+        self.tabs.currentChanged.connect(self.ensure_tab)
         
         # Crea la barra di stato
         self.statusBar = QStatusBar()
@@ -156,8 +173,9 @@ class MainWindow(QMainWindow):
         # Crea menu
         self.create_menu()
         
-        # Connetti segnali
+        # Connetti segnali e crea il tab iniziale
         self.connect_signals()
+        self.ensure_tab(self.tabs.currentIndex())
     
     def create_menu(self):
         """Crea la barra dei menu"""
@@ -188,6 +206,11 @@ class MainWindow(QMainWindow):
         backup_action.triggered.connect(self.backup_database)
         tools_menu.addAction(backup_action)
         
+        # Azione ricostruzione indice ricerca fatture
+        reindex_action = QAction('🔎 Ricostruisci Indice Ricerca Fatture', self)
+        reindex_action.triggered.connect(self.rebuild_search_index)
+        tools_menu.addAction(reindex_action)
+        
         # Menu Aiuto
         help_menu = menubar.addMenu('&Aiuto')
         
@@ -197,14 +220,72 @@ class MainWindow(QMainWindow):
     
     def connect_signals(self):
         """Connette i segnali tra i vari componenti"""
-        # Quando si aggiunge un fornitore, aggiorna la lista nel tab vendite
-        self.suppliers_tab.supplier_added.connect(self.sales_tab.refresh_suppliers)
+        # Modifiche ai dati: ogni tab aggiorna solo se riguardano ciò che mostra
+        # (compresi nuovi fornitori e acquisti per il tab vendite)
+        self.data_notifier = DataChangeNotifier(self.db.changes, self)
+        
+        # Scritture di altri processi (es. importazione da riga di comando):
+        # avviato e fermato in changeEvent quando la finestra diventa attiva o no
+        self.external_changes_timer = QTimer(self)
+        self.external_changes_timer.setInterval(EXTERNAL_CHANGES_INTERVAL)
+        self.external_changes_timer.timeout.connect(self.db.poll_external_changes)
+    
+    def ensure_tab(self, index):
+        """Crea il contenuto di un tab alla prima apertura"""
+        if index < 0:
+            return
+        
+        attribute, _ = TABS[index]
+        if getattr(self, attribute) is not None:
+            return
         
-        # Quando si salvano vendite, aggiorna i report
-        self.sales_tab.sale_saved.connect(self.reports_tab.refresh_data)
+        tab = self.create_tab(attribute)
+        setattr(self, attribute, tab)
+        self.tab_containers[index].layout().addWidget(tab)
         
-        # Quando si salvano acquisti, aggiorna i report
-        self.suppliers_tab.purchase_saved.connect(self.reports_tab.refresh_data)
+        if hasattr(tab, 'on_data_changed'):
+            self.data_notifier.changed.connect(tab.on_data_changed)
+    
+    def create_tab(self, attribute):
+        """Costruisce un tab (gli import dei moduli avvengono solo qui)"""
+        if attribute == 'dashboard_tab':
+            from ui.dashboard_tab import DashboardTab
+            return DashboardTab(self.db)
+        
+        if attribute == 'sales_tab':
+            from ui.sales_tab import SalesTab
+            return SalesTab(
+                self.sales_repo,
+                self.purchases_repo,
+                self.suppliers_repo,
+                self.totals_repo
+            )
+        
+        if attribute == 'suppliers_tab':
+            from ui.suppliers_tab import SuppliersTab
+            return SuppliersTab(
+                self.suppliers_repo,
+                self.purchases_repo
+            )
+        
+        if attribute == 'reports_tab':
+            from ui.reports_tab import ReportsTab
+            return ReportsTab(
+                self.sales_repo,
+                self.purchases_repo,
+                self.suppliers_repo,
+                self.totals_repo
+            )
+        
+        if attribute == 'invoices_tab':
+            from ui.invoices_tab import InvoicesTab
+            return InvoicesTab(
+                self.invoices_repo,
+                self.suppliers_repo,
+                self.db
+            )
+        
+        raise ValueError(f"Tab sconosciuto: {attribute}")
     
     def import_csv(self):
         """Apre il dialogo di importazione CSV"""
@@ -214,20 +295,22 @@ class MainWindow(QMainWindow):
             self,
             self.sales_repo,
             self.suppliers_repo,
-            self.purchases_repo
+            self.purchases_repo,
+            self.db
         )
         
         if dialog.exec_():
             self.statusBar.showMessage('Importazione completata con successo', 3000)
-            # Aggiorna tutti i tab
-            self.sales_tab.load_today_sale()
-            self.suppliers_tab.refresh_purchases()
-            self.reports_tab.refresh_data()
+            # Dashboard e report si aggiornano dalle notifiche di modifica;
+            # i tab non ancora aperti leggeranno i dati alla creazione
+            if self.sales_tab is not None:
+                self.sales_tab.load_today_sale()
+            if self.suppliers_tab is not None:
+                self.suppliers_tab.refresh_purchases()
     
     def backup_database(self):
         """Crea un backup del database"""
         from PyQt5.QtWidgets import QFileDialog
-        import shutil
         from datetime import datetime
         
         # Suggerisci nome file con data
@@ -242,7 +325,8 @@ class MainWindow(QMainWindow):
         
         if file_path:
             try:
-                shutil.copy2(self.db.db_path, file_path)
+                # Backup online: include le scritture ancora nel file WAL
+                self.db.backup(file_path)
                 QMessageBox.information(
                     self,
                     'Backup Completato',
@@ -256,6 +340,18 @@ class MainWindow(QMainWindow):
                     f'Errore durante il backup:\n{str(e)}'
                 )
     
+    def rebuild_search_index(self):
+        """Ricostruisce l'indice full-text delle fatture"""
+        try:
+            self.invoices_repo.rebuild_search_index()
+            self.statusBar.showMessage('Indice ricerca fatture ricostruito', 3000)
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                'Errore Indice',
+                f'Errore durante la ricostruzione dell\'indice:\n{str(e)}'
+            )
+    
     def show_about(self):
         """Mostra la finestra informazioni"""
         QMessageBox.about(
@@ -275,6 +371,17 @@ class MainWindow(QMainWindow):
             '<p>Sviluppato con Python e PyQt5</p>'
         )
     
+    def changeEvent(self, event):
+        """Controlla le scritture esterne solo mentre la finestra è attiva"""
+        if event.type() == QEvent.ActivationChange:
+            if self.isActiveWindow():
+                # Riprendendo il focus si vedono subito le modifiche fatte nel frattempo
+                self.db.poll_external_changes()
+                self.external_changes_timer.start()
+            else:
+                self.external_changes_timer.stop()
+        super().changeEvent(event)
+    
     def closeEvent(self, event):
         """Gestisce la chiusura dell'applicazione"""
         reply = QMessageBox.question(
@@ -286,7 +393,13 @@ class MainWindow(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            # Chiudi connessione database
+            # Chiudi connessione database (dopo i worker in background)
+            self.external_changes_timer.stop()
+            self.data_notifier.close()
+            if self.dashboard_tab is not None:
+                self.dashboard_tab.shutdown()
+            if self.invoices_tab is not None:
+                self.invoices_tab.shutdown()
             self.db.close()
             event.accept()
         else:
@@ -11,17 +11,20 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QFont
 from datetime import datetime, timedelta
+from models.money import from_cents, to_cents
+from models.sale import SalesFrame
 
 
 class ReportsTab(QWidget):
     """Tab per report e analisi dati"""
     
-    def __init__(self, sales_repo, purchases_repo, suppliers_repo):
+    def __init__(self, sales_repo, purchases_repo, suppliers_repo, totals_repo):
         super().__init__()
         
         self.sales_repo = sales_repo
         self.purchases_repo = purchases_repo
         self.suppliers_repo = suppliers_repo
+        self.totals_repo = totals_repo
         
         self.init_ui()
         self.refresh_data()
@@ -338,58 +341,38 @@ class ReportsTab(QWidget):
     
     def load_filtered_data(self, start_date, end_date):
         """Carica i dati per il periodo specificato"""
-        # Carica vendite
-        sales = self.sales_repo.get_by_date_range(start_date, end_date)
+        # Carica vendite (in colonne, senza un dizionario per riga)
+        sales = SalesFrame.from_rows(self.sales_repo.iter_by_date_range(start_date, end_date))
         
-        # Carica spese
-        purchases = self.purchases_repo.get_by_date_range(start_date, end_date)
+        # Totali precalcolati (giornalieri, mensili e per fornitore)
+        summary = self.totals_repo.get_period_summary(start_date, end_date)
+        daily_totals = self.totals_repo.get_daily_totals(start_date, end_date)
+        supplier_totals = self.totals_repo.get_supplier_totals(start_date, end_date)
         
         # Aggiorna riepilogo
-        self.update_summary(sales, purchases)
+        self.update_summary(summary)
         
         # Aggiorna tabelle
-        self.update_sales_table(sales, purchases)
-        self.update_expenses_table(purchases)
+        self.update_sales_table(sales, daily_totals)
+        self.update_expenses_table(supplier_totals)
     
-    def update_summary(self, sales, purchases):
-        """Aggiorna il riepilogo generale"""
-        from services.calculator import SalesCalculator
-        
-        # Calcola totali vendite
-        total_sales = 0
-        total_cash_sales = 0
-        total_bank_sales = 0
+    def update_summary(self, summary):
+        """Aggiorna il riepilogo generale dai totali del periodo"""
+        # Totali vendite
+        total_sales = summary['takings']
+        total_cash_sales = summary['cash_total']
+        total_bank_sales = summary['bank_total']
         
-        for sale_data in sales:
-            from models.sale import Sale
-            sale = Sale.from_dict(sale_data)
-            
-            cash_total = SalesCalculator.calculate_cash_total(sale)
-            bank_total = SalesCalculator.calculate_bank_total(sale)
-            takings = cash_total + bank_total
-            
-            total_sales += takings
-            total_cash_sales += cash_total
-            total_bank_sales += bank_total
-        
-        # Calcola totali spese
-        total_expenses = 0
-        total_cash_expenses = 0
-        total_bank_expenses = 0
-        
-        for purchase in purchases:
-            cash = purchase.get('cash_payment', 0)
-            bank = purchase.get('bank_payment', 0)
-            
-            total_expenses += cash + bank
-            total_cash_expenses += cash
-            total_bank_expenses += bank
+        # Totali spese
+        total_expenses = summary['purchases_total']
+        total_cash_expenses = summary['purchases_cash']
+        total_bank_expenses = summary['purchases_bank']
         
-        # Calcola profitto netto
-        net_profit = total_sales - total_expenses
+        # Profitto netto
+        net_profit = summary['profit']
         
         # Statistiche
-        days_count = len(sales)
+        days_count = summary['sales_count']
         avg_daily = total_sales / days_count if days_count > 0 else 0
         
         # Aggiorna label
@@ -412,76 +395,52 @@ class ReportsTab(QWidget):
         else:
             self.lbl_net_profit.setStyleSheet('background-color: #FFB6C1; padding: 10px; font-size: 14pt; font-weight: bold;')
     
-    def update_sales_table(self, sales, purchases):
-        """Aggiorna la tabella delle vendite"""
+    def update_sales_table(self, sales, daily_totals):
+        """Aggiorna la tabella delle vendite (sales è un SalesFrame)"""
         from services.calculator import SalesCalculator
-        from models.sale import Sale
+        
+        # Spese per giorno dai totali precalcolati
+        expenses_by_date = {day['date']: day['purchases_total'] for day in daily_totals}
+        
+        # Spese del giorno in centesimi, allineate alle vendite
+        day_expenses_column = [to_cents(expenses_by_date.get(date, 0)) for date in sales.dates]
+        
+        # Calcola tutti i valori in un solo passaggio
+        results = SalesCalculator.calculate_batch(sales, day_expenses_column)
         
         self.sales_table.setRowCount(len(sales))
         
-        for row, sale_data in enumerate(sales):
-            sale = Sale.from_dict(sale_data)
-            
-            # Calcola valori
-            cash_total = SalesCalculator.calculate_cash_total(sale)
-            bank_total = SalesCalculator.calculate_bank_total(sale)
-            
-            card_fees = SalesCalculator.calculate_card_fees(
-                sale.card_gross, sale.card_percent_fee, sale.card_fixed_fee
-            )
-            satispay_fees = SalesCalculator.calculate_card_fees(
-                sale.satispay_gross, sale.satispay_percent_fee, sale.satispay_fixed_fee
-            )
-            total_fees = card_fees + satispay_fees
-            
-            takings = cash_total + bank_total
-            
-            # Spese del giorno
-            day_purchases = [p for p in purchases if p['date'] == sale.date]
-            day_expenses = sum(p.get('cash_payment', 0) + p.get('bank_payment', 0) for p in day_purchases)
-            
-            net_profit = takings - day_expenses
+        for row, date in enumerate(sales.dates):
+            cash_total = from_cents(results['cash_total'][row])
+            bank_total = from_cents(results['bank_total'][row])
+            total_fees = from_cents(results['card_fees'][row] + results['satispay_fees'][row])
+            takings = from_cents(results['takings'][row])
+            day_expenses = from_cents(results['supplier_payments'][row])
+            net_profit = from_cents(results['daily_profit'][row])
             
             # Popola riga
-            self.sales_table.setItem(row, 0, QTableWidgetItem(sale.date))
+            self.sales_table.setItem(row, 0, QTableWidgetItem(date))
             self.sales_table.setItem(row, 1, QTableWidgetItem(self.format_currency(cash_total)))
             self.sales_table.setItem(row, 2, QTableWidgetItem(self.format_currency(bank_total)))
             self.sales_table.setItem(row, 3, QTableWidgetItem(self.format_currency(total_fees)))
             self.sales_table.setItem(row, 4, QTableWidgetItem(self.format_currency(takings)))
             self.sales_table.setItem(row, 5, QTableWidgetItem(self.format_currency(day_expenses)))
             self.sales_table.setItem(row, 6, QTableWidgetItem(self.format_currency(net_profit)))
-            self.sales_table.setItem(row, 7, QTableWidgetItem(sale.notes))
+            self.sales_table.setItem(row, 7, QTableWidgetItem(sales.notes[row]))
             
             # Allinea numeri a destra
             for col in range(1, 7):
                 self.sales_table.item(row, col).setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
     
-    def update_expenses_table(self, purchases):
-        """Aggiorna la tabella spese per fornitore"""
-        # Raggruppa per fornitore
-        supplier_totals = {}
-        
-        for purchase in purchases:
-            supplier_name = purchase.get('supplier_name', 'Sconosciuto')
-            cash = purchase.get('cash_payment', 0)
-            bank = purchase.get('bank_payment', 0)
-            
-            if supplier_name not in supplier_totals:
-                supplier_totals[supplier_name] = {'cash': 0, 'bank': 0}
-            
-            supplier_totals[supplier_name]['cash'] += cash
-            supplier_totals[supplier_name]['bank'] += bank
-        
-        # Popola tabella
+    def update_expenses_table(self, supplier_totals):
+        """Aggiorna la tabella spese per fornitore (già raggruppate per fornitore)"""
         self.expenses_table.setRowCount(len(supplier_totals))
         
-        for row, (supplier, totals) in enumerate(supplier_totals.items()):
-            total = totals['cash'] + totals['bank']
-            
-            self.expenses_table.setItem(row, 0, QTableWidgetItem(supplier))
-            self.expenses_table.setItem(row, 1, QTableWidgetItem(self.format_currency(totals['cash'])))
-            self.expenses_table.setItem(row, 2, QTableWidgetItem(self.format_currency(totals['bank'])))
-            self.expenses_table.setItem(row, 3, QTableWidgetItem(self.format_currency(total)))
+        for row, totals in enumerate(supplier_totals):
+            self.expenses_table.setItem(row, 0, QTableWidgetItem(totals['supplier_name']))
+            self.expenses_table.setItem(row, 1, QTableWidgetItem(self.format_currency(totals['cash_total'])))
+            self.expenses_table.setItem(row, 2, QTableWidgetItem(self.format_currency(totals['bank_total'])))
+            self.expenses_table.setItem(row, 3, QTableWidgetItem(self.format_currency(totals['total'])))
             
             # Allinea numeri a destra
             for col in range(1, 4):
@@ -494,3 +453,12 @@ class ReportsTab(QWidget):
     def refresh_data(self):
         """Aggiorna tutti i dati (chiamato dall'esterno)"""
         self.apply_filter()
+
+    def on_data_changed(self, changes):
+        """Riapplica il filtro solo se le modifiche cadono nel periodo selezionato"""
+        start_date = self.start_date_edit.date().toString('yyyy-MM-dd')
+        end_date = self.end_date_edit.date().toString('yyyy-MM-dd')
+        
+        if any(change.affects(('sales', 'purchases', 'suppliers'), start_date, end_date)
+               for change in changes):
+            self.apply_filter()
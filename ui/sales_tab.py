@@ -19,16 +19,21 @@ class SalesTab(QWidget):
     
     sale_saved = pyqtSignal()  # Segnale emesso quando si salva una vendita
     
-    def __init__(self, sales_repo, purchases_repo, suppliers_repo):
+    def __init__(self, sales_repo, purchases_repo, suppliers_repo, totals_repo):
         super().__init__()
         
         self.sales_repo = sales_repo
         self.purchases_repo = purchases_repo
         self.suppliers_repo = suppliers_repo
+        self.totals_repo = totals_repo
         self.calculator = SalesCalculator()
         
         self.current_sale = None
         
+        # Pagamenti fornitori della data selezionata (evita query ad ogni tasto)
+        self._supplier_payments_date = None
+        self._supplier_payments = (0.0, 0.0)
+        
         self.init_ui()
         self.load_today_sale()
     
@@ -448,6 +453,7 @@ class SalesTab(QWidget):
     
     def load_sale_by_date(self, date_str):
         """Carica una vendita per data"""
+        self._supplier_payments_date = None
         sale_data = self.sales_repo.get_by_date(date_str)
         
         if sale_data:
@@ -511,10 +517,7 @@ class SalesTab(QWidget):
             
             # Ottieni pagamenti fornitori per la data selezionata
             date_str = self.date_edit.date().toString('yyyy-MM-dd')
-            purchases = self.purchases_repo.get_by_date(date_str)
-            
-            supplier_cash = sum(p.get('cash_payment', 0) for p in purchases)
-            supplier_bank = sum(p.get('bank_payment', 0) for p in purchases)
+            supplier_cash, supplier_bank = self.get_supplier_payments(date_str)
             supplier_total = supplier_cash + supplier_bank
             
             # Calcola tutti i valori
@@ -535,6 +538,17 @@ class SalesTab(QWidget):
             # Se ci sono errori di conversione, ignora
             pass
     
+    def get_supplier_payments(self, date_str):
+        """Restituisce (contanti, bancari) pagati ai fornitori nel giorno, dai totali giornalieri"""
+        if self._supplier_payments_date != date_str:
+            day = self.totals_repo.get_day(date_str)
+            if day:
+                self._supplier_payments = (day['purchases_cash'], day['purchases_bank'])
+            else:
+                self._supplier_payments = (0.0, 0.0)
+            self._supplier_payments_date = date_str
+        return self._supplier_payments
+    
     def save_sale(self):
         """Salva la vendita nel database"""
         try:
@@ -583,6 +597,18 @@ class SalesTab(QWidget):
                 QMessageBox.critical(self, 'Errore', f'Errore durante l\'eliminazione:\n{str(e)}')
     
     def refresh_suppliers(self):
-        """Aggiorna la lista fornitori (chiamato quando si aggiunge un fornitore)"""
+        """Aggiorna la lista fornitori (chiamato quando si aggiunge un fornitore o un acquisto)"""
         # Ricalcola i totali per aggiornare i pagamenti fornitori
+        self._supplier_payments_date = None
         self.calculate_totals()
+
+    def on_data_changed(self, changes):
+        """
+        Aggiorna i pagamenti fornitori se sono cambiati gli acquisti del giorno mostrato.
+        
+        Il modulo della vendita non viene ricaricato, per non perdere
+        eventuali modifiche non ancora salvate.
+        """
+        date_str = self.date_edit.date().toString('yyyy-MM-dd')
+        if any(change.affects(('purchases', 'suppliers'), date_str, date_str) for change in changes):
+            self.refresh_suppliers()
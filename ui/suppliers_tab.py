@@ -11,8 +11,8 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, QDate, pyqtSignal
 from PyQt5.QtGui import QDoubleValidator, QFont
 from datetime import datetime
-from models.supplier import Supplier
-from models.purchase import Purchase
+from models.supplier import Supplier, SupplierRecord
+from models.purchase import Purchase, PurchaseRecord
 
 
 class SuppliersTab(QWidget):
@@ -353,17 +353,17 @@ class SuppliersTab(QWidget):
     
     def load_suppliers(self):
         """Carica la lista dei fornitori"""
-        suppliers = self.suppliers_repo.get_all_active()
+        suppliers = [SupplierRecord.from_dict(row) for row in self.suppliers_repo.get_all_active()]
         
         # Aggiorna combo principale
         self.suppliers_combo.clear()
         for supplier in suppliers:
-            self.suppliers_combo.addItem(supplier['name'], supplier['id'])
+            self.suppliers_combo.addItem(supplier.name, supplier.id)
         
         # Aggiorna combo spese
         self.expense_supplier_combo.clear()
         for supplier in suppliers:
-            self.expense_supplier_combo.addItem(supplier['name'], supplier['id'])
+            self.expense_supplier_combo.addItem(supplier.name, supplier.id)
     
     def add_supplier(self):
         """Aggiunge un nuovo fornitore"""
@@ -454,14 +454,18 @@ class SuppliersTab(QWidget):
     
     def load_purchases(self):
         """Carica tutte le spese nella tabella"""
-        purchases = self.purchases_repo.get_by_date_range('2020-01-01', '2030-12-31')
+        # Righe lette a blocchi, un oggetto compatto per spesa
+        purchases = [
+            PurchaseRecord.from_row(row)
+            for row in self.purchases_repo.iter_by_date_range('2020-01-01', '2030-12-31')
+        ]
         self.populate_purchases_table(purchases)
         self.update_summary(purchases)
     
     def filter_purchases(self):
         """Filtra le spese per data"""
         date_str = self.filter_date_edit.date().toString('yyyy-MM-dd')
-        purchases = self.purchases_repo.get_by_date(date_str)
+        purchases = [PurchaseRecord.from_dict(row) for row in self.purchases_repo.get_by_date(date_str)]
         self.populate_purchases_table(purchases)
         self.update_summary(purchases)
     
@@ -475,46 +479,45 @@ class SuppliersTab(QWidget):
         self.filter_purchases()
     
     def populate_purchases_table(self, purchases):
-        """Popola la tabella con le spese"""
+        """Popola la tabella con le spese (PurchaseRecord)"""
         self.purchases_table.setRowCount(len(purchases))
         
         for row, purchase in enumerate(purchases):
             # Data
-            date_item = QTableWidgetItem(purchase['date'])
+            date_item = QTableWidgetItem(purchase.date)
             self.purchases_table.setItem(row, 0, date_item)
             
             # Fornitore
-            supplier_item = QTableWidgetItem(purchase.get('supplier_name', ''))
+            supplier_item = QTableWidgetItem(purchase.supplier_name or '')
             self.purchases_table.setItem(row, 1, supplier_item)
             
             # Descrizione
-            desc_item = QTableWidgetItem(purchase.get('description', ''))
+            desc_item = QTableWidgetItem(purchase.description or '')
             self.purchases_table.setItem(row, 2, desc_item)
             
             # Contante
-            cash_item = QTableWidgetItem(f"€ {purchase.get('cash_payment', 0):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
+            cash_item = QTableWidgetItem(f"€ {purchase.cash_payment:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
             cash_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
             self.purchases_table.setItem(row, 3, cash_item)
             
             # Bancario
-            bank_item = QTableWidgetItem(f"€ {purchase.get('bank_payment', 0):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
+            bank_item = QTableWidgetItem(f"€ {purchase.bank_payment:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
             bank_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
             self.purchases_table.setItem(row, 4, bank_item)
             
             # Totale
-            total = purchase.get('cash_payment', 0) + purchase.get('bank_payment', 0)
-            total_item = QTableWidgetItem(f"€ {total:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
+            total_item = QTableWidgetItem(f"€ {purchase.total:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
             total_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
             total_item.setBackground(Qt.lightGray)
             self.purchases_table.setItem(row, 5, total_item)
             
             # Memorizza l'ID per modifiche/eliminazioni
-            date_item.setData(Qt.UserRole, purchase['id'])
+            date_item.setData(Qt.UserRole, purchase.id)
     
     def update_summary(self, purchases):
         """Aggiorna i riepiloghi"""
-        total_cash = sum(p.get('cash_payment', 0) for p in purchases)
-        total_bank = sum(p.get('bank_payment', 0) for p in purchases)
+        total_cash = sum(p.cash_payment for p in purchases)
+        total_bank = sum(p.bank_payment for p in purchases)
         grand_total = total_cash + total_bank
         
         self.lbl_total_cash.setText(f"€ {total_cash:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))